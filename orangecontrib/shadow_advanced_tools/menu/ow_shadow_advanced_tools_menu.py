@@ -45,10 +45,11 @@
 # POSSIBILITY OF SUCH DAMAGE.                                             #
 # #########################################################################
 
-from PyQt5 import QtWidgets
+from PyQt5 import QtWidgets, QtCore
 from oasys.menus.menu import OMenu
 
 from orangecontrib.shadow_advanced_tools.widgets.thermal.ow_power_plot_xy import PowerPlotXY
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_density_merge_bl import merge_power_density_files
 
 class ShadowAdvancedToolsMenu(OMenu):
     def __init__(self):
@@ -64,6 +65,8 @@ class ShadowAdvancedToolsMenu(OMenu):
         self.addSeparator()
         self.addSubMenu("Clear all the cumulated plots in Power Plot XY widgets")
         self.addSubMenu("Reload all the cumulated plots in Power Plot XY widgets (from work. dir.)")
+        self.addSeparator()
+        self.addSubMenu("Merge power density files (sum or average)")
         self.closeContainer()
 
     def executeAction_1(self, action):
@@ -134,3 +137,29 @@ class ShadowAdvancedToolsMenu(OMenu):
             QtWidgets.QMessageBox.critical(None, "Error",
                 exception.args[0],
                 QtWidgets.QMessageBox.Ok)
+
+    def executeAction_7(self, action):
+        try:
+            file_names, _ = QtWidgets.QFileDialog.getOpenFileNames(None, "Select Power Density Files", "", "Power Density Files (*.hdf5 *.h5 *.hdf *.json)")
+
+            if len(file_names) > 0:
+                output_file_name, _ = QtWidgets.QFileDialog.getSaveFileName(None, "Save Merged File", "", "HDF5 Files (*.hdf5 *.h5 *.hdf)")
+
+                if output_file_name:
+                    average = QtWidgets.QMessageBox.question(None, "Merge", "Average the plots (No: sum)?",
+                                                             QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No,
+                                                             QtWidgets.QMessageBox.No) == QtWidgets.QMessageBox.Yes
+
+                    QtWidgets.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+                    try:
+                        merge_power_density_files(file_names, output_file_name, average=average)
+                    finally:
+                        QtWidgets.QApplication.restoreOverrideCursor()
+
+                    QtWidgets.QMessageBox.information(None, "Merge",
+                        str(len(file_names)) + " files merged into:\n" + output_file_name,
+                        QtWidgets.QMessageBox.Ok)
+        except Exception as exception:
+            QtWidgets.QMessageBox.critical(None, "Error",
+                str(exception),
+                QtWidgets.QMessageBox.Ok)
@@ -45,7 +45,7 @@
 # POSSIBILITY OF SUCH DAMAGE.                                             #
 # #########################################################################
 
-import copy, numpy
+import numpy
 
 from PyQt5.QtWidgets import QWidget, QVBoxLayout
 
@@ -54,13 +54,16 @@ try:
 except:
     pass
 
-from Shadow import Beam
 
 from silx.gui.plot import Plot2D
 import scipy.constants as codata
 from orangecontrib.shadow.util.shadow_util import ShadowPhysics
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_density_bl import histo2, get_ray_selection, get_ray_intensity, \
+    RedistributionKernel, get_redistribution_kernel
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_attribution_bl import PowerAttribution, get_ray_power
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_calculation_bl import PowerDensityCalculator
 
-class PowerPlotXYWidget(QWidget):
+class PowerPlotXYWidget(QWidget, PowerDensityCalculator):
     
     def __init__(self, parent=None):
         pass
@@ -70,32 +73,16 @@ class PowerPlotXYWidget(QWidget):
         self.plot_canvas = None
         self.cumulated_power_plot = 0.0
         self.cumulated_previous_power_plot = 0.0
+        self.power_density_accumulator = None
 
         self.setLayout(QVBoxLayout())
 
     def manage_empty_beam(self, ticket_to_add, nbins_h, nbins_v, xrange, yrange, var_x, var_y, cumulated_total_power, energy_min, energy_max, energy_step, show_image, to_mm, cumulated_quantity=0):
-        if not ticket_to_add is None:
-            ticket      = copy.deepcopy(ticket_to_add)
-            last_ticket = copy.deepcopy(ticket_to_add)
-        else:
-            ticket = {}
-            ticket["histogram"] = numpy.zeros((nbins_h, nbins_v))
-            ticket['intensity'] = numpy.zeros((nbins_h, nbins_v))
-            ticket['nrays']     = 0
-            ticket['good_rays'] = 0
-
-            if not xrange is None and not yrange is None:
-                ticket['bin_h_center'] = numpy.arange(xrange[0], xrange[1], nbins_h)*to_mm
-                ticket['bin_v_center'] = numpy.arange(yrange[0], yrange[1], nbins_v)*to_mm
-            else:
-                raise ValueError("Beam is empty and no range has been specified: Calculation is impossible")
+        ticket, last_ticket = self.get_empty_power_density(ticket_to_add, nbins_h, nbins_v, xrange, yrange, to_mm)
 
         self.plot_power_density_ticket(ticket, var_x, var_y, cumulated_total_power, energy_min, energy_max, energy_step, show_image, cumulated_quantity)
 
-        if not ticket_to_add is None:
-            return ticket, last_ticket
-        else:
-            return ticket, None
+        return ticket, last_ticket
 
     def plot_power_density_BM(self, shadow_beam, initial_energy, initial_flux, nbins_interpolation,
                               var_x, var_y, nbins_h=100, nbins_v=100, xrange=None, yrange=None, nolost=1, to_mm=1.0, show_image=True, cumulated_quantity=0):
@@ -117,15 +104,14 @@ class PowerPlotXYWidget(QWidget):
                                                to_mm)
             return ticket
 
-        source_beam  = shadow_beam.getOEHistory(oe_number=1)._input_beam.duplicate(history=False)
+        source_beam  = shadow_beam.getOEHistory(oe_number=1)._input_beam
         history_item = shadow_beam.getOEHistory(oe_number=shadow_beam._oe_number)
+        has_history  = not (history_item is None or history_item._input_beam is None)
 
-        if history_item is None or history_item._input_beam is None:
-            previous_beam = shadow_beam
-        else:
-            previous_beam = history_item._input_beam.duplicate(history=False)
+        previous_beam = history_item._input_beam if has_history else shadow_beam
+        rays          = shadow_beam._beam.rays
 
-        rays_energy = ShadowPhysics.getEnergyFromShadowK(shadow_beam._beam.rays[:, 10])
+        rays_energy = ShadowPhysics.getEnergyFromShadowK(rays[:, 10])
         energy_range = [numpy.min(rays_energy), numpy.max(rays_energy)]
 
         ticket_initial = source_beam._beam.histo1(11, xrange=energy_range, nbins=nbins_interpolation, nolost=1, ref=23)
@@ -143,58 +129,12 @@ class PowerPlotXYWidget(QWidget):
 
         print("Total Initial Power from Shadow", total_initial_power_shadow)
 
-        if nolost>1: # must be calculating only the rays the become lost in the last object
-            current_beam = shadow_beam
-
-            if history_item is None or history_item._input_beam is None:
-                beam = shadow_beam._beam
-            else:
-                if nolost==2:
-                    current_lost_rays_cursor = numpy.where(current_beam._beam.rays[:, 9] != 1)
-
-                    current_lost_rays          = current_beam._beam.rays[current_lost_rays_cursor]
-                    lost_rays_in_previous_beam = previous_beam._beam.rays[current_lost_rays_cursor]
-
-                    lost_that_were_good_rays_cursor = numpy.where(lost_rays_in_previous_beam[:, 9] == 1)
-
-                    beam = Beam()
-                    beam.rays = current_lost_rays[lost_that_were_good_rays_cursor] # lost rays that were good after the previous OE
-
-                    # in case of filters, Shadow computes the absorption for lost rays. This cause an imbalance on the total power.
-                    # the lost rays that were good must have the same intensity they had before the optical element.
-
-                    beam.rays[:, 6]  = lost_rays_in_previous_beam[lost_that_were_good_rays_cursor][:, 6]
-                    beam.rays[:, 7]  = lost_rays_in_previous_beam[lost_that_were_good_rays_cursor][:, 7]
-                    beam.rays[:, 8]  = lost_rays_in_previous_beam[lost_that_were_good_rays_cursor][:, 8]
-                    beam.rays[:, 15] = lost_rays_in_previous_beam[lost_that_were_good_rays_cursor][:, 15]
-                    beam.rays[:, 16] = lost_rays_in_previous_beam[lost_that_were_good_rays_cursor][:, 16]
-                    beam.rays[:, 17] = lost_rays_in_previous_beam[lost_that_were_good_rays_cursor][:, 17]
-                    beam.rays[:, 9]  = 1
-                else:
-                    incident_rays = previous_beam._beam.rays
-                    transmitted_rays = current_beam._beam.rays
-
-                    incident_intensity = incident_rays[:, 6]**2  + incident_rays[:, 7]**2  + incident_rays[:, 8]**2 +\
-                                         incident_rays[:, 15]**2 + incident_rays[:, 16]**2 + incident_rays[:, 17]**2
-                    transmitted_intensity = transmitted_rays[:, 6]**2  + transmitted_rays[:, 7]**2  + transmitted_rays[:, 8]**2 +\
-                                            transmitted_rays[:, 15]**2 + transmitted_rays[:, 16]**2 + transmitted_rays[:, 17]**2
-
-                    electric_field = numpy.sqrt(incident_intensity - transmitted_intensity)
-                    electric_field[numpy.where(electric_field == numpy.nan)] = 0.0
-
-                    beam = Beam()
-                    beam.rays = copy.deepcopy(shadow_beam._beam.rays)
-
-                    beam.rays[:, 6]  = electric_field
-                    beam.rays[:, 7]  = 0.0
-                    beam.rays[:, 8]  = 0.0
-                    beam.rays[:, 15] = 0.0
-                    beam.rays[:, 16] = 0.0
-                    beam.rays[:, 17] = 0.0
+        if nolost>1 and has_history: # must be calculating only the rays the become lost in the last object
+            selection, intensity = get_ray_power(previous_beam._beam.rays, rays, PowerAttribution.from_nolost(nolost))
         else:
-            beam = shadow_beam._beam
+            selection, intensity = get_ray_selection(rays, nolost=1), get_ray_intensity(rays)
 
-        if len(beam.rays) == 0:
+        if nolost == 2 and has_history and not numpy.any(selection):
             ticket, _ = self.manage_empty_beam(None,
                                                nbins_h,
                                                nbins_v,
@@ -210,8 +150,10 @@ class PowerPlotXYWidget(QWidget):
                                                to_mm)
             return ticket
 
+        selected_rays_energy = ShadowPhysics.getEnergyFromShadowK(rays[selection, 10])
+
         ticket_incident = previous_beam._beam.histo1(11, xrange=energy_range, nbins=nbins_interpolation, nolost=1, ref=23) # intensity of good rays per bin incident
-        ticket_final    = beam.histo1(11, xrange=energy_range, nbins=nbins_interpolation, nolost=1, ref=23) # intensity of good rays per bin
+        ticket_final    = {"histogram" : numpy.histogram(selected_rays_energy, bins=nbins_interpolation, range=energy_range, weights=intensity[selection])[0]} # intensity of selected rays per bin
 
         good = numpy.where(ticket_initial["histogram"] > 0)
 
@@ -233,37 +175,24 @@ class PowerPlotXYWidget(QWidget):
 
         # CALCULATE POWER DENSITY PER EACH RAY -------------------------------------------------------
 
-        ticket = beam.histo1(11, xrange=energy_range, nbins=nbins_interpolation, nolost=1, ref=0) # number of rays per bin
-        good = numpy.where(ticket["histogram"] > 0)
+        rays_per_bin = numpy.histogram(selected_rays_energy, bins=nbins_interpolation, range=energy_range)[0] # number of rays per bin
+        good = numpy.where(rays_per_bin > 0)
 
         final_power_per_ray       = numpy.zeros(len(final_power_shadow))
-        final_power_per_ray[good] = final_power_shadow[good] / ticket["histogram"][good]
-
-        go = numpy.where(beam.rays[:, 9] == 1)
-
-        rays_energy = ShadowPhysics.getEnergyFromShadowK(beam.rays[go, 10])
+        final_power_per_ray[good] = final_power_shadow[good] / rays_per_bin[good]
 
-        ticket = beam.histo2(var_x, var_y, nbins_h=nbins_h, nbins_v=nbins_v, xrange=xrange, yrange=yrange, nolost=1, ref=0)
+        ticket = histo2(rays, var_x, var_y, nbins_h=nbins_h, nbins_v=nbins_v, xrange=xrange, yrange=yrange, selection=selection, intensity=intensity, ref=0)
 
         ticket['bin_h_center'] *= to_mm
         ticket['bin_v_center'] *= to_mm
         pixel_area = (ticket['bin_h_center'][1] - ticket['bin_h_center'][0]) * (ticket['bin_v_center'][1] - ticket['bin_v_center'][0])
 
-        power_density = numpy.interp(rays_energy, energy_bins, final_power_per_ray, left=0, right=0) / pixel_area
+        ray_power_density = numpy.zeros(len(rays))
+        ray_power_density[selection] = numpy.interp(selected_rays_energy, energy_bins, final_power_per_ray, left=0, right=0) / pixel_area
 
-        final_beam = Beam()
-        final_beam.rays = copy.deepcopy(beam.rays)
-
-        final_beam.rays[go, 6] = numpy.sqrt(power_density)
-        final_beam.rays[go, 7] = 0.0
-        final_beam.rays[go, 8] = 0.0
-        final_beam.rays[go, 15] = 0.0
-        final_beam.rays[go, 16] = 0.0
-        final_beam.rays[go, 17] = 0.0
-
-        ticket = final_beam.histo2(var_x, var_y,
-                                   nbins_h=nbins_h, nbins_v=nbins_v, xrange=xrange, yrange=yrange,
-                                   nolost=1, ref=23)
+        ticket = histo2(rays, var_x, var_y,
+                        nbins_h=nbins_h, nbins_v=nbins_v, xrange=xrange, yrange=yrange,
+                        selection=selection, intensity=ray_power_density, ref=23)
 
         ticket['histogram'][numpy.where(ticket['histogram'] < 1e-15)] = 0.0
 
@@ -288,160 +217,14 @@ class PowerPlotXYWidget(QWidget):
                            sigma_y=1.0,
                            gamma=1.0,
                            cumulated_quantity=0):
-
-        n_rays = len(shadow_beam._beam.rays[:, 0]) # lost and good!
-
-        if n_rays == 0:
-            return self.manage_empty_beam(ticket_to_add,
-                                          nbins_h,
-                                          nbins_v,
-                                          xrange,
-                                          yrange,
-                                          var_x,
-                                          var_y,
-                                          cumulated_total_power,
-                                          energy_min,
-                                          energy_max,
-                                          energy_step,
-                                          show_image,
-                                          to_mm)
-
-        history_item = shadow_beam.getOEHistory(oe_number=shadow_beam._oe_number)
-
-        previous_beam = None
-
-        if shadow_beam.scanned_variable_data and shadow_beam.scanned_variable_data.has_additional_parameter("incident_power"):
-            self.cumulated_previous_power_plot += shadow_beam.scanned_variable_data.get_additional_parameter("incident_power")
-        elif not history_item is None and not history_item._input_beam is None:
-            previous_ticket = history_item._input_beam._beam.histo2(var_x, var_y, nbins_h=nbins_h, nbins_v=nbins_v, xrange=None, yrange=None, nolost=1, ref=23)
-            previous_ticket['histogram'] *= (total_power/n_rays) # power
-
-            self.cumulated_previous_power_plot += previous_ticket['histogram'].sum()
-
-        if nolost>1: # must be calculating only the rays the become lost in the last object
-            current_beam = shadow_beam
-
-            if history_item is None or history_item._input_beam is None:
-                beam = shadow_beam._beam
-            else:
-                previous_beam = previous_beam if previous_beam else history_item._input_beam.duplicate(history=False)
-
-                if nolost==2:
-                    current_lost_rays_cursor = numpy.where(current_beam._beam.rays[:, 9] != 1)
-
-                    current_lost_rays          = current_beam._beam.rays[current_lost_rays_cursor]
-                    lost_rays_in_previous_beam = previous_beam._beam.rays[current_lost_rays_cursor]
-
-                    lost_that_were_good_rays_cursor = numpy.where(lost_rays_in_previous_beam[:, 9] == 1)
-
-                    beam = Beam()
-                    beam.rays = current_lost_rays[lost_that_were_good_rays_cursor] # lost rays that were good after the previous OE
-
-                    # in case of filters, Shadow computes the absorption for lost rays. This cause an imbalance on the total power.
-                    # the lost rays that were good must have the same intensity they had before the optical element.
-
-                    beam.rays[:, 6]  = lost_rays_in_previous_beam[lost_that_were_good_rays_cursor][:, 6]
-                    beam.rays[:, 7]  = lost_rays_in_previous_beam[lost_that_were_good_rays_cursor][:, 7]
-                    beam.rays[:, 8]  = lost_rays_in_previous_beam[lost_that_were_good_rays_cursor][:, 8]
-                    beam.rays[:, 15] = lost_rays_in_previous_beam[lost_that_were_good_rays_cursor][:, 15]
-                    beam.rays[:, 16] = lost_rays_in_previous_beam[lost_that_were_good_rays_cursor][:, 16]
-                    beam.rays[:, 17] = lost_rays_in_previous_beam[lost_that_were_good_rays_cursor][:, 17]
-                    beam.rays[:, 9]  = 1
-                else:
-                    incident_rays = previous_beam._beam.rays
-                    transmitted_rays = current_beam._beam.rays
-
-                    incident_intensity = incident_rays[:, 6]**2  + incident_rays[:, 7]**2  + incident_rays[:, 8]**2 +\
-                                         incident_rays[:, 15]**2 + incident_rays[:, 16]**2 + incident_rays[:, 17]**2
-                    transmitted_intensity = transmitted_rays[:, 6]**2  + transmitted_rays[:, 7]**2  + transmitted_rays[:, 8]**2 +\
-                                            transmitted_rays[:, 15]**2 + transmitted_rays[:, 16]**2 + transmitted_rays[:, 17]**2
-
-                    electric_field = numpy.sqrt(incident_intensity - transmitted_intensity)
-                    electric_field[numpy.where(electric_field == numpy.nan)] = 0.0
-
-                    beam = Beam()
-                    beam.rays = copy.deepcopy(shadow_beam._beam.rays)
-
-                    beam.rays[:, 6]  = electric_field
-                    beam.rays[:, 7]  = 0.0
-                    beam.rays[:, 8]  = 0.0
-                    beam.rays[:, 15] = 0.0
-                    beam.rays[:, 16] = 0.0
-                    beam.rays[:, 17] = 0.0
-        else:
-            beam = shadow_beam._beam
-
-        if len(beam.rays) == 0:
-            return self.manage_empty_beam(ticket_to_add,
-                                          nbins_h,
-                                          nbins_v,
-                                          xrange,
-                                          yrange,
-                                          var_x,
-                                          var_y,
-                                          cumulated_total_power,
-                                          energy_min,
-                                          energy_max,
-                                          energy_step,
-                                          show_image,
-                                          to_mm)
-
-        ticket = beam.histo2(var_x, var_y, nbins_h=nbins_h, nbins_v=nbins_v, xrange=xrange, yrange=yrange, nolost=1 if nolost != 2 else 2, ref=23)
-
-        ticket['bin_h_center'] *= to_mm
-        ticket['bin_v_center'] *= to_mm
-
-        bin_h_size = (ticket['bin_h_center'][1] - ticket['bin_h_center'][0])
-        bin_v_size = (ticket['bin_v_center'][1] - ticket['bin_v_center'][0])
-
-        if kind_of_calculation > 0:
-            if replace_poor_statistic == 0 or (replace_poor_statistic==1 and ticket['good_rays'] < good_rays_limit):
-                if kind_of_calculation == 1: # FLAT
-                    PowerPlotXYWidget.get_flat_2d(ticket['histogram'], ticket['bin_h_center'], ticket['bin_v_center'])
-                elif kind_of_calculation == 2: # GAUSSIAN
-                    PowerPlotXYWidget.get_gaussian_2d(ticket['histogram'], ticket['bin_h_center'], ticket['bin_v_center'],
-                                                       sigma_x, sigma_y, center_x, center_y)
-                elif kind_of_calculation == 3: #LORENTZIAN
-                    PowerPlotXYWidget.get_lorentzian_2d(ticket['histogram'], ticket['bin_h_center'], ticket['bin_v_center'],
-                                                        gamma, center_x, center_y)
-                # rinormalization
-                ticket['histogram'] *= ticket['intensity']
-
-        ticket['histogram'][numpy.where(ticket['histogram'] < 1e-9)] = 0.0
-        ticket['histogram'] *= (total_power / n_rays)  # power
-
-        if ticket_to_add == None:
-            self.cumulated_power_plot = ticket['histogram'].sum()
-        else:
-            self.cumulated_power_plot += ticket['histogram'].sum()
-
-        ticket['histogram'] /= (bin_h_size * bin_v_size)  # power density
-
-        if not ticket_to_add is None:
-            last_ticket = copy.deepcopy(ticket)
-
-            ticket['histogram'] += ticket_to_add['histogram']
-            ticket['intensity'] += ticket_to_add['intensity']
-            ticket['nrays']     += ticket_to_add['nrays']
-            ticket['good_rays'] += ticket_to_add['good_rays']
-
-        ticket['h_label'] = var_x
-        ticket['v_label'] = var_y
-
-        # data for reload of the file
-        ticket['energy_min'] = energy_min
-        ticket['energy_max'] = energy_max
-        ticket['energy_step'] = energy_step
-        ticket['plotted_power'] = self.cumulated_power_plot
-        ticket['incident_power'] = self.cumulated_previous_power_plot
-        ticket['total_power'] = cumulated_total_power
+        ticket, last_ticket = self.calculate_power_density(shadow_beam, var_x, var_y, total_power, cumulated_total_power, energy_min, energy_max, energy_step,
+                                                           nbins_h, nbins_v, xrange, yrange, nolost, ticket_to_add, to_mm,
+                                                           kind_of_calculation, replace_poor_statistic, good_rays_limit,
+                                                           center_x, center_y, sigma_x, sigma_y, gamma)
 
         self.plot_power_density_ticket(ticket, var_x, var_y, cumulated_total_power, energy_min, energy_max, energy_step, show_image, cumulated_quantity)
 
-        if not ticket_to_add is None:
-            return ticket, last_ticket
-        else:
-            return ticket, None
+        return ticket, last_ticket
 
     def plot_power_density_ticket(self, ticket, var_x, var_y, cumulated_total_power, energy_min, energy_max, energy_step, show_image=True, cumulated_quantity=0):
         if show_image:
@@ -449,16 +232,19 @@ class PowerPlotXYWidget(QWidget):
 
             average_power_density = numpy.average(histogram[numpy.where(histogram > 0.0)])
 
+            plotted_power  = ticket.get('plotted_power', self.cumulated_power_plot)
+            incident_power = ticket.get('incident_power', self.cumulated_previous_power_plot)
+
             if cumulated_quantity == 0: # Power density
                 title = "Power Density [W/mm\u00b2] from " + str(round(energy_min, 2)) + " to " + str(round(energy_max+energy_step, 2)) + " [eV], Current Step: " + str(round(energy_step, 2)) + "\n" + \
-                        "Power [W]: Plot=" + str(round(self.cumulated_power_plot, 3)) + \
-                        ", Incid.=" + str(round(self.cumulated_previous_power_plot, 3)) + \
+                        "Power [W]: Plot=" + str(round(plotted_power, 3)) + \
+                        ", Incid.=" + str(round(incident_power, 3)) + \
                         ", Tot.=" + str(round(cumulated_total_power, 3)) + \
                         ", <PD>=" + str(round(average_power_density, 3)) + " W/mm\u00b2"
             elif cumulated_quantity == 1: # Intensity
                 title = "Intensity [ph/s/mm\u00b2] from " + str(round(energy_min, 2)) + " to " + str(round(energy_max+energy_step, 2)) + " [eV], Current Step: " + str(round(energy_step, 2)) + "\n" + \
-                        "Flux [ph/s]: Plot=" + "{:.1e}".format(self.cumulated_power_plot) + \
-                        ", Incid.=" + "{:.1e}".format(self.cumulated_previous_power_plot) + \
+                        "Flux [ph/s]: Plot=" + "{:.1e}".format(plotted_power) + \
+                        ", Incid.=" + "{:.1e}".format(incident_power) + \
                         ", Tot.=" + "{:.1e}".format(cumulated_total_power) + \
                         ", <I>=" + "{:.2e}".format(average_power_density) + " ph/s/mm\u00b2"
 
@@ -521,31 +307,19 @@ class PowerPlotXYWidget(QWidget):
             self.plot_canvas.clear()
             self.cumulated_power_plot = 0.0
             self.cumulated_previous_power_plot = 0.0
+            self.power_density_accumulator = None
 
     @classmethod
     def get_flat_2d(cls, z, x, y):
-        for i in range(len(x)):
-            z[i, :] = 1
-
-        norm = numpy.sum(z)
-        z[:,:] /= norm
+        z[:, :] = get_redistribution_kernel(RedistributionKernel.FLAT, x, y)
 
     @classmethod
     def get_gaussian_2d(cls, z, x, y, sigma_x, sigma_y, center_x=0.0, center_y=0.0):
-        for i in range(len(x)):
-            z[i, :] = numpy.exp(-1*(0.5*((x[i]-center_x)/sigma_x)**2 + 0.5*((y-center_y)/sigma_y)**2))
-
-        norm = numpy.sum(z)
-        z[:,:] /= norm
+        z[:, :] = get_redistribution_kernel(RedistributionKernel.GAUSSIAN, x, y, sigma_x=sigma_x, sigma_y=sigma_y, center_x=center_x, center_y=center_y)
 
     @classmethod
     def get_lorentzian_2d(cls, z, x, y, gamma, center_x=0.0, center_y=0.0):
-        for i in range(len(x)):
-            z[i, :] = gamma/(((x[i]-center_x)**2 + (y-center_y)**2 + gamma**2))
-
-        norm = numpy.sum(z)
-        z[:,:] /= norm
-
+        z[:, :] = get_redistribution_kernel(RedistributionKernel.LORENTZIAN, x, y, gamma=gamma, center_x=center_x, center_y=center_y)
 
 if __name__=="__main__":
 
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# #########################################################################
+# Copyright (c) 2026, UChicago Argonne, LLC. All rights reserved.         #
+#                                                                         #
+# Copyright 2026. UChicago Argonne, LLC. This software was produced       #
+# under U.S. Government contract DE-AC02-06CH11357 for Argonne National   #
+# Laboratory (ANL), which is operated by UChicago Argonne, LLC for the    #
+# U.S. Department of Energy. The U.S. Government has rights to use,       #
+# reproduce, and distribute this software.  NEITHER THE GOVERNMENT NOR    #
+# UChicago Argonne, LLC MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR        #
+# ASSUMES ANY LIABILITY FOR THE USE OF THIS SOFTWARE.  If software is     #
+# modified to produce derivative works, such modified software should     #
+# be clearly marked, so as not to confuse it with the version available   #
+# from ANL.                                                               #
+#                                                                         #
+# Additionally, redistribution and use in source and binary forms, with   #
+# or without modification, are permitted provided that the following      #
+# conditions are met:                                                     #
+#                                                                         #
+#     * Redistributions of source code must retain the above copyright    #
+#       notice, this list of conditions and the following disclaimer.     #
+#                                                                         #
+#     * Redistributions in binary form must reproduce the above copyright #
+#       notice, this list of conditions and the following disclaimer in   #
+#       the documentation and/or other materials provided with the        #
+#       distribution.                                                     #
+#                                                                         #
+#     * Neither the name of UChicago Argonne, LLC, Argonne National       #
+#       Laboratory, ANL, the U.S. Government, nor the names of its        #
+#       contributors may be used to endorse or promote products derived   #
+#       from this software without specific prior written permission.     #
+#                                                                         #
+# THIS SOFTWARE IS PROVIDED BY UChicago Argonne, LLC AND CONTRIBUTORS     #
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT       #
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS       #
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL UChicago     #
+# Argonne, LLC OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,        #
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,    #
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;        #
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER        #
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT      #
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN       #
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE         #
+# POSSIBILITY OF SUCH DAMAGE.                                             #
+# #########################################################################
+
+
+"""
+Headless run of the power density loop (spectrum, energy binning, Hybrid Undulator, beamline, power density), without
+the OASYS canvas. The result is the same autosave file written by the Power Plot XY widget.
+
+    python -m orangecontrib.shadow_advanced_tools.util.power_loop_runner workflow.ows --beamline my_beamline.py:trace
+
+A checkpoint is written next to the output file: after a crash, the same command with --resume restarts from it.
+
+Run with --help for the options.
+"""
+
+import os, sys, time, argparse, traceback
+
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_loop_bl import read_configuration, write_parameter_file, get_absolute_paths, \
+    get_loop_steps, run_power_loop, run_distributed_power_loop, run_power_loop_shard, merge_power_loop_shards
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_checkpoint_bl import get_checkpoint_file_name
+
+WORKSPACE_UNITS_TO_M = {"m" : 1.0, "cm" : 0.01, "mm" : 0.001}
+
+class _Log():
+    # copy of the standard output in the log file
+    def __init__(self, stream, file_name):
+        self.stream = stream
+        self.file   = open(file_name, "a")
+
+    def write(self, text):
+        self.stream.write(text)
+        self.file.write(text)
+        self.file.flush()
+
+    def flush(self):
+        self.stream.flush()
+        self.file.flush()
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(prog="shadow-power-loop", description="Headless power density loop of ShadowOui Advanced Tools")
+
+    parser.add_argument("configuration", help="OASYS workflow (.ows) or JSON parameter file")
+    parser.add_argument("-o", "--output", default=None, help="power density autosave file (default: the one of the Power Plot XY)")
+    parser.add_argument("--beamline", default=None, help="beamline function, as module:function or file.py:function (beam -> traced beam)")
+    parser.add_argument("--start-files", nargs="+", default=None, help="SHADOW start files of the optical elements, traced in sequence")
+    parser.add_argument("--workspace-units", choices=list(WORKSPACE_UNITS_TO_M.keys()), default=None, help="workspace units of the workflow")
+    parser.add_argument("--workers", type=int, default=1, help="local processes (0: one per CPU, default: 1)")
+    parser.add_argument("--shard", default=None, help="run only the shard I/N of the loop (1-based), for runs on several nodes")
+    parser.add_argument("--merge-shards", type=int, default=None, metavar="N", help="merge the N shards of the working directory in the output file")
+    parser.add_argument("--working-directory", default=None, help="directory of the shards (default: power_loop_shards, next to the output file)")
+    parser.add_argument("--checkpoint-steps", type=int, default=10, help="write the checkpoint every N steps (default: 10)")
+    parser.add_argument("--checkpoint-interval", type=float, default=300.0, help="or every T seconds (default: 300)")
+    parser.add_argument("--no-checkpoint", action="store_true", help="do not write the checkpoint (serial runs)")
+    parser.add_argument("--resume", action="store_true", help="restart from the checkpoint of an interrupted run, with the same options")
+    parser.add_argument("--log", default=None, help="log file (the output is also printed)")
+    parser.add_argument("--export-parameters", default=None, metavar="FILE", help="write the configuration as a JSON parameter file and exit")
+
+    return parser
+
+def get_configuration(arguments):
+    configuration = read_configuration(arguments.configuration)
+
+    if not arguments.beamline is None:        configuration["beamline"] = arguments.beamline
+    elif not arguments.start_files is None:   configuration["beamline"] = arguments.start_files
+    if not arguments.workspace_units is None: configuration["workspace_units_to_m"] = WORKSPACE_UNITS_TO_M[arguments.workspace_units]
+
+    return configuration
+
+def main(argv=None):
+    arguments = get_argument_parser().parse_args(argv)
+
+    if not arguments.log is None: sys.stdout = _Log(sys.stdout, arguments.log)
+
+    try:
+        configuration = get_configuration(arguments)
+
+        if not arguments.export_parameters is None:
+            write_parameter_file(configuration, arguments.export_parameters)
+            print("Parameters written in " + arguments.export_parameters)
+            return 0
+
+        output_file_name  = os.path.abspath(arguments.output or configuration.get("power_plot", {}).get("autosave_file_name", "autosave_power_density.hdf5"))
+        working_directory = arguments.working_directory or os.path.join(os.path.dirname(output_file_name), "power_loop_shards")
+
+        # shards always write their checkpoint: without it a shard could not be resumed
+        checkpoint_options = {"checkpoint_steps"    : arguments.checkpoint_steps,
+                              "checkpoint_interval" : arguments.checkpoint_interval}
+
+        start_time = time.time()
+
+        if not arguments.merge_shards is None:
+            print("Merging " + str(arguments.merge_shards) + " shards of " + working_directory)
+
+            merge_power_loop_shards(working_directory, arguments.merge_shards, output_file_name)
+        elif not arguments.shard is None:
+            index, n_shards = [int(token) for token in arguments.shard.split("/")]
+
+            os.makedirs(working_directory, exist_ok=True)
+            output_file_name = run_power_loop_shard(get_absolute_paths(configuration), n_shards, index - 1, working_directory,
+                                                    resume=arguments.resume, **checkpoint_options)
+        elif arguments.workers == 1:
+            run_power_loop(configuration, get_loop_steps(configuration), output_file_name,
+                           checkpoint_file_name=None if arguments.no_checkpoint else get_checkpoint_file_name(output_file_name),
+                           resume=arguments.resume, **checkpoint_options)
+        else:
+            run_distributed_power_loop(configuration, output_file_name, n_workers=arguments.workers, working_directory=working_directory,
+                                       resume=arguments.resume, **checkpoint_options)
+
+        if os.path.exists(output_file_name):
+            print("Power density written in " + output_file_name + " (" + str(round(time.time() - start_time, 1)) + " s)")
+        else:
+            print("Empty shard: no power collected, nothing written (" + str(round(time.time() - start_time, 1)) + " s)")
+    except Exception:
+        print(traceback.format_exc())
+
+        return 1
+    finally:
+        if isinstance(sys.stdout, _Log):
+            log, sys.stdout = sys.stdout, sys.stdout.stream
+            log.file.close()
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
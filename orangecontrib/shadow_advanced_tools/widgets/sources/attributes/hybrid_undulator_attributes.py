@@ -155,6 +155,10 @@ class HybridUndulatorAttributes():
     energy = Setting(10000.0)
     energy_to = Setting(10100.0)
     energy_points = Setting(10)
+    save_range_distributions = Setting(0)
+    range_distributions_file = Setting("range_distributions.hdf5")
+    harmonic_numbers = Setting("1, 3, 5")
+    harmonics_in_parallel = Setting(1)
 
     polarization = Setting(1)
     coherent_beam = Setting(0)
@@ -170,7 +174,24 @@ class HybridUndulatorAttributes():
     auto_energy = Setting(0.0)
     auto_harmonic_number = Setting(1)
 
+    tuning_scan_variable = Setting(0)
+    tuning_direction = Setting(0)
+    tuning_from = Setting(0.5)
+    tuning_to = Setting(2.5)
+    tuning_points = Setting(20)
+    tuning_harmonics = Setting("1, 3, 5")
+    tuning_compute_distributions = Setting(0)
+    tuning_file_name = Setting("tuning_curve.hdf5")
+    tuning_processes = Setting(0)
+
     use_stokes = Setting(1)
+    reuse_electron_trajectory = Setting(1)
+
+    srw_precision = Setting(1)
+    srw_relative_precision = Setting(0.01)
+    srw_trajectory_points = Setting(100000)
+    srw_sampling_factor = Setting(0.0)
+    calibration_tolerance = Setting(0.01)
 
     energy_step = None
     power_step = None
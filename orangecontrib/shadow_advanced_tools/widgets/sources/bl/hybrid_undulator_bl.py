@@ -45,8 +45,12 @@
 # POSSIBILITY OF SUCH DAMAGE.                                             #
 # #########################################################################
 
+import os, multiprocessing
 import numpy
+import h5py
 from scipy.signal import convolve2d
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
 
 from oasys.widgets import congruence
 from oasys.util.oasys_util import get_fwhm, get_sigma
@@ -55,6 +59,7 @@ from srxraylib.util.inverse_method_sampler import Sampler2D
 
 from orangecontrib.shadow.util.shadow_objects import ShadowBeam, ShadowSource
 from orangecontrib.shadow.util.shadow_util import ShadowPhysics
+from orangecontrib.shadow_advanced_tools.util.lru_cache import LRUCache
 
 from oasys.util.random_distributions import Distribution2D, Grid2D, distribution_from_grid
 from oasys.util.custom_distribution import CustomDistribution
@@ -72,6 +77,26 @@ class Distribution:
     DIVERGENCE = 1
 
 
+class Precision:
+    DRAFT = 0
+    STANDARD = 1
+    PUBLICATION = 2
+    USER_DEFINED = 3
+
+    # relative precision, number of points of the trajectory, sampling factor for adjusting nx, ny
+    PRESETS = {DRAFT       : (0.05,  20000,  0.0),
+               STANDARD    : (0.01,  100000, 0.0),
+               PUBLICATION : (0.001, 500000, 0.0)}
+
+    NAMES = ["Draft", "Standard", "Publication", "User Defined"]
+
+
+class TuningDirection:
+    VERTICAL = 0
+    HORIZONTAL = 1
+    BOTH = 2
+
+
 ####################################################################################
 # SIMULATION ALGORITHM
 ####################################################################################
@@ -91,6 +116,11 @@ def __check_fields(widget):
         widget.energy_to = congruence.checkStrictlyPositiveNumber(widget.energy_to, "Photon Energy To")
         widget.energy_points = congruence.checkStrictlyPositiveNumber(widget.energy_points, "Nr. Energy Values")
         congruence.checkGreaterThan(widget.energy_to, widget.energy, "Photon Energy To", "Photon Energy From")
+    elif widget.use_harmonic == 3:
+        if widget.distribution_source != 0: raise Exception("Multiple Harmonics can be computed only for explicit SRW Calculation")
+        if widget.use_stokes != 1: raise Exception("Multiple Harmonics can be computed only with Integrated Flux From Stokes")
+
+        __get_harmonic_numbers(widget)
     else:
         widget.energy = congruence.checkStrictlyPositiveNumber(widget.energy, "Photon Energy")
 
@@ -126,7 +156,9 @@ def __populate_fields(widget, shadow_src):
     shadow_src.src.F_COLOR = 1  # single value
     shadow_src.src.F_PHOT = 0  # eV , 1 Angstrom
 
-    shadow_src.src.PH1 = widget.energy if widget.use_harmonic != 0 else resonance_energy(widget, harmonic=widget.harmonic_number)
+    if widget.use_harmonic == 0:   shadow_src.src.PH1 = resonance_energy(widget, harmonic=widget.harmonic_number)
+    elif widget.use_harmonic == 3: shadow_src.src.PH1 = resonance_energy(widget, harmonic=__get_harmonic_numbers(widget)[0])
+    else:                          shadow_src.src.PH1 = widget.energy
 
     shadow_src.src.F_POLAR = widget.polarization
 
@@ -179,16 +211,6 @@ def __generate_initial_beam(widget):
 def __apply_undulator_distributions_calculation(widget, beam_out, do_cumulated_calculations):
     if widget.use_harmonic == 2: # range
         energy_points = int(widget.energy_points)
-
-        x_array = numpy.full(energy_points, None)
-        z_array = numpy.full(energy_points, None)
-
-        intensity_source_dimension_array = numpy.full(energy_points, None)
-
-        x_first_array = numpy.full(energy_points, None)
-        z_first_array = numpy.full(energy_points, None)
-
-        intensity_angular_distribution_array = numpy.full(energy_points, None)
         energies = numpy.linspace(widget.energy, widget.energy_to, energy_points)
 
         total_power = None
@@ -207,44 +229,94 @@ def __apply_undulator_distributions_calculation(widget, beam_out, do_cumulated_c
         current_seed = time.time() if widget.seed == 0 else widget.seed
         random.seed(current_seed)
 
-        first_index = 0
-        for energy, i in zip(energies, range(energy_points)):
-            last_index = min(first_index + int(nr_rays_array[i]), len(beam_out._beam.rays))
-            rays = beam_out._beam.rays[first_index:last_index]
+        distributions_file = __open_range_distributions_file(widget)
 
-            widget.setStatusMessage("Running SRW for energy: " + str(energy))
+        try:
+            first_index = 0
+            # each energy is computed, sampled and released before the next one: only one set of grids is alive at a time
+            for i, energy, x, z, intensity_source_dimension, x_first, z_first, intensity_angular_distribution in __generate_SRW_distributions_in_range(widget, energies, flux_from_stokes):
+                last_index = min(first_index + int(nr_rays_array[i]), len(beam_out._beam.rays))
+                rays = beam_out._beam.rays[first_index:last_index]
+
+                if not distributions_file is None:
+                    __write_range_distributions(distributions_file, i, energy, flux_from_stokes[i],
+                                                x, z, intensity_source_dimension, x_first, z_first, intensity_angular_distribution)
+
+                rays[:, 10] = ShadowPhysics.getShadowKFromEnergy(numpy.random.uniform(energy, energy + delta_e, size=len(rays)))
+
+                widget.setStatusMessage("Applying new Spatial/Angular Distribution for energy: " + str(energy))
+
+                __generate_user_defined_distribution_from_srw(rays=rays,
+                                                              coord_x=x,
+                                                              coord_z=z,
+                                                              intensity=intensity_source_dimension,
+                                                              distribution_type=Distribution.POSITION,
+                                                              kind_of_sampler=widget.kind_of_sampler,
+                                                              seed=current_seed + 1)
+
+                __generate_user_defined_distribution_from_srw(rays=rays,
+                                                              coord_x=x_first,
+                                                              coord_z=z_first,
+                                                              intensity=intensity_angular_distribution,
+                                                              distribution_type=Distribution.DIVERGENCE,
+                                                              kind_of_sampler=widget.kind_of_sampler,
+                                                              seed=current_seed + 2)
+
+                widget.progressBarSet(prog_bars[i])
+                first_index = last_index
+                current_seed += 2
+        finally:
+            if not distributions_file is None: distributions_file.close()
 
-            x, z, intensity_source_dimension, x_first, z_first, intensity_angular_distribution, integrated_flux, _ = __run_SRW_calculation(widget,
-                                                                                                                                           energy,
-                                                                                                                                           flux_from_stokes=flux_from_stokes[i],
-                                                                                                                                           do_cumulated_calculations=False)
+        if not last_index == len(beam_out._beam.rays):
+            excluded_rays = beam_out._beam.rays[last_index:]
+            excluded_rays[:, 9] = -999
+
+        beam_out.set_initial_flux(None)
+    elif widget.use_harmonic == 3: # multiple harmonics
+        harmonic_numbers = __get_harmonic_numbers(widget)
+        energies = numpy.array([resonance_energy(widget, harmonic=harmonic) for harmonic in harmonic_numbers])
+
+        total_power = None
+
+        widget.setStatusMessage("Running SRW for harmonics: " + ", ".join([str(harmonic) for harmonic in harmonic_numbers]))
+        widget.progressBarSet(25)
+
+        srw_distributions = __get_SRW_distributions_for_energies(widget, energies)
+
+        flux_from_stokes = numpy.array([srw_distribution[0] for srw_distribution in srw_distributions])
+        nr_rays_array = __split_number_of_rays(widget.number_of_rays, flux_from_stokes)
+        prog_bars = numpy.linspace(50, 80, len(energies))
+
+        current_seed = time.time() if widget.seed == 0 else widget.seed
+
+        first_index = 0
+        for i in range(len(energies)):
+            last_index = min(first_index + nr_rays_array[i], len(beam_out._beam.rays))
+            rays = beam_out._beam.rays[first_index:last_index]
 
-            x_array[i] = x
-            z_array[i] = z
-            intensity_source_dimension_array[i] = intensity_source_dimension
-            x_first_array[i] = x_first
-            z_first_array[i] = z_first
-            intensity_angular_distribution_array[i] = intensity_angular_distribution
+            _, x, z, intensity_source_dimension, x_first, z_first, intensity_angular_distribution = srw_distributions[i]
 
-            rays[:, 10] = ShadowPhysics.getShadowKFromEnergy(numpy.random.uniform(energy, energy + delta_e, size=len(rays)))
+            rays[:, 10] = ShadowPhysics.getShadowKFromEnergy(energies[i])
 
-            widget.setStatusMessage("Applying new Spatial/Angular Distribution for energy: " + str(energy))
+            widget.setStatusMessage("Applying new Spatial/Angular Distribution for harmonic: " + str(harmonic_numbers[i]))
 
-            __generate_user_defined_distribution_from_srw(rays=rays,
-                                                          coord_x=x_array[i],
-                                                          coord_z=z_array[i],
-                                                          intensity=intensity_source_dimension_array[i],
-                                                          distribution_type=Distribution.POSITION,
-                                                          kind_of_sampler=widget.kind_of_sampler,
-                                                          seed=current_seed + 1)
+            if len(rays) > 0:
+                __generate_user_defined_distribution_from_srw(rays=rays,
+                                                              coord_x=x,
+                                                              coord_z=z,
+                                                              intensity=intensity_source_dimension,
+                                                              distribution_type=Distribution.POSITION,
+                                                              kind_of_sampler=widget.kind_of_sampler,
+                                                              seed=current_seed + 1)
 
-            __generate_user_defined_distribution_from_srw(rays=rays,
-                                                          coord_x=x_first_array[i],
-                                                          coord_z=z_first_array[i],
-                                                          intensity=intensity_angular_distribution_array[i],
-                                                          distribution_type=Distribution.DIVERGENCE,
-                                                          kind_of_sampler=widget.kind_of_sampler,
-                                                          seed=current_seed + 2)
+                __generate_user_defined_distribution_from_srw(rays=rays,
+                                                              coord_x=x_first,
+                                                              coord_z=z_first,
+                                                              intensity=intensity_angular_distribution,
+                                                              distribution_type=Distribution.DIVERGENCE,
+                                                              kind_of_sampler=widget.kind_of_sampler,
+                                                              seed=current_seed + 2)
 
             widget.progressBarSet(prog_bars[i])
             first_index = last_index
@@ -374,6 +446,36 @@ def resonance_energy(widget, theta_x=0.0, theta_z=0.0, harmonic=1):
     return m2ev / wavelength
 
 
+def resonance_energies(widget, Kv, Kh, harmonics):
+    """
+    Vectorised resonance energies (on axis): returns an array len(Kv) x len(harmonics)
+    """
+    g = gamma(widget)
+
+    Kv = numpy.atleast_1d(numpy.asarray(Kv, dtype=float))
+    Kh = numpy.atleast_1d(numpy.asarray(Kh, dtype=float))
+    harmonics = numpy.atleast_1d(numpy.asarray(harmonics, dtype=float))
+
+    wavelength = (widget.undulator_period / (2.0 * g ** 2)) * (1 + Kv ** 2 / 2.0 + Kh ** 2 / 2.0)
+
+    return m2ev * harmonics[numpy.newaxis, :] / wavelength[:, numpy.newaxis]
+
+
+def K_from_magnetic_field(widget, B):
+    return numpy.asarray(B) * codata.e * widget.undulator_period / (2 * pi * codata.m_e * codata.c)
+
+
+def calculate_tuning_curve(widget):
+    """
+    Computes flux (and optionally source sizes and divergences) vs K for each harmonic at the resonance
+    energies, and writes the table in the HDF5 file widget.tuning_file_name. The points are computed by
+    widget.tuning_processes worker processes (0: one per CPU), or in this process for 1 worker or a few points
+
+    Returns the dictionary of the results
+    """
+    return __calculate_tuning_curve(widget)
+
+
 def get_default_initial_z(widget):
     return widget.longitudinal_central_position - 0.5 * widget.undulator_period * (widget.number_of_periods + 8)  # initial Longitudinal Coordinate (set before the ID)
 
@@ -382,6 +484,24 @@ def is_canted_undulator(widget):
     return widget.longitudinal_central_position != 0.0
 
 
+def get_precision_parameters(widget):
+    if widget.srw_precision == Precision.USER_DEFINED:
+        return widget.srw_relative_precision, int(widget.srw_trajectory_points), widget.srw_sampling_factor
+    else:
+        return Precision.PRESETS[widget.srw_precision]
+
+
+def calibrate_srw_precision(widget):
+    """
+    Measures time and accuracy of the SRW calculation for the current configuration at increasing precision
+    and sets the cheapest precision parameters (and resolution modification factors at resizing) whose
+    results differ from the most accurate ones less than the calibration tolerance.
+
+    Returns a text report of the calibration
+    """
+    return __calibrate_srw_precision(widget)
+
+
 ####################################################################################
 # SRW CALCULATION
 ####################################################################################
@@ -520,8 +640,10 @@ def __create_initial_wavefront_mesh(widget, elecBeam, energy):
 
 def __get_calculation_precision_settings(widget, no_shift=False):
     # ***********Precision Parameters for SR calculation
+    relPrec, npTraj, sampFactNxNyForProp = get_precision_parameters(widget)
+
     meth = 1  # SR calculation method: 0- "manual", 1- "auto-undulator", 2- "auto-wiggler"
-    relPrec = 0.01  # relative precision
+    # relPrec: relative precision
 
     if (widget.longitudinal_central_position < 0 and not no_shift):
         zStartInteg = widget.longitudinal_central_position - ((0.5 * widget.number_of_periods + 8) * widget.undulator_period)  # longitudinal position to start integration (effective if < zEndInteg)
@@ -530,14 +652,64 @@ def __get_calculation_precision_settings(widget, no_shift=False):
         zStartInteg = 0  # longitudinal position to start integration (effective if < zEndInteg)
         zEndInteg = 0  # longitudinal position to finish integration (effective if > zStartInteg)
 
-    npTraj = 100000  # Number of points for trajectory calculation
+    # npTraj: Number of points for trajectory calculation
     useTermin = 1  # Use "terminating terms" (i.e. asymptotic expansions at zStartInteg and zEndInteg) or not (1 or 0 respectively)
     # This is the convergence parameter. Higher is more accurate but slower!!
-    sampFactNxNyForProp = 0.0  # 0.6 #sampling factor for adjusting nx, ny (effective if > 0)
+    # sampFactNxNyForProp: sampling factor for adjusting nx, ny (effective if > 0)
 
     return [meth, relPrec, zStartInteg, zEndInteg, npTraj, useTermin, sampFactNxNyForProp]
 
 
+__electron_trajectory_cache = LRUCache(max_size=10)
+
+
+def __get_electron_trajectory(widget, magFldCnt, elecBeam, arPrecParSpec):
+    # the trajectory depends only on the magnetic field and on the first order moments of the electron beam:
+    # it is computed once and reused for every energy and waist position (0 = SRW computes it internally)
+    if widget.reuse_electron_trajectory == 0: return 0
+
+    undulator = magFldCnt.arMagFld[0]
+    moments = elecBeam.partStatMom1
+
+    z_center = magFldCnt.arZc[0]
+    z_length = (0.5 * undulator.nPer + 8) * undulator.per
+
+    if arPrecParSpec[2] < arPrecParSpec[3]: z_start, z_end = arPrecParSpec[2], arPrecParSpec[3]
+    else:                                   z_start, z_end = z_center - z_length, z_center + z_length
+
+    key = (tuple([(harmonic.n, harmonic.h_or_v, harmonic.B, harmonic.ph, harmonic.s, harmonic.a) for harmonic in undulator.arHarm]),
+           undulator.per, undulator.nPer, magFldCnt.arXc[0], magFldCnt.arYc[0], z_center,
+           moments.x, moments.y, moments.z, moments.xp, moments.yp, moments.gamma,
+           arPrecParSpec[4], z_start, z_end)
+
+    partTraj = __electron_trajectory_cache.get(key)
+
+    if partTraj is None:
+        particle = SRWLParticle()
+        particle.x = moments.x
+        particle.y = moments.y
+        particle.z = moments.z
+        particle.xp = moments.xp
+        particle.yp = moments.yp
+        particle.gamma = moments.gamma
+        particle.relE0 = 1
+        particle.nq = -1
+
+        partTraj = SRWLPrtTrj()
+        partTraj.partInitCond = particle
+        partTraj.allocate(int(arPrecParSpec[4]), True)
+        # Start/End "time" [m] relative to the initial position of the electron: the initial position lies inside
+        # the integration range, so ctStart < 0 and CalcPartTraj integrates backwards from it, as CalcElecFieldSR does
+        partTraj.ctStart = z_start - moments.z
+        partTraj.ctEnd = z_end - moments.z
+
+        srwl.CalcPartTraj(partTraj, magFldCnt, [1])  # Runge-Kutta 4th order
+
+        __electron_trajectory_cache[key] = partTraj
+
+    return partTraj
+
+
 def __calculate_automatic_waste_position(widget, energy, do_plot=True):
     magFldCnt = __create_undulator(widget, no_shift=True)
     arPrecParSpec = __get_calculation_precision_settings(widget, no_shift=True)
@@ -568,7 +740,7 @@ def __calculate_automatic_waste_position(widget, energy, do_plot=True):
                                                          back_position=(widget.source_dimension_wf_distance + widget.longitudinal_central_position - position),
                                                          waist_calculation=widget.waist_back_propagation_parameters == 1)
 
-        srwl.CalcElecFieldSR(wfr, 0, magFldCnt, arPrecParSpec)
+        srwl.CalcElecFieldSR(wfr, __get_electron_trajectory(widget, magFldCnt, elecBeam_Ph, arPrecParSpec), magFldCnt, arPrecParSpec)
         srwl.PropagElecField(wfr, optBLSouDim)
 
         arI = srw_array('f', [0] * wfr.mesh.nx * wfr.mesh.ny)  # "flat" 2D array to take intensity data
@@ -698,6 +870,7 @@ def __calculate_waist_position(widget, energy):
                 widget.waist_position = 0.0
             elif widget.waist_position_calculation == 1:  # Automatic
                 if widget.use_harmonic == 2: raise ValueError("Automatic calculation of the waist position for canted undulator is not allowed when Photon Energy Setting: Range")
+                if widget.use_harmonic == 3: raise ValueError("Automatic calculation of the waist position for canted undulator is not allowed when Photon Energy Setting: Harmonics")
                 if widget.compute_power: raise ValueError("Automatic calculation of the waist position for canted undulator is not allowed while running a thermal load loop")
 
                 widget.waist_position_auto_h, widget.waist_position_auto_v = __calculate_automatic_waste_position(widget, energy)
@@ -788,7 +961,7 @@ def __run_SRW_calculation(widget, energy, flux_from_stokes=0.0, do_cumulated_cal
     arPrecParSpec = __get_calculation_precision_settings(widget)
 
     # 1 calculate intensity distribution ME convoluted for dimension size
-    srwl.CalcElecFieldSR(wfr, 0, magFldCnt, arPrecParSpec)
+    srwl.CalcElecFieldSR(wfr, __get_electron_trajectory(widget, magFldCnt, elecBeam, arPrecParSpec), magFldCnt, arPrecParSpec)
 
     arI = array('f', [0] * wfr.mesh.nx * wfr.mesh.ny)  # "flat" 2D array to take intensity data
     srwl.CalcIntFromElecField(arI, wfr, 6, 1, 3, wfr.mesh.eStart, 0, 0)
@@ -845,7 +1018,7 @@ def __run_SRW_calculation(widget, energy, flux_from_stokes=0.0, do_cumulated_cal
     wfr = __create_initial_wavefront_mesh(widget, elecBeam, energy)
     optBLSouDim = __create_beamline_source_dimension(widget, back_position=(widget.source_dimension_wf_distance - widget.waist_position))
 
-    srwl.CalcElecFieldSR(wfr, 0, magFldCnt, arPrecParSpec)
+    srwl.CalcElecFieldSR(wfr, __get_electron_trajectory(widget, magFldCnt, elecBeam, arPrecParSpec), magFldCnt, arPrecParSpec)
     srwl.PropagElecField(wfr, optBLSouDim)
 
     arI = array('f', [0] * wfr.mesh.nx * wfr.mesh.ny)  # "flat" 2D array to take intensity data
@@ -943,6 +1116,467 @@ def __generate_user_defined_distribution_from_srw(rays,
         raise ValueError("Sampler not recognized")
 
 
+####################################################################################
+# PRECISION CALIBRATION
+####################################################################################
+
+__RESOLUTION_FACTOR_CANDIDATES = [1.0, 2.0, 3.0, 5.0, 8.0]
+__CALIBRATION_REPEATS = 3
+
+
+def __check_calibration_fields(widget):
+    if widget.distribution_source != 0: raise ValueError("Precision calibration is possible only for explicit SRW Calculation")
+    congruence.checkStrictlyPositiveNumber(widget.calibration_tolerance, "Calibration Tolerance")
+
+    if widget.srw_precision == Precision.USER_DEFINED:
+        congruence.checkStrictlyPositiveNumber(widget.srw_relative_precision, "Relative Precision")
+        congruence.checkStrictlyPositiveNumber(widget.srw_trajectory_points, "Nr. of Trajectory Points")
+        congruence.checkPositiveNumber(widget.srw_sampling_factor, "Sampling Factor for Propagation")
+
+    __check_SRW_fields(widget)
+
+
+def __get_last_waist_position(widget):
+    # no new automatic calculation of the waist position: the last one is used
+    if not is_canted_undulator(widget):         return 0.0
+    elif widget.waist_position_calculation == 1: return widget.waist_position_auto
+    elif widget.waist_position_calculation == 2: return widget.waist_position_user_defined
+    else:                                        return 0.0
+
+
+def __get_calibration_energy(widget):
+    if widget.use_harmonic == 0:   return resonance_energy(widget, harmonic=widget.harmonic_number)
+    elif widget.use_harmonic == 3: return resonance_energy(widget, harmonic=__get_harmonic_numbers(widget)[0])
+    else:                          return widget.energy
+
+
+def __get_distribution_difference(intensity, reference_intensity):
+    # total variation distance between the normalized distributions: 0 (identical) to 1 (disjoint)
+    return 0.5 * numpy.sum(numpy.abs(intensity / numpy.sum(intensity) - reference_intensity / numpy.sum(reference_intensity)))
+
+
+def __get_size_difference(x, z, intensity, reference_sizes):
+    sizes = numpy.array([get_sigma(numpy.sum(intensity, axis=1), x), get_sigma(numpy.sum(intensity, axis=0), z)])
+
+    return numpy.max(numpy.abs(sizes - reference_sizes) / reference_sizes), sizes
+
+
+def __repeat_test(test, *arguments):
+    # a single wall-clock timing is noisy: the minimum of the repeated timings is compared
+    elapsed_time = numpy.inf
+    for _ in range(__CALIBRATION_REPEATS):
+        result       = test(*arguments)
+        elapsed_time = min(elapsed_time, result[0])
+
+    return (elapsed_time,) + tuple(result[1:])
+
+
+def __run_precision_test(widget, energy, precision_parameters):
+    magFldCnt = __create_undulator(widget)
+    elecBeam = __create_electron_beam(widget, distribution_type=Distribution.DIVERGENCE, position=widget.waist_position)
+    wfr = __create_initial_wavefront_mesh(widget, elecBeam, energy)
+
+    arPrecParSpec = __get_calculation_precision_settings(widget)
+    arPrecParSpec[1], arPrecParSpec[4], arPrecParSpec[6] = precision_parameters
+
+    partTraj = __get_electron_trajectory(widget, magFldCnt, elecBeam, arPrecParSpec) # when reused, not part of the cost of each call
+
+    t0 = time.time()
+
+    srwl.CalcElecFieldSR(wfr, partTraj, magFldCnt, arPrecParSpec)
+
+    arI = array('f', [0] * wfr.mesh.nx * wfr.mesh.ny)
+    srwl.CalcIntFromElecField(arI, wfr, 6, 1, 3, wfr.mesh.eStart, 0, 0)
+
+    elapsed_time = time.time() - t0
+
+    _, _, intensity = __transform_srw_array(arI, wfr.mesh)
+
+    return elapsed_time, intensity
+
+
+def __run_resolution_test(widget, energy, resolution_factor):
+    magFldCnt = __create_undulator(widget)
+    elecBeam = __create_electron_beam(widget, distribution_type=Distribution.POSITION, position=widget.waist_position)
+    wfr = __create_initial_wavefront_mesh(widget, elecBeam, energy)
+
+    arPrecParSpec = __get_calculation_precision_settings(widget)
+
+    optBLSouDim = SRWLOptC([SRWLOptD(-(widget.source_dimension_wf_distance - widget.waist_position))],
+                           [[0, 0, 1., 1, 0,
+                             widget.horizontal_range_modification_factor_at_resizing, resolution_factor,
+                             widget.vertical_range_modification_factor_at_resizing, resolution_factor,
+                             0, 0, 0]])
+
+    partTraj = __get_electron_trajectory(widget, magFldCnt, elecBeam, arPrecParSpec)
+
+    t0 = time.time()
+
+    srwl.CalcElecFieldSR(wfr, partTraj, magFldCnt, arPrecParSpec)
+    srwl.PropagElecField(wfr, optBLSouDim)
+
+    arI = array('f', [0] * wfr.mesh.nx * wfr.mesh.ny)
+    srwl.CalcIntFromElecField(arI, wfr, 6, 1, 3, wfr.mesh.eStart, 0, 0)
+
+    elapsed_time = time.time() - t0
+
+    x, z, intensity = __transform_srw_array(arI, wfr.mesh)
+
+    return elapsed_time, x, z, intensity
+
+
+def __calibrate_srw_precision(widget):
+    __check_calibration_fields(widget)
+
+    energy = __get_calibration_energy(widget)
+    tolerance = widget.calibration_tolerance
+
+    widget.waist_position = __get_last_waist_position(widget)
+
+    report = "Calibration at E = " + str(round(energy, 2)) + " eV, tolerance = " + str(tolerance) + "\n\n"
+
+    # 1 precision of the field integrals, against the most accurate preset
+    widget.setStatusMessage("Calibration: running SRW at Publication precision")
+    reference_time, reference_intensity = __repeat_test(__run_precision_test, widget, energy, Precision.PRESETS[Precision.PUBLICATION])
+
+    chosen_precision = Precision.PUBLICATION
+    chosen_time = reference_time
+
+    report += "Precision (relPrec, npTraj, sampFact): minimum time of " + str(__CALIBRATION_REPEATS) + " runs [s], difference\n"
+
+    for precision in [Precision.DRAFT, Precision.STANDARD, Precision.PUBLICATION]:
+        if precision == Precision.PUBLICATION:
+            elapsed_time, difference = reference_time, 0.0
+        else:
+            widget.setStatusMessage("Calibration: running SRW at " + Precision.NAMES[precision] + " precision")
+            elapsed_time, intensity = __repeat_test(__run_precision_test, widget, energy, Precision.PRESETS[precision])
+            difference = __get_distribution_difference(intensity, reference_intensity)
+
+        report += Precision.NAMES[precision] + " " + str(Precision.PRESETS[precision]) + ": " + str(round(elapsed_time, 3)) + ", " + str(round(difference, 5)) + "\n"
+
+        if difference <= tolerance and elapsed_time < chosen_time:
+            chosen_precision = precision
+            chosen_time = elapsed_time
+
+    widget.srw_precision = chosen_precision
+
+    # 2 resolution of the back-propagation to the source, against the finest resolution (source sizes)
+    widget.setStatusMessage("Calibration: running SRW with resolution factor " + str(__RESOLUTION_FACTOR_CANDIDATES[-1]))
+
+    reference_time, x, z, intensity = __repeat_test(__run_resolution_test, widget, energy, __RESOLUTION_FACTOR_CANDIDATES[-1])
+    _, reference_sizes = __get_size_difference(x, z, intensity, numpy.ones(2))
+
+    chosen_factor = __RESOLUTION_FACTOR_CANDIDATES[-1]
+    chosen_time = reference_time
+
+    report += "\nResolution Factor at Resizing: minimum time of " + str(__CALIBRATION_REPEATS) + " runs [s], difference\n"
+
+    for resolution_factor in __RESOLUTION_FACTOR_CANDIDATES[:-1]:
+        widget.setStatusMessage("Calibration: running SRW with resolution factor " + str(resolution_factor))
+
+        elapsed_time, x, z, intensity = __repeat_test(__run_resolution_test, widget, energy, resolution_factor)
+        difference, _ = __get_size_difference(x, z, intensity, reference_sizes)
+
+        report += str(resolution_factor) + ": " + str(round(elapsed_time, 3)) + ", " + str(round(difference, 5)) + "\n"
+
+        if difference <= tolerance and elapsed_time < chosen_time:
+            chosen_factor = resolution_factor
+            chosen_time = elapsed_time
+
+    report += str(__RESOLUTION_FACTOR_CANDIDATES[-1]) + ": " + str(round(reference_time, 3)) + ", 0.0\n"
+
+    widget.horizontal_resolution_modification_factor_at_resizing = chosen_factor
+    widget.vertical_resolution_modification_factor_at_resizing = chosen_factor
+
+    report += "\nChosen: " + Precision.NAMES[chosen_precision] + " precision, resolution factor at resizing " + str(chosen_factor)
+
+    return report
+
+
+####################################################################################
+# ENERGY RANGE
+####################################################################################
+
+def __generate_SRW_distributions_in_range(widget, energies, flux_from_stokes):
+    for i, energy in enumerate(energies):
+        widget.setStatusMessage("Running SRW for energy: " + str(energy))
+
+        x, z, intensity_source_dimension, x_first, z_first, intensity_angular_distribution, _, _ = __run_SRW_calculation(widget,
+                                                                                                                        energy,
+                                                                                                                        flux_from_stokes=flux_from_stokes[i],
+                                                                                                                        do_cumulated_calculations=False)
+
+        yield i, energy, x, z, intensity_source_dimension, x_first, z_first, intensity_angular_distribution
+
+
+def __open_range_distributions_file(widget):
+    if widget.save_range_distributions == 0: return None
+
+    congruence.checkDir(widget.range_distributions_file)
+
+    distributions_file = h5py.File(widget.range_distributions_file, "w")
+    distributions_file.attrs["energy_from"] = widget.energy
+    distributions_file.attrs["energy_to"] = widget.energy_to
+    distributions_file.attrs["energy_points"] = int(widget.energy_points)
+    distributions_file.attrs["workspace_units_to_m"] = widget.workspace_units_to_m
+
+    return distributions_file
+
+
+def __write_range_distributions(distributions_file, index, energy, flux, x, z, intensity_source_dimension, x_first, z_first, intensity_angular_distribution):
+    group = distributions_file.create_group("energy_" + str(index + 1))
+    group.attrs["energy"] = energy
+    group.attrs["flux"] = flux
+
+    source_dimension = group.create_group("source_dimension")
+    source_dimension["x"] = x
+    source_dimension["z"] = z
+    source_dimension.create_dataset("intensity", data=intensity_source_dimension, compression="gzip")
+
+    angular_distribution = group.create_group("angular_distribution")
+    angular_distribution["x"] = x_first
+    angular_distribution["z"] = z_first
+    angular_distribution.create_dataset("intensity", data=intensity_angular_distribution, compression="gzip")
+
+    distributions_file.flush()
+
+
+####################################################################################
+# MULTIPLE HARMONICS
+####################################################################################
+
+# attributes read by the SRW calculation: they define the state sent to the worker processes
+# and the key of the cache of the computed distributions
+__SRW_CALCULATION_ATTRIBUTES = ["distribution_source", "use_harmonic", "use_stokes", "compute_power", "workspace_units_to_m", "reuse_electron_trajectory",
+                                "number_of_periods", "undulator_period", "Kv", "Kh", "Bh", "Bv", "magnetic_field_from",
+                                "initial_phase_vertical", "initial_phase_horizontal",
+                                "symmetry_vs_longitudinal_position_vertical", "symmetry_vs_longitudinal_position_horizontal",
+                                "horizontal_central_position", "vertical_central_position", "longitudinal_central_position",
+                                "electron_energy_in_GeV", "electron_energy_spread", "ring_current",
+                                "electron_beam_size_h", "electron_beam_size_v", "electron_beam_divergence_h", "electron_beam_divergence_v",
+                                "auto_expand", "type_of_initialization", "moment_x", "moment_y", "moment_z", "moment_xp", "moment_yp",
+                                "source_dimension_wf_h_slit_gap", "source_dimension_wf_v_slit_gap",
+                                "source_dimension_wf_h_slit_c", "source_dimension_wf_v_slit_c",
+                                "source_dimension_wf_h_slit_points", "source_dimension_wf_v_slit_points", "source_dimension_wf_distance",
+                                "horizontal_range_modification_factor_at_resizing", "horizontal_resolution_modification_factor_at_resizing",
+                                "vertical_range_modification_factor_at_resizing", "vertical_resolution_modification_factor_at_resizing",
+                                "waist_position_calculation", "waist_position_user_defined", "waist_position",
+                                "save_srw_result", "source_dimension_srw_file", "angular_distribution_srw_file",
+                                "srw_precision", "srw_relative_precision", "srw_trajectory_points", "srw_sampling_factor"]
+
+__srw_distributions_cache = LRUCache(max_size=20)
+
+
+def __get_harmonic_numbers(widget):
+    return __parse_harmonic_numbers(widget.harmonic_numbers, "Harmonics #")
+
+
+def __parse_harmonic_numbers(harmonic_numbers, field_name):
+    try:
+        harmonic_numbers = [int(token) for token in str(harmonic_numbers).replace(";", ",").split(",") if token.strip() != ""]
+    except ValueError:
+        raise ValueError(field_name + " must be a comma separated list of integer numbers")
+
+    if len(harmonic_numbers) == 0: raise ValueError(field_name + " is empty")
+    for harmonic in harmonic_numbers: congruence.checkStrictlyPositiveNumber(harmonic, "Harmonic #")
+
+    return sorted(set(harmonic_numbers))
+
+
+def __split_number_of_rays(number_of_rays, flux):
+    # largest remainder: the whole number of rays is distributed proportionally to the flux
+    nr_rays = number_of_rays * flux / numpy.sum(flux)
+    nr_rays_array = numpy.floor(nr_rays).astype(int)
+    remainder = int(number_of_rays - numpy.sum(nr_rays_array))
+    if remainder > 0: nr_rays_array[numpy.argsort(nr_rays_array - nr_rays)[:remainder]] += 1
+
+    return nr_rays_array
+
+
+def __get_SRW_calculation_state(widget):
+    return SimpleNamespace(**{name: getattr(widget, name) for name in __SRW_CALCULATION_ATTRIBUTES})
+
+
+def __get_SRW_cache_key(widget, energy):
+    return tuple([getattr(widget, name) for name in __SRW_CALCULATION_ATTRIBUTES] + [round(energy, 6)])
+
+
+def __run_SRW_calculation_for_energy(widget, energy):
+    flux_from_stokes = __get_integrated_flux_from_stokes(widget, [energy])[0]
+
+    x, z, intensity_source_dimension, x_first, z_first, intensity_angular_distribution, _, _ = __run_SRW_calculation(widget,
+                                                                                                                    energy,
+                                                                                                                    flux_from_stokes=flux_from_stokes,
+                                                                                                                    do_cumulated_calculations=False)
+
+    return flux_from_stokes, x, z, intensity_source_dimension, x_first, z_first, intensity_angular_distribution
+
+
+def __get_SRW_distributions_for_energies(widget, energies):
+    __check_SRW_fields(widget)
+    __calculate_waist_position(widget, energies[0])  # the waist position does not depend on the energy when not automatic
+
+    # random initial conditions and files written by SRW cannot be shared among energies nor processes
+    use_cache = widget.type_of_initialization != 2 and widget.save_srw_result == 0
+
+    keys = [__get_SRW_cache_key(widget, energy) for energy in energies]
+    srw_distributions = [__srw_distributions_cache.get(key) if use_cache else None for key in keys]
+    to_be_computed = [i for i in range(len(energies)) if srw_distributions[i] is None]
+
+    if widget.harmonics_in_parallel == 1 and use_cache and len(to_be_computed) > 1:
+        state = __get_SRW_calculation_state(widget)
+
+        with ProcessPoolExecutor(max_workers=min(len(to_be_computed), os.cpu_count() or 1), mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = [executor.submit(__run_SRW_calculation_for_energy, state, energies[i]) for i in to_be_computed]
+
+            for i, future in zip(to_be_computed, futures): srw_distributions[i] = future.result()
+    else:
+        for i in to_be_computed: srw_distributions[i] = __run_SRW_calculation_for_energy(widget, energies[i])
+
+    if use_cache:
+        for i in to_be_computed: __srw_distributions_cache[keys[i]] = srw_distributions[i]
+
+    return srw_distributions
+
+
+####################################################################################
+# TUNING CURVE
+####################################################################################
+
+__tuning_curve_cache = LRUCache(max_size=2000)
+__TUNING_CURVE_MIN_PARALLEL_POINTS = 4 # below, starting the (spawned) workers costs more than it saves
+
+
+def __check_tuning_curve_fields(widget):
+    if widget.distribution_source != 0: raise ValueError("Tuning curve can be computed only for explicit SRW Calculation")
+
+    congruence.checkStrictlyPositiveNumber(widget.tuning_from, "Scan From")
+    congruence.checkStrictlyPositiveNumber(widget.tuning_to, "Scan To")
+    congruence.checkGreaterThan(widget.tuning_to, widget.tuning_from, "Scan To", "Scan From")
+    congruence.checkStrictlyPositiveNumber(widget.tuning_points, "Nr. of Points")
+    congruence.checkDir(widget.tuning_file_name)
+    congruence.checkPositiveNumber(widget.tuning_processes, "Processes")
+
+    __check_SRW_fields(widget)
+
+
+def __run_tuning_curve_point(state, energy, compute_distributions):
+    flux = __get_integrated_flux_from_stokes(state, [energy])[0]
+
+    if compute_distributions:
+        x, z, intensity_source_dimension, x_first, z_first, intensity_angular_distribution, _, _ = __run_SRW_calculation(state,
+                                                                                                                        energy,
+                                                                                                                        flux_from_stokes=flux,
+                                                                                                                        do_cumulated_calculations=False)
+        sigma_x  = get_sigma(numpy.sum(intensity_source_dimension, axis=1), x) * state.workspace_units_to_m
+        sigma_z  = get_sigma(numpy.sum(intensity_source_dimension, axis=0), z) * state.workspace_units_to_m
+        sigma_xp = get_sigma(numpy.sum(intensity_angular_distribution, axis=1), x_first)
+        sigma_zp = get_sigma(numpy.sum(intensity_angular_distribution, axis=0), z_first)
+    else:
+        sigma_x = sigma_z = sigma_xp = sigma_zp = numpy.nan
+
+    return flux, sigma_x, sigma_z, sigma_xp, sigma_zp
+
+
+def __calculate_tuning_curve(widget):
+    __check_tuning_curve_fields(widget)
+
+    scan_values = numpy.linspace(widget.tuning_from, widget.tuning_to, int(widget.tuning_points))
+    K = scan_values if widget.tuning_scan_variable == 0 else K_from_magnetic_field(widget, scan_values)
+
+    if widget.tuning_direction == TuningDirection.VERTICAL:
+        Kv, Kh = K, numpy.zeros(len(K))
+    elif widget.tuning_direction == TuningDirection.HORIZONTAL:
+        Kv, Kh = numpy.zeros(len(K)), K
+    else:
+        Kv = Kh = K / numpy.sqrt(2)
+
+    harmonic_numbers = __parse_harmonic_numbers(widget.tuning_harmonics, "Tuning Harmonics #")
+    energies = resonance_energies(widget, Kv, Kh, harmonic_numbers)
+    compute_distributions = widget.tuning_compute_distributions == 1
+
+    # every point is an independent SRW calculation on a copy of the current state
+    base_state = __get_SRW_calculation_state(widget)
+    base_state.magnetic_field_from = 0
+    base_state.use_stokes = 1
+    base_state.compute_power = False
+    base_state.save_srw_result = 0
+    base_state.waist_position_calculation = 2
+    base_state.waist_position_user_defined = __get_last_waist_position(widget)
+
+    use_cache = widget.type_of_initialization != 2
+
+    points = []
+    for i in range(len(K)):
+        for j in range(len(harmonic_numbers)):
+            state = SimpleNamespace(**vars(base_state))
+            state.Kv = Kv[i]
+            state.Kh = Kh[i]
+
+            points.append((i, j, state, (__get_SRW_cache_key(state, energies[i, j]), compute_distributions)))
+
+    results = {}
+    if use_cache:
+        for i, j, _, key in points:
+            result = __tuning_curve_cache.get(key)
+            if not result is None: results[(i, j)] = result
+
+    to_be_computed = [point for point in points if not (point[0], point[1]) in results]
+
+    widget.setStatusMessage("Computing tuning curve: " + str(len(to_be_computed)) + " SRW calculations")
+
+    n_processes = int(widget.tuning_processes) if int(widget.tuning_processes) > 0 else (os.cpu_count() or 1)
+    n_processes = max(1, min(n_processes, len(to_be_computed)))
+
+    if n_processes > 1 and len(to_be_computed) >= __TUNING_CURVE_MIN_PARALLEL_POINTS:
+        with ProcessPoolExecutor(max_workers=n_processes, mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = [executor.submit(__run_tuning_curve_point, state, energies[i, j], compute_distributions) for i, j, state, _ in to_be_computed]
+
+            for index, ((i, j, _, _), future) in enumerate(zip(to_be_computed, futures)):
+                results[(i, j)] = future.result()
+                widget.progressBarSet(100 * (index + 1) / len(to_be_computed))
+    else:
+        for index, (i, j, state, _) in enumerate(to_be_computed):
+            results[(i, j)] = __run_tuning_curve_point(state, energies[i, j], compute_distributions)
+            widget.progressBarSet(100 * (index + 1) / len(to_be_computed))
+
+    if use_cache:
+        for i, j, _, key in to_be_computed: __tuning_curve_cache[key] = results[(i, j)]
+
+    tuning_curve = {"Kv"        : Kv,
+                    "Kh"        : Kh,
+                    "harmonics" : numpy.array(harmonic_numbers),
+                    "energy"    : energies}
+
+    for index, name in enumerate(["flux", "sigma_x", "sigma_z", "sigma_xp", "sigma_zp"]):
+        tuning_curve[name] = numpy.array([[results[(i, j)][index] for j in range(len(harmonic_numbers))] for i in range(len(K))])
+
+    if not compute_distributions:
+        for name in ["sigma_x", "sigma_z", "sigma_xp", "sigma_zp"]: del tuning_curve[name]
+
+    widget.setStatusMessage("Writing tuning curve file")
+
+    with h5py.File(widget.tuning_file_name, "w") as tuning_file:
+        group = tuning_file.create_group("tuning_curve")
+        group.attrs["scan_variable"] = "K" if widget.tuning_scan_variable == 0 else "B"
+        group.attrs["undulator_period"] = widget.undulator_period
+        group.attrs["number_of_periods"] = widget.number_of_periods
+        group.attrs["electron_energy_in_GeV"] = widget.electron_energy_in_GeV
+        group.attrs["ring_current"] = widget.ring_current
+        group["scan_values"] = scan_values
+
+        for name, value in tuning_curve.items(): group[name] = value
+
+        group["energy"].attrs["units"] = "eV"
+        group["flux"].attrs["units"] = "ph/s/0.1%bw"
+
+        if compute_distributions:
+            for name in ["sigma_x", "sigma_z"]:   group[name].attrs["units"] = "m"
+            for name in ["sigma_xp", "sigma_zp"]: group[name].attrs["units"] = "rad"
+
+    return tuning_curve
+
+
 ####################################################################################
 # SRW FILES
 ####################################################################################
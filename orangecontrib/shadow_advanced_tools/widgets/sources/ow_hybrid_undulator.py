@@ -170,7 +170,7 @@ class HybridUndulator(GenericElement, HybridUndulatorAttributes):
         oasysgui.lineEdit(left_box_1, self, "seed", "Seed", tooltip="Seed (0=clock)", labelWidth=250, valueType=int, orientation="horizontal")
 
         gui.comboBox(left_box_1, self, "use_harmonic", label="Photon Energy Setting",
-                     items=["Harmonic", "Other", "Range"], labelWidth=260,
+                     items=["Harmonic", "Other", "Range", "Harmonics"], labelWidth=260,
                      callback=self.set_WFUseHarmonic, sendSelectedValue=False, orientation="horizontal")
 
         self.use_harmonic_box_1 = oasysgui.widgetBox(left_box_1, "", addSpace=False, orientation="vertical", height=80)
@@ -188,11 +188,25 @@ class HybridUndulator(GenericElement, HybridUndulatorAttributes):
         self.use_harmonic_box_2 = oasysgui.widgetBox(left_box_1, "", addSpace=False, orientation="vertical", height=80)
         oasysgui.lineEdit(self.use_harmonic_box_2, self, "energy", "Photon Energy [eV]", labelWidth=260, valueType=float, orientation="horizontal")
 
-        self.use_harmonic_box_3 = oasysgui.widgetBox(left_box_1, "", addSpace=False, orientation="vertical", height=80)
+        self.use_harmonic_box_3 = oasysgui.widgetBox(left_box_1, "", addSpace=False, orientation="vertical", height=135)
         oasysgui.lineEdit(self.use_harmonic_box_3, self, "energy", "Photon Energy from [eV]", labelWidth=260, valueType=float, orientation="horizontal")
         oasysgui.lineEdit(self.use_harmonic_box_3, self, "energy_to", "Photon Energy to [eV]", labelWidth=260, valueType=float, orientation="horizontal")
         oasysgui.lineEdit(self.use_harmonic_box_3, self, "energy_points", "Nr. of Energy values", labelWidth=260, valueType=int, orientation="horizontal")
 
+        gui.comboBox(self.use_harmonic_box_3, self, "save_range_distributions", label="Save SRW Distributions (HDF5)", labelWidth=260,
+                     items=["No", "Yes"], callback=self.set_SaveRangeDistributions, sendSelectedValue=False, orientation="horizontal")
+
+        self.range_distributions_file_box = oasysgui.widgetBox(self.use_harmonic_box_3, "", addSpace=False, orientation="horizontal", height=25)
+        self.le_range_distributions_file = oasysgui.lineEdit(self.range_distributions_file_box, self, "range_distributions_file", "File Name", labelWidth=100, valueType=str, orientation="horizontal")
+        gui.button(self.range_distributions_file_box, self, "...", callback=self.selectRangeDistributionsFile)
+
+        self.set_SaveRangeDistributions()
+
+        self.use_harmonic_box_4 = oasysgui.widgetBox(left_box_1, "", addSpace=False, orientation="vertical", height=80)
+        oasysgui.lineEdit(self.use_harmonic_box_4, self, "harmonic_numbers", "Harmonics # (comma separated)", labelWidth=200, valueType=str, orientation="horizontal")
+        gui.comboBox(self.use_harmonic_box_4, self, "harmonics_in_parallel", label="Parallel SRW Calculation", labelWidth=260,
+                     items=["No", "Yes"], sendSelectedValue=False, orientation="horizontal")
+
         self.set_WFUseHarmonic()
 
         polarization_box = oasysgui.widgetBox(tab_shadow, "Polarization", addSpace=False, orientation="vertical", height=140)
@@ -278,6 +292,30 @@ class HybridUndulator(GenericElement, HybridUndulatorAttributes):
                      items=["From Wavefront", "From Stokes"],
                      sendSelectedValue=False, orientation="horizontal")
 
+        box = oasysgui.widgetBox(tab_fl, "Electron Trajectory", addSpace=False, orientation="vertical")
+
+        gui.comboBox(box, self, "reuse_electron_trajectory", label="Electron Trajectory", labelWidth=250,
+                     items=["Compute at every call", "Compute once and reuse"],
+                     sendSelectedValue=False, orientation="horizontal")
+
+        box = oasysgui.widgetBox(tab_fl, "SRW Precision", addSpace=False, orientation="vertical")
+
+        gui.comboBox(box, self, "srw_precision", label="Precision", labelWidth=250,
+                     items=BL.Precision.NAMES, callback=self.set_SRWPrecision,
+                     sendSelectedValue=False, orientation="horizontal")
+
+        self.srw_precision_box_1 = oasysgui.widgetBox(box, "", addSpace=False, orientation="vertical", height=80)
+        oasysgui.lineEdit(self.srw_precision_box_1, self, "srw_relative_precision", "Relative Precision", labelWidth=260, valueType=float, orientation="horizontal")
+        oasysgui.lineEdit(self.srw_precision_box_1, self, "srw_trajectory_points", "Nr. of Trajectory Points", labelWidth=260, valueType=int, orientation="horizontal")
+        oasysgui.lineEdit(self.srw_precision_box_1, self, "srw_sampling_factor", "Sampling Factor for Propagation", labelWidth=260, valueType=float, orientation="horizontal")
+
+        self.set_SRWPrecision()
+
+        box = oasysgui.widgetBox(box, "", addSpace=False, orientation="horizontal")
+
+        oasysgui.lineEdit(box, self, "calibration_tolerance", "Tolerance", labelWidth=70, valueType=float, orientation="horizontal")
+        gui.button(box, self, "Calibrate Precision", callback=self.calibrate_srw_precision)
+
         ####################################
 
         tab_und = oasysgui.tabWidget(tab_ls)
@@ -472,6 +510,27 @@ class HybridUndulator(GenericElement, HybridUndulatorAttributes):
         gui.button(button_box, self, "Set Kh value", callback=self.auto_set_undulator_H)
         gui.button(button_box, self, "Set Both K values", callback=self.auto_set_undulator_B)
 
+        left_box_2 = oasysgui.widgetBox(tab_util, "Tuning Curve", addSpace=False, orientation="vertical")
+
+        gui.comboBox(left_box_2, self, "tuning_scan_variable", label="Scan Variable", labelWidth=250,
+                     items=["K", "Magnetic Field [T]"], sendSelectedValue=False, orientation="horizontal")
+        gui.comboBox(left_box_2, self, "tuning_direction", label="Direction", labelWidth=250,
+                     items=["Vertical", "Horizontal", "Both"], sendSelectedValue=False, orientation="horizontal")
+        oasysgui.lineEdit(left_box_2, self, "tuning_from", "Scan From", labelWidth=250, valueType=float, orientation="horizontal")
+        oasysgui.lineEdit(left_box_2, self, "tuning_to", "Scan To", labelWidth=250, valueType=float, orientation="horizontal")
+        oasysgui.lineEdit(left_box_2, self, "tuning_points", "Nr. of Points", labelWidth=250, valueType=int, orientation="horizontal")
+        oasysgui.lineEdit(left_box_2, self, "tuning_harmonics", "Harmonics # (comma separated)", labelWidth=200, valueType=str, orientation="horizontal")
+        gui.comboBox(left_box_2, self, "tuning_compute_distributions", label="Compute Source Sizes/Divergences", labelWidth=250,
+                     items=["No", "Yes"], sendSelectedValue=False, orientation="horizontal")
+
+        file_box = oasysgui.widgetBox(left_box_2, "", addSpace=False, orientation="horizontal", height=25)
+        self.le_tuning_file_name = oasysgui.lineEdit(file_box, self, "tuning_file_name", "Output File", labelWidth=100, valueType=str, orientation="horizontal")
+        gui.button(file_box, self, "...", callback=self.selectTuningFile)
+
+        oasysgui.lineEdit(left_box_2, self, "tuning_processes", "Processes (0=all CPUs)", labelWidth=250, valueType=int, orientation="horizontal")
+
+        gui.button(left_box_2, self, "Compute Tuning Curve", callback=self.calculate_tuning_curve)
+
         gui.rubber(self.controlArea)
 
         cumulated_plot_tab = oasysgui.createTabPage(self.main_tabs, "Cumulated Plots")
@@ -699,6 +758,26 @@ class HybridUndulator(GenericElement, HybridUndulatorAttributes):
 
         self.set_WFUseHarmonic()
 
+    def selectTuningFile(self):
+        file_name = oasysgui.selectSaveFileFromDialog(self, "Save Tuning Curve", default_file_name=self.tuning_file_name, file_extension_filter="HDF5 Files (*.hdf5 *.h5 *.hdf)")
+        if not file_name is None: self.le_tuning_file_name.setText(file_name)
+
+    def calculate_tuning_curve(self):
+        self.setStatusMessage("")
+        self.progressBarInit()
+
+        try:
+            BL.calculate_tuning_curve(self)
+
+            QMessageBox.information(self, "Tuning Curve", "Tuning curve saved into file: " + self.tuning_file_name, QMessageBox.Ok)
+        except Exception as exception:
+            QMessageBox.critical(self, "Error", str(exception), QMessageBox.Ok)
+
+            if self.IS_DEVELOP: raise exception
+
+        self.setStatusMessage("")
+        self.progressBarFinished()
+
     class ShowHelpDialog(QDialog):
 
         def __init__(self, parent=None):
@@ -739,9 +818,31 @@ class HybridUndulator(GenericElement, HybridUndulatorAttributes):
         self.use_harmonic_box_1.setVisible(self.use_harmonic==0)
         self.use_harmonic_box_2.setVisible(self.use_harmonic==1)
         self.use_harmonic_box_3.setVisible(self.use_harmonic==2)
+        self.use_harmonic_box_4.setVisible(self.use_harmonic==3)
 
         self.set_harmonic_energy()
 
+    def set_SRWPrecision(self):
+        self.srw_precision_box_1.setVisible(self.srw_precision==BL.Precision.USER_DEFINED)
+
+    def calibrate_srw_precision(self):
+        self.setStatusMessage("")
+        self.progressBarInit()
+
+        try:
+            report = BL.calibrate_srw_precision(self)
+
+            self.set_SRWPrecision()
+
+            QMessageBox.information(self, "SRW Precision Calibration", report, QMessageBox.Ok)
+        except Exception as exception:
+            QMessageBox.critical(self, "Error", str(exception), QMessageBox.Ok)
+
+            if self.IS_DEVELOP: raise exception
+
+        self.setStatusMessage("")
+        self.progressBarFinished()
+
     def set_DistributionSource(self):
         self.srw_box.setVisible(self.distribution_source == 0)
         self.srw_files_box.setVisible(self.distribution_source == 1)
@@ -767,6 +868,13 @@ class HybridUndulator(GenericElement, HybridUndulatorAttributes):
     def selectOptimizeFile(self):
         self.le_optimize_file_name.setText(oasysgui.selectFileFromDialog(self, self.optimize_file_name, "Open Optimize Source Parameters File"))
 
+    def set_SaveRangeDistributions(self):
+        self.range_distributions_file_box.setEnabled(self.save_range_distributions==1)
+
+    def selectRangeDistributionsFile(self):
+        file_name = oasysgui.selectSaveFileFromDialog(self, "Save SRW Distributions", default_file_name=self.range_distributions_file, file_extension_filter="HDF5 Files (*.hdf5 *.h5 *.hdf)")
+        if not file_name is None: self.le_range_distributions_file.setText(file_name)
+
     def selectSourceDimensionFile(self):
         self.le_source_dimension_srw_file.setText(oasysgui.selectFileFromDialog(self, self.source_dimension_srw_file, "Open Source Dimension File"))
 
@@ -868,6 +976,7 @@ class HybridUndulator(GenericElement, HybridUndulatorAttributes):
                 additional_parameters["photon_energy_step"] = self.energy_step
                 additional_parameters["current_step"]       = self.current_step
                 additional_parameters["total_steps"]        = self.total_steps
+                additional_parameters["seed"]               = self.seed
 
                 beam_out.setScanningData(ShadowBeam.ScanningData("photon_energy", self.energy, "Energy for Power Calculation", "eV", additional_parameters))
 
@@ -961,7 +1070,9 @@ class HybridUndulator(GenericElement, HybridUndulatorAttributes):
         if trigger and trigger.new_object == True:
             do_cumulated_calculations = False
 
-            if trigger.has_additional_parameter("seed_increment"):
+            if trigger.has_additional_parameter("seed"): # resume of a loop from a checkpoint
+                self.seed = trigger.get_additional_parameter("seed")
+            elif trigger.has_additional_parameter("seed_increment"):
                 self.seed += trigger.get_additional_parameter("seed_increment")
 
             if not trigger.has_additional_parameter("start_event"):
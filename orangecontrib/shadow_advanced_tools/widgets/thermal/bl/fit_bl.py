@@ -0,0 +1,470 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# #########################################################################
+# Copyright (c) 2026, UChicago Argonne, LLC. All rights reserved.         #
+#                                                                         #
+# Copyright 2026. UChicago Argonne, LLC. This software was produced       #
+# under U.S. Government contract DE-AC02-06CH11357 for Argonne National   #
+# Laboratory (ANL), which is operated by UChicago Argonne, LLC for the    #
+# U.S. Department of Energy. The U.S. Government has rights to use,       #
+# reproduce, and distribute this software.  NEITHER THE GOVERNMENT NOR    #
+# UChicago Argonne, LLC MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR        #
+# ASSUMES ANY LIABILITY FOR THE USE OF THIS SOFTWARE.  If software is     #
+# modified to produce derivative works, such modified software should     #
+# be clearly marked, so as not to confuse it with the version available   #
+# from ANL.                                                               #
+#                                                                         #
+# Additionally, redistribution and use in source and binary forms, with   #
+# or without modification, are permitted provided that the following      #
+# conditions are met:                                                     #
+#                                                                         #
+#     * Redistributions of source code must retain the above copyright    #
+#       notice, this list of conditions and the following disclaimer.     #
+#                                                                         #
+#     * Redistributions in binary form must reproduce the above copyright #
+#       notice, this list of conditions and the following disclaimer in   #
+#       the documentation and/or other materials provided with the        #
+#       distribution.                                                     #
+#                                                                         #
+#     * Neither the name of UChicago Argonne, LLC, Argonne National       #
+#       Laboratory, ANL, the U.S. Government, nor the names of its        #
+#       contributors may be used to endorse or promote products derived   #
+#       from this software without specific prior written permission.     #
+#                                                                         #
+# THIS SOFTWARE IS PROVIDED BY UChicago Argonne, LLC AND CONTRIBUTORS     #
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT       #
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS       #
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL UChicago     #
+# Argonne, LLC OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,        #
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,    #
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;        #
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER        #
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT      #
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN       #
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE         #
+# POSSIBILITY OF SUCH DAMAGE.                                             #
+# #########################################################################
+
+
+import numpy
+import os, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from scipy.optimize import least_squares
+import h5py
+
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_density_io_bl import is_power_density_file
+from orangecontrib.shadow_advanced_tools.util.lru_cache import LRUCache
+
+####################################################################################
+# SEPARABLE FITS: c + A * p(x) * p(y)
+####################################################################################
+
+FWHM_TO_SIGMA = 1/2.355
+
+class FitModel:
+    GAUSSIAN     = 0
+    PSEUDO_VOIGT = 1
+    POLYNOMIAL   = 2
+
+    @classmethod
+    def get_name(cls, model):
+        return ["gaussian", "pseudo_voigt", "polynomial"][model]
+
+def fit_separable(model, xx, yy, pd, guess_params=None, bounds=None, seed_from_projections=True):
+    """
+    Least squares fit of pd[y, x] (as plotted) with c + A * p(x) * p(y), p gaussian or pseudo-voigt. Parameters
+    are ordered as: c, A, center_x, center_y, fwhm_x, fwhm_y (, mixing_x, mixing_y).
+    Every column of the Jacobian is the outer product of two 1D factors: the normal equations are built from them
+    (see __separable_least_squares), the m*n x n_params Jacobian is never formed nor factorised. Without guess
+    parameters, the fit is seeded by 1D fits of the two projections.
+    """
+    profile, n_profile = __get_profile(model)
+
+    xx = numpy.asarray(xx, dtype=float)
+    yy = numpy.asarray(yy, dtype=float)
+    pd = numpy.asarray(pd, dtype=float)
+
+    if guess_params is None: guess_params = __guess_params(profile, n_profile, xx, yy, pd, seed_from_projections)
+    if bounds is None:       bounds = __default_bounds(n_profile)
+
+    lower, upper = numpy.asarray(bounds[0], dtype=float), numpy.asarray(bounds[1], dtype=float)
+    x0           = numpy.clip(numpy.asarray(guess_params, dtype=float), lower, upper)
+    on_lower     = numpy.isfinite(lower) & (x0 <= lower) & (upper > lower) # start inside the bounds (e.g. fwhm > 0)
+    on_upper     = numpy.isfinite(upper) & (x0 >= upper) & (upper > lower)
+
+    low, up      = lower[on_lower], upper[on_lower]
+    x0[on_lower] = low + 1e-3*(numpy.minimum(up, low + 1.0) - low)
+    low, up      = lower[on_upper], upper[on_upper]
+    x0[on_upper] = up - 1e-3*(up - numpy.maximum(low, up - 1.0))
+
+    x_indices = [2, 4, 6][:n_profile]
+    y_indices = [3, 5, 7][:n_profile]
+    n_params  = 2 + 2*n_profile
+
+    def residuals(p):
+        px, _ = profile(xx, *p[x_indices])
+        py, _ = profile(yy, *p[y_indices])
+
+        residual = numpy.outer(py, px)
+        residual *= p[1]
+        residual += p[0]
+        residual -= pd
+
+        return residual
+
+    def jacobian_factors(p):
+        # column k of the Jacobian is outer(y_factors[:, k], x_factors[:, k])
+        px, dpx = profile(xx, *p[x_indices], derivatives=True)
+        py, dpy = profile(yy, *p[y_indices], derivatives=True)
+
+        x_factors = numpy.empty((len(xx), n_params))
+        y_factors = numpy.empty((len(yy), n_params))
+
+        x_factors[:, 0], y_factors[:, 0] = 1.0, 1.0
+        x_factors[:, 1], y_factors[:, 1] = px, py
+        for derivative, index in zip(dpx, x_indices): x_factors[:, index], y_factors[:, index] = p[1]*derivative, py
+        for derivative, index in zip(dpy, y_indices): x_factors[:, index], y_factors[:, index] = px, p[1]*derivative
+
+        return y_factors, x_factors
+
+    return __separable_least_squares(residuals, jacobian_factors, x0, lower, upper)
+
+def __separable_least_squares(residuals, jacobian_factors, x0, lower, upper, ftol=1e-10, xtol=1e-10, max_iterations=None):
+    """
+    Levenberg-Marquardt for 2D residuals whose Jacobian columns are outer products Y[:, k] x X[:, k]:
+    J^T J = (Y^T Y) * (X^T X) and J^T r = sum((R X) * Y, axis=0). An iteration costs one m*n residual and one
+    m*n x n_params product. As in trf, the iterates stay strictly inside the bounds: a step crossing a bound stops
+    short of it (fwhm = 0 would be degenerate).
+    """
+    p        = numpy.array(x0, dtype=float)
+    residual = residuals(p)
+    cost     = 0.5*numpy.vdot(residual, residual)
+    damping  = 1.0
+    scale    = None
+
+    if max_iterations is None: max_iterations = 100*len(p)
+
+    for _ in range(max_iterations):
+        y_factors, x_factors = jacobian_factors(p)
+
+        normal   = (y_factors.T @ y_factors)*(x_factors.T @ x_factors)
+        gradient = numpy.sum((residual @ x_factors)*y_factors, axis=0)
+
+        # Coleman-Li scaling: the distance to the bound the gradient points to
+        distance = numpy.ones_like(p)
+        to_upper = (gradient < 0) & numpy.isfinite(upper)
+        to_lower = (gradient > 0) & numpy.isfinite(lower)
+        distance[to_upper] = upper[to_upper] - p[to_upper]
+        distance[to_lower] = p[to_lower] - lower[to_lower]
+        d = numpy.sqrt(distance)
+
+        # damping on the running maximum of the diagonal (as MINPACK): it does not vanish with the amplitude
+        scaled_normal = normal*numpy.outer(d, d)
+        scale         = numpy.diag(scaled_normal) if scale is None else numpy.maximum(scale, numpy.diag(scaled_normal))
+        scale         = numpy.maximum(scale, 1e-15*max(scale.max(), numpy.finfo(float).tiny))
+
+        while True:
+            try:
+                trial = p - d*numpy.linalg.solve(scaled_normal + damping*numpy.diag(scale), d*gradient)
+            except numpy.linalg.LinAlgError:
+                damping *= 10.0
+                if damping > 1e16: return p
+                continue
+
+            below, above  = trial < lower, trial > upper
+            trial[below]  = lower[below] + 0.005*(p[below] - lower[below])
+            trial[above]  = upper[above] - 0.005*(upper[above] - p[above])
+            step          = trial - p
+            small_step    = numpy.all(numpy.abs(step) <= xtol*(xtol + numpy.abs(p))) # per parameter: mixed magnitudes
+
+            trial_residual = residuals(trial)
+            trial_cost     = 0.5*numpy.vdot(trial_residual, trial_residual)
+
+            if trial_cost < cost: break
+
+            damping *= 10.0
+            if small_step or damping > 1e16: return p
+
+        # gain ratio between the actual and the predicted (linear model) reduction: damping update as by Nielsen
+        reduction = cost - trial_cost
+        predicted = -(numpy.dot(gradient, step) + 0.5*numpy.dot(step, normal @ step))
+        ratio     = reduction/predicted if predicted > 0 else 0.0
+
+        p, residual, cost = trial, trial_residual, trial_cost
+        damping = max(damping*max(1/3, 1 - (2*ratio - 1)**3), 1e-12)
+
+        if small_step or (reduction <= ftol*cost and ratio > 0.25): break # termination tests of trf
+
+    return p
+
+def evaluate_separable(model, xx, yy, params):
+    profile, n_profile = __get_profile(model)
+
+    px, _ = profile(numpy.asarray(xx, dtype=float), *params[2:2+2*n_profile:2])
+    py, _ = profile(numpy.asarray(yy, dtype=float), *params[3:3+2*n_profile:2])
+
+    return params[0] + params[1]*numpy.outer(py, px)
+
+def __get_profile(model):
+    if   model == FitModel.GAUSSIAN:     return __gaussian_profile, 2
+    elif model == FitModel.PSEUDO_VOIGT: return __pseudovoigt_profile, 3
+    else: raise ValueError("Fit model not recognized: " + str(model))
+
+def __gaussian_profile(u, center, fwhm, derivatives=False):
+    sigma    = fwhm*FWHM_TO_SIGMA
+    distance = u - center
+    profile  = numpy.exp(-0.5*(distance/sigma)**2)
+
+    if not derivatives: return profile, None
+
+    return profile, [profile*distance/sigma**2,                      # d/d center
+                     profile*distance**2/sigma**3*FWHM_TO_SIGMA]     # d/d fwhm
+
+def __pseudovoigt_profile(u, center, fwhm, mixing, derivatives=False):
+    sigma    = fwhm*FWHM_TO_SIGMA
+    gamma    = fwhm/2
+    distance = u - center
+
+    gaussian   = numpy.exp(-0.5*(distance/sigma)**2)
+    denominator = distance**2 + gamma**2
+    lorentzian = gamma**2/denominator
+    profile    = mixing*gaussian + (1 - mixing)*lorentzian
+
+    if not derivatives: return profile, None
+
+    return profile, [mixing*gaussian*distance/sigma**2 + (1 - mixing)*2*gamma**2*distance/denominator**2,                  # d/d center
+                     mixing*gaussian*distance**2/sigma**3*FWHM_TO_SIGMA + (1 - mixing)*gamma*distance**2/denominator**2,  # d/d fwhm
+                     gaussian - lorentzian]                                                                              # d/d mixing
+
+def __default_bounds(n_profile):
+    lower = [0, 0, -numpy.inf, -numpy.inf, 0, 0] + [0, 0][:2*(n_profile-2)]
+    upper = [numpy.inf]*6 + [1, 1][:2*(n_profile-2)]
+
+    return [lower, upper]
+
+def __guess_params(profile, n_profile, xx, yy, pd, seed_from_projections):
+    params_x = __guess_profile(profile, n_profile, xx, pd.sum(axis=0), seed_from_projections)
+    params_y = __guess_profile(profile, n_profile, yy, pd.sum(axis=1), seed_from_projections)
+
+    guess = [0.0, max(pd.max(), 0.0)]
+    for param_x, param_y in zip(params_x, params_y): guess += [param_x, param_y]
+
+    return guess
+
+def __guess_profile(profile, n_profile, u, histogram, seed_from_projections):
+    # moments of the projection, refined by a 1D fit of b * p(u)
+    weights = numpy.maximum(histogram, 0.0)
+    total   = weights.sum()
+
+    if total > 0:
+        center = numpy.sum(u*weights)/total
+        fwhm   = numpy.sqrt(numpy.sum((u - center)**2*weights)/total)/FWHM_TO_SIGMA
+    else:
+        center = 0.5*(u[0] + u[-1])
+        fwhm   = 0.5*abs(u[-1] - u[0])
+
+    fwhm   = max(fwhm, abs(u[1] - u[0]) if len(u) > 1 else 1.0)
+    params = [center, fwhm] + [0.5]*(n_profile - 2)
+
+    if not seed_from_projections or total <= 0 or len(u) <= n_profile + 1: return params
+
+    def residuals(p):
+        return p[0]*profile(u, *p[1:])[0] - histogram
+
+    def jacobian(p):
+        value, derivatives = profile(u, *p[1:], derivatives=True)
+
+        return numpy.array([value] + [p[0]*derivative for derivative in derivatives]).T
+
+    lower = [0, -numpy.inf, 0] + [0]*(n_profile - 2)
+    upper = [numpy.inf, numpy.inf, numpy.inf] + [1]*(n_profile - 2)
+
+    try:
+        return list(least_squares(fun=residuals, x0=[max(histogram.max(), 1e-12)] + params, jac=jacobian, bounds=(lower, upper)).x[1:])
+    except Exception:
+        return params
+
+####################################################################################
+# POLYNOMIAL FITS: sum c[i, j] x^i y^j (polyval2d convention)
+####################################################################################
+
+def fit_polynomial_surface(xx, yy, pd, degree=4, weights=None, non_negative_constant=True):
+    """
+    Linear least squares fit of pd[y, x] (as plotted) with a 2D polynomial, returns the (degree+1)**2 coefficients
+    c[i, j] of x^i y^j, raveled. On the full grid the Vandermonde matrix is the Kronecker product of the 1D ones:
+    the problem is reduced through their (cached) QR factors to a (degree+1)**2 square system. With weights the
+    full 2D basis is used. If c[0, 0] comes out negative, it is fixed to 0 (the bound is active) and the system
+    is solved again without it.
+    """
+    xx = numpy.asarray(xx, dtype=float)
+    yy = numpy.asarray(yy, dtype=float)
+    pd = numpy.asarray(pd, dtype=float)
+
+    degree = int(degree)
+    size   = degree + 1
+
+    if weights is None:
+        q_x, r_x, norm_x = __get_vandermonde_basis(xx, degree)
+        q_y, r_y, norm_y = __get_vandermonde_basis(yy, degree)
+
+        # pd = Vy . C^T . Vx^T  ->  Ry . C^T . Rx^T = Qy^T . pd . Qx
+        matrix = numpy.kron(r_y, r_x)
+        target = numpy.linalg.multi_dot([q_y.T, pd, q_x]).ravel()
+        norm   = numpy.outer(norm_y, norm_x).ravel()
+    else:
+        weights = numpy.sqrt(numpy.broadcast_to(numpy.asarray(weights, dtype=float), pd.shape)).ravel()
+        x, y    = numpy.meshgrid(xx, yy)
+
+        matrix = numpy.polynomial.polynomial.polyvander2d(y.ravel(), x.ravel(), [degree, degree]) # columns: y^j x^i, as C^T
+        norm   = numpy.linalg.norm(matrix, axis=0)
+        norm[norm == 0] = 1.0
+        matrix = matrix*weights[:, numpy.newaxis]/norm
+        target = pd.ravel()*weights
+
+    coefficients = __solve(matrix, target)
+
+    if non_negative_constant and coefficients[0] < 0:
+        coefficients[0]  = 0.0
+        coefficients[1:] = __solve(matrix[:, 1:], target)
+
+    return (coefficients/norm).reshape((size, size)).T.ravel()
+
+def __solve(matrix, target):
+    return numpy.linalg.lstsq(matrix, target, rcond=None)[0]
+
+__vandermonde_cache = LRUCache(max_size=10)
+
+def __get_vandermonde_basis(u, degree):
+    key   = (degree, len(u), u[0], u[-1])
+    basis = __vandermonde_cache.get(key)
+
+    if basis is None:
+        vandermonde = numpy.polynomial.polynomial.polyvander(u, degree)
+        norm        = numpy.linalg.norm(vandermonde, axis=0)
+        norm[norm == 0] = 1.0
+
+        q, r  = numpy.linalg.qr(vandermonde/norm)
+        basis = (q, r, norm)
+
+        for array in basis: array.setflags(write=False)
+
+        __vandermonde_cache[key] = basis
+
+    return basis
+
+####################################################################################
+# BATCH FITS OF AUTOSAVE FILES
+####################################################################################
+
+def get_parameter_names(model, degree=4):
+    if   model == FitModel.GAUSSIAN:     return ["c", "A", "center_x", "center_y", "fwhm_x", "fwhm_y"]
+    elif model == FitModel.PSEUDO_VOIGT: return ["c", "A", "center_x", "center_y", "fwhm_x", "fwhm_y", "mixing_x", "mixing_y"]
+    elif model == FitModel.POLYNOMIAL:   return ["c%d,%d" % (i, j) for i in range(int(degree) + 1) for j in range(int(degree) + 1)]
+    else: raise ValueError("Fit model not recognized: " + str(model))
+
+FIT_TABLES = ["peak", "center_x", "center_y", "fwhm_x", "fwhm_y", "chisquare"]
+
+def fit_power_density_file(file_name, model, degree=4, bounds=None, n_processes=0):
+    """
+    Fits the cumulated plot and every partial plot of an autosave file (PowerDensityHdf5File) and writes the results
+    into the file:
+
+    /fits/<model name>/cumulated     parameters, FIT_TABLES
+    /fits/<model name>/partial       parameters[step, :], FIT_TABLES[step], energy_from, energy_to
+
+    Each plot is read and fitted by a worker process (n_processes=0: one per CPU), the file must not be open for
+    writing. Peak, center and FWHM of the polynomial fits are measured on the fitted surface.
+
+    :return: the tables of the partial results, as a dictionary {name : array}
+    """
+    if not is_power_density_file(file_name): raise ValueError("File " + file_name + " is not a power density autosave file")
+
+    with h5py.File(file_name, "r") as file:
+        if not "power_density" in file: raise ValueError("File " + file_name + " contains no plots")
+
+        n_partial = file["partial_results/histogram"].shape[0] if "partial_results/histogram" in file else 0
+        energy_from = file["partial_results/energy_from"][()] if n_partial > 0 else numpy.zeros(0)
+        energy_to   = file["partial_results/energy_to"][()] if n_partial > 0 else numpy.zeros(0)
+
+    indexes     = [None] + list(range(n_partial)) # None: cumulated
+    n_processes = int(n_processes) if n_processes and int(n_processes) > 0 else (os.cpu_count() or 1)
+    n_processes = max(1, min(n_processes, len(indexes)))
+
+    if n_processes == 1:
+        results = [__fit_power_density(file_name, index, model, degree, bounds) for index in indexes]
+    else:
+        # spawn: the workers do not inherit the state (threads, GUI) of the calling process
+        with ProcessPoolExecutor(max_workers=n_processes, mp_context=multiprocessing.get_context("spawn")) as executor:
+            results = list(executor.map(__fit_power_density, [file_name]*len(indexes), indexes,
+                                        [model]*len(indexes), [degree]*len(indexes), [bounds]*len(indexes),
+                                        chunksize=max(1, len(indexes)//(4*n_processes))))
+
+    n_params = len(get_parameter_names(model, degree))
+    tables   = {"parameters" : numpy.array([result[0] for result in results[1:]]).reshape((n_partial, n_params))}
+    for i, name in enumerate(FIT_TABLES): tables[name] = numpy.array([result[1][i] for result in results[1:]], dtype=float)
+    tables["energy_from"] = energy_from
+    tables["energy_to"]   = energy_to
+
+    with h5py.File(file_name, "a") as file:
+        fits = file.require_group("fits")
+        name = FitModel.get_name(model)
+        if name in fits: del fits[name]
+
+        group = fits.create_group(name)
+        group.attrs["parameter_names"] = get_parameter_names(model, degree)
+        if model == FitModel.POLYNOMIAL: group.attrs["degree"] = int(degree)
+
+        cumulated = group.create_group("cumulated")
+        cumulated.create_dataset("parameters", data=results[0][0])
+        for i, table_name in enumerate(FIT_TABLES): cumulated.create_dataset(table_name, data=results[0][1][i])
+
+        partial = group.create_group("partial")
+        for table_name, table in tables.items(): partial.create_dataset(table_name, data=table)
+
+    return tables
+
+def __fit_power_density(file_name, index, model, degree, bounds):
+    with h5py.File(file_name, "r") as file: # each worker reads only its own plot
+        xx = file["coordinates/X"][()]
+        yy = file["coordinates/Y"][()]
+        pd = (file["power_density/histogram"][()] if index is None else file["partial_results/histogram"][index]).T # as plotted
+
+    if model == FitModel.POLYNOMIAL:
+        params = fit_polynomial_surface(xx, yy, pd, degree)
+        size   = int(degree) + 1
+        pd_fit = numpy.polynomial.polynomial.polygrid2d(xx, yy, params.reshape((size, size))).T
+
+        j, i     = numpy.unravel_index(numpy.argmax(pd_fit), pd_fit.shape)
+        peak     = pd_fit[j, i]
+        center_x = xx[i]
+        center_y = yy[j]
+        fwhm_x   = __get_fwhm(xx, pd_fit[j, :], i)
+        fwhm_y   = __get_fwhm(yy, pd_fit[:, i], j)
+    else:
+        if bounds is None: bounds = __default_bounds(__get_profile(model)[1])
+
+        params = fit_separable(model, xx, yy, pd, bounds=bounds)
+        pd_fit = evaluate_separable(model, xx, yy, params)
+
+        peak, center_x, center_y, fwhm_x, fwhm_y = params[0] + params[1], params[2], params[3], params[4], params[5]
+
+    chisquare = numpy.sum((pd - pd_fit)**2)/max(1, pd.size - len(params))
+
+    return numpy.asarray(params, dtype=float), (peak, center_x, center_y, fwhm_x, fwhm_y, chisquare)
+
+def __get_fwhm(u, profile, peak_index):
+    # width at half maximum of a sampled profile, by linear interpolation of the crossings around the peak
+    half = 0.5*profile[peak_index]
+
+    below_left  = numpy.nonzero(profile[:peak_index] < half)[0]
+    below_right = numpy.nonzero(profile[peak_index:] < half)[0]
+
+    if len(below_left) == 0 or len(below_right) == 0: return numpy.nan
+
+    i_left  = below_left[-1]
+    i_right = peak_index + below_right[0]
+
+    left  = numpy.interp(half, [profile[i_left], profile[i_left + 1]], [u[i_left], u[i_left + 1]])
+    right = numpy.interp(half, [profile[i_right], profile[i_right - 1]], [u[i_right], u[i_right - 1]])
+
+    return right - left
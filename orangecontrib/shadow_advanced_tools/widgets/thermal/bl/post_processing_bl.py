@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# #########################################################################
+# Copyright (c) 2026, UChicago Argonne, LLC. All rights reserved.         #
+#                                                                         #
+# Copyright 2026. UChicago Argonne, LLC. This software was produced       #
+# under U.S. Government contract DE-AC02-06CH11357 for Argonne National   #
+# Laboratory (ANL), which is operated by UChicago Argonne, LLC for the    #
+# U.S. Department of Energy. The U.S. Government has rights to use,       #
+# reproduce, and distribute this software.  NEITHER THE GOVERNMENT NOR    #
+# UChicago Argonne, LLC MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR        #
+# ASSUMES ANY LIABILITY FOR THE USE OF THIS SOFTWARE.  If software is     #
+# modified to produce derivative works, such modified software should     #
+# be clearly marked, so as not to confuse it with the version available   #
+# from ANL.                                                               #
+#                                                                         #
+# Additionally, redistribution and use in source and binary forms, with   #
+# or without modification, are permitted provided that the following      #
+# conditions are met:                                                     #
+#                                                                         #
+#     * Redistributions of source code must retain the above copyright    #
+#       notice, this list of conditions and the following disclaimer.     #
+#                                                                         #
+#     * Redistributions in binary form must reproduce the above copyright #
+#       notice, this list of conditions and the following disclaimer in   #
+#       the documentation and/or other materials provided with the        #
+#       distribution.                                                     #
+#                                                                         #
+#     * Neither the name of UChicago Argonne, LLC, Argonne National       #
+#       Laboratory, ANL, the U.S. Government, nor the names of its        #
+#       contributors may be used to endorse or promote products derived   #
+#       from this software without specific prior written permission.     #
+#                                                                         #
+# THIS SOFTWARE IS PROVIDED BY UChicago Argonne, LLC AND CONTRIBUTORS     #
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT       #
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS       #
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL UChicago     #
+# Argonne, LLC OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,        #
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,    #
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;        #
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER        #
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT      #
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN       #
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE         #
+# POSSIBILITY OF SUCH DAMAGE.                                             #
+# #########################################################################
+
+
+import numpy
+from types import SimpleNamespace
+
+####################################################################################
+# POST PROCESSING CHAIN
+####################################################################################
+
+class PostProcessingChain():
+    """
+    Post processing operations on a power density ticket, recorded and evaluated lazily (evaluate()):
+
+    - flips, inversion and cuts are views of the data: nothing is copied
+    - rescalings are accumulated in a single factor, applied with the next operation that needs the data
+    - other operations (functions: x, y, histogram -> x, y, histogram) are applied in order
+
+    The state after the last evaluation is kept: operations appended afterwards are applied to it only.
+    The recorded operations can be replayed on new data with set_source(ticket, keep_operations=True).
+    """
+    FLIP     = 0
+    INVERT   = 1
+    CUT      = 2
+    RESCALE  = 3
+    FUNCTION = 4
+
+    def __init__(self, source=None):
+        self.__source     = source
+        self.__operations = []
+        self.__invalidate()
+
+    def get_source(self):
+        return self.__source
+
+    def set_source(self, source, keep_operations=False):
+        self.__source = source
+        if not keep_operations: self.__operations = []
+        self.__invalidate()
+
+    def clear(self):
+        self.__operations = []
+        self.__invalidate()
+
+    def is_empty(self):
+        return len(self.__operations) == 0
+
+    def get_number_of_operations(self):
+        return len(self.__operations)
+
+    def get_total_factor(self):
+        factor = 1.0
+        for operation in self.__operations:
+            if operation[0] == PostProcessingChain.RESCALE: factor *= operation[1]
+
+        return factor
+
+    def discard_last(self):
+        if len(self.__operations) > 0: self.__operations.pop()
+        self.__invalidate()
+
+    def flip(self, axis=0):
+        self.__append((PostProcessingChain.FLIP, axis))
+
+    def invert(self):
+        self.__append((PostProcessingChain.INVERT,))
+
+    def cut(self, range_h, range_v):
+        self.__append((PostProcessingChain.CUT, range_h, range_v))
+
+    def rescale(self, factor):
+        self.__append((PostProcessingChain.RESCALE, factor))
+
+    def apply(self, function, in_place=False):
+        """
+        :param function: function(x, y, histogram) -> x, y, histogram
+        :param in_place: the function modifies the histogram: it receives a private copy
+        """
+        self.__append((PostProcessingChain.FUNCTION, function, in_place))
+
+    def evaluate(self):
+        if self.__source is None:   return None
+        if self.is_empty():         return self.__source
+        if not self.__result is None: return self.__result
+
+        if self.__state is None:
+            self.__state = SimpleNamespace(x=self.__source["bin_h_center"],
+                                           y=self.__source["bin_v_center"],
+                                           histogram=self.__source["histogram"],
+                                           h_label=self.__source.get("h_label", ""),
+                                           v_label=self.__source.get("v_label", ""),
+                                           factor=1.0,          # not yet applied to the histogram
+                                           total_factor=1.0,
+                                           applied=0,
+                                           handed_out=False)   # the histogram (or a view of it) is in a ticket
+
+        for operation in self.__operations[self.__state.applied:]:
+            self.__apply_operation(self.__state, operation)
+            self.__state.applied += 1
+
+        self.__result = self.__get_ticket(self.__state)
+
+        return self.__result
+
+    def __append(self, operation):
+        self.__operations.append(operation)
+        self.__result = None
+
+    def __invalidate(self):
+        self.__state  = None
+        self.__result = None
+
+    def __apply_operation(self, state, operation):
+        kind = operation[0]
+
+        if kind == PostProcessingChain.FLIP:
+            state.histogram = numpy.flip(state.histogram, axis=operation[1])
+        elif kind == PostProcessingChain.INVERT:
+            state.x, state.y             = state.y, state.x
+            state.h_label, state.v_label = state.v_label, state.h_label
+            state.histogram              = state.histogram.T
+        elif kind == PostProcessingChain.CUT:
+            cut_x = self.__get_cut(state.x, operation[1], "H")
+            cut_y = self.__get_cut(state.y, operation[2], "V")
+
+            state.x, state.y = state.x[cut_x], state.y[cut_y]
+            state.histogram  = state.histogram[cut_x, cut_y]
+        elif kind == PostProcessingChain.RESCALE:
+            state.factor       *= operation[1]
+            state.total_factor *= operation[1]
+        elif kind == PostProcessingChain.FUNCTION:
+            function, in_place = operation[1], operation[2]
+
+            if state.factor != 1.0:
+                state.histogram = state.histogram*state.factor # copy and rescaling in one pass
+                state.factor    = 1.0
+            elif in_place and (state.handed_out or numpy.may_share_memory(state.histogram, self.__source["histogram"])):
+                state.histogram = state.histogram.copy()
+
+            state.x, state.y, state.histogram = function(state.x, state.y, state.histogram)
+            state.handed_out = False
+
+    @classmethod
+    def __get_cut(cls, coordinates, new_range, name):
+        indexes = numpy.nonzero(numpy.logical_and(coordinates >= new_range[0], coordinates <= new_range[1]))[0]
+
+        if len(indexes) == 0: raise ValueError("No bins in the new range " + name)
+
+        return slice(indexes[0], indexes[-1] + 1) # bin centers are sorted
+
+    def __get_ticket(self, state):
+        ticket = self.__source.copy()
+
+        if state.factor == 1.0:
+            ticket["histogram"] = state.histogram
+            state.handed_out    = True
+        else:
+            ticket["histogram"] = state.histogram*state.factor
+        ticket["bin_h_center"] = state.x
+        ticket["bin_v_center"] = state.y
+        ticket["h_label"]      = state.h_label
+        ticket["v_label"]      = state.v_label
+
+        if len(state.x) > 1 and len(state.y) > 1:
+            ticket["plotted_power"] = numpy.sum(ticket["histogram"])*(state.x[1] - state.x[0])*(state.y[1] - state.y[0])
+        else:
+            ticket.pop("plotted_power", None)
+
+        if "incident_power" in ticket: ticket["incident_power"] *= state.total_factor
+
+        return ticket
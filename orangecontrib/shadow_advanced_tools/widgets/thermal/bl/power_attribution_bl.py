@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# #########################################################################
+# Copyright (c) 2026, UChicago Argonne, LLC. All rights reserved.         #
+#                                                                         #
+# Copyright 2026. UChicago Argonne, LLC. This software was produced       #
+# under U.S. Government contract DE-AC02-06CH11357 for Argonne National   #
+# Laboratory (ANL), which is operated by UChicago Argonne, LLC for the    #
+# U.S. Department of Energy. The U.S. Government has rights to use,       #
+# reproduce, and distribute this software.  NEITHER THE GOVERNMENT NOR    #
+# UChicago Argonne, LLC MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR        #
+# ASSUMES ANY LIABILITY FOR THE USE OF THIS SOFTWARE.  If software is     #
+# modified to produce derivative works, such modified software should     #
+# be clearly marked, so as not to confuse it with the version available   #
+# from ANL.                                                               #
+#                                                                         #
+# Additionally, redistribution and use in source and binary forms, with   #
+# or without modification, are permitted provided that the following      #
+# conditions are met:                                                     #
+#                                                                         #
+#     * Redistributions of source code must retain the above copyright    #
+#       notice, this list of conditions and the following disclaimer.     #
+#                                                                         #
+#     * Redistributions in binary form must reproduce the above copyright #
+#       notice, this list of conditions and the following disclaimer in   #
+#       the documentation and/or other materials provided with the        #
+#       distribution.                                                     #
+#                                                                         #
+#     * Neither the name of UChicago Argonne, LLC, Argonne National       #
+#       Laboratory, ANL, the U.S. Government, nor the names of its        #
+#       contributors may be used to endorse or promote products derived   #
+#       from this software without specific prior written permission.     #
+#                                                                         #
+# THIS SOFTWARE IS PROVIDED BY UChicago Argonne, LLC AND CONTRIBUTORS     #
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT       #
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS       #
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL UChicago     #
+# Argonne, LLC OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,        #
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,    #
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;        #
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER        #
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT      #
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN       #
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE         #
+# POSSIBILITY OF SUCH DAMAGE.                                             #
+# #########################################################################
+
+import numpy
+
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_density_bl import ELECTRIC_FIELD_COLUMNS, get_ray_intensity
+
+class PowerAttribution:
+    INCIDENT    = 0
+    ABSORBED    = 1
+    TRANSMITTED = 2
+    LOST        = 3
+
+    @classmethod
+    def from_nolost(cls, nolost):
+        return {1: cls.TRANSMITTED, 2: cls.LOST, 3: cls.ABSORBED}.get(nolost, cls.TRANSMITTED)
+
+def get_ray_power(incident_rays, transmitted_rays, kind):
+    """
+    Per-ray power attributed to an optical element (as intensity, before the total_power/n_rays scaling),
+    with the selection of the rays carrying it:
+
+    - incident: intensity of the good incident rays
+    - absorbed: incident - transmitted intensity of the good transmitted rays
+    - transmitted: intensity of the good transmitted rays
+    - lost: incident intensity of the rays lost by the element that were good before it. In case of filters,
+      Shadow computes the absorption for lost rays: this would cause an imbalance on the total power.
+
+    incident_rays can be None (no history): the transmitted rays are then used alone, as good (absorbed) or lost rays.
+
+    :return: selection (boolean array), intensity (float array, one value per ray)
+    """
+    transmitted_flag = transmitted_rays[:, 9]
+
+    if incident_rays is None:
+        if kind == PowerAttribution.LOST: return transmitted_flag < 0.0, get_ray_intensity(transmitted_rays)
+        else:                             return transmitted_flag > 0.0, get_ray_intensity(transmitted_rays)
+
+    if kind == PowerAttribution.INCIDENT:
+        return incident_rays[:, 9] > 0.0, get_ray_intensity(incident_rays)
+    elif kind == PowerAttribution.ABSORBED:
+        intensity = get_ray_intensity(incident_rays)
+        intensity -= get_ray_intensity(transmitted_rays)
+        numpy.maximum(intensity, 0.0, out=intensity)
+
+        return transmitted_flag > 0.0, intensity
+    elif kind == PowerAttribution.TRANSMITTED:
+        return transmitted_flag > 0.0, get_ray_intensity(transmitted_rays)
+    elif kind == PowerAttribution.LOST:
+        return numpy.logical_and(transmitted_flag != 1, incident_rays[:, 9] == 1), get_ray_intensity(incident_rays)
+    else:
+        raise ValueError("Kind of power not recognized: " + str(kind))
+
+def set_ray_intensity(rays, intensity):
+    """
+    Writes the intensity in place as electric field, with the whole intensity in one single component
+    """
+    rays[:, ELECTRIC_FIELD_COLUMNS[0]] = numpy.sqrt(intensity)
+    rays[:, ELECTRIC_FIELD_COLUMNS[1:]] = 0.0
+
+def copy_electric_field(rays, source_rays):
+    rays[:, ELECTRIC_FIELD_COLUMNS] = source_rays[:, ELECTRIC_FIELD_COLUMNS]
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# #########################################################################
+# Copyright (c) 2026, UChicago Argonne, LLC. All rights reserved.         #
+#                                                                         #
+# Copyright 2026. UChicago Argonne, LLC. This software was produced       #
+# under U.S. Government contract DE-AC02-06CH11357 for Argonne National   #
+# Laboratory (ANL), which is operated by UChicago Argonne, LLC for the    #
+# U.S. Department of Energy. The U.S. Government has rights to use,       #
+# reproduce, and distribute this software.  NEITHER THE GOVERNMENT NOR    #
+# UChicago Argonne, LLC MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR        #
+# ASSUMES ANY LIABILITY FOR THE USE OF THIS SOFTWARE.  If software is     #
+# modified to produce derivative works, such modified software should     #
+# be clearly marked, so as not to confuse it with the version available   #
+# from ANL.                                                               #
+#                                                                         #
+# Additionally, redistribution and use in source and binary forms, with   #
+# or without modification, are permitted provided that the following      #
+# conditions are met:                                                     #
+#                                                                         #
+#     * Redistributions of source code must retain the above copyright    #
+#       notice, this list of conditions and the following disclaimer.     #
+#                                                                         #
+#     * Redistributions in binary form must reproduce the above copyright #
+#       notice, this list of conditions and the following disclaimer in   #
+#       the documentation and/or other materials provided with the        #
+#       distribution.                                                     #
+#                                                                         #
+#     * Neither the name of UChicago Argonne, LLC, Argonne National       #
+#       Laboratory, ANL, the U.S. Government, nor the names of its        #
+#       contributors may be used to endorse or promote products derived   #
+#       from this software without specific prior written permission.     #
+#                                                                         #
+# THIS SOFTWARE IS PROVIDED BY UChicago Argonne, LLC AND CONTRIBUTORS     #
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT       #
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS       #
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL UChicago     #
+# Argonne, LLC OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,        #
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,    #
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;        #
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER        #
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT      #
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN       #
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE         #
+# POSSIBILITY OF SUCH DAMAGE.                                             #
+# #########################################################################
+
+
+import numpy
+
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_density_bl import PowerDensityAccumulator, histo2, get_incident_power, \
+    get_redistribution_kernel
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_attribution_bl import PowerAttribution, get_ray_power
+
+class PowerDensityCalculator():
+    """
+    Histogramming and accumulation of the power density steps: no Qt calls, it is used by the plot widget and by
+    the headless power loops (worker threads and processes)
+    """
+    def __init__(self):
+        self.cumulated_power_plot = 0.0
+        self.cumulated_previous_power_plot = 0.0
+        self.power_density_accumulator = None
+
+    def get_empty_power_density(self, ticket_to_add, nbins_h, nbins_v, xrange, yrange, to_mm):
+        if not ticket_to_add is None:
+            if self.power_density_accumulator is None or not self.power_density_accumulator.is_snapshot(ticket_to_add):
+                self.power_density_accumulator = PowerDensityAccumulator(ticket_to_add)
+
+            ticket      = self.power_density_accumulator.snapshot()
+            last_ticket = ticket
+        else:
+            ticket = {}
+            ticket["histogram"] = numpy.zeros((nbins_h, nbins_v))
+            ticket['intensity'] = numpy.zeros((nbins_h, nbins_v))
+            ticket['nrays']     = 0
+            ticket['good_rays'] = 0
+
+            if not xrange is None and not yrange is None:
+                ticket['bin_h_center'] = numpy.arange(xrange[0], xrange[1], nbins_h)*to_mm
+                ticket['bin_v_center'] = numpy.arange(yrange[0], yrange[1], nbins_v)*to_mm
+            else:
+                raise ValueError("Beam is empty and no range has been specified: Calculation is impossible")
+
+        if not ticket_to_add is None:
+            return ticket, last_ticket
+        else:
+            return ticket, None
+
+    def calculate_power_density(self, shadow_beam, var_x, var_y, total_power, cumulated_total_power, energy_min, energy_max, energy_step,
+                                nbins_h=100, nbins_v=100, xrange=None, yrange=None, nolost=1, ticket_to_add=None, to_mm=1.0,
+                                kind_of_calculation=0,
+                                replace_poor_statistic=0,
+                                good_rays_limit=100,
+                                center_x = 0.0,
+                                center_y = 0.0,
+                                sigma_x=1.0,
+                                sigma_y=1.0,
+                                gamma=1.0):
+        """
+        Numeric part of plot_power_density: no Qt calls, it can run outside the GUI thread
+        """
+        n_rays = len(shadow_beam._beam.rays[:, 0]) # lost and good!
+
+        if n_rays == 0:
+            return self.get_empty_power_density(ticket_to_add, nbins_h, nbins_v, xrange, yrange, to_mm)
+
+        history_item = shadow_beam.getOEHistory(oe_number=shadow_beam._oe_number)
+
+        if shadow_beam.scanned_variable_data and shadow_beam.scanned_variable_data.has_additional_parameter("incident_power"):
+            self.cumulated_previous_power_plot += shadow_beam.scanned_variable_data.get_additional_parameter("incident_power")
+        elif not history_item is None and not history_item._input_beam is None:
+            self.cumulated_previous_power_plot += get_incident_power(history_item._input_beam._beam.rays, total_power, n_rays)
+
+        if nolost>1: # must be calculating only the rays the become lost in the last object
+            incident_rays = None if history_item is None or history_item._input_beam is None else history_item._input_beam._beam.rays
+
+            selection, intensity = get_ray_power(incident_rays, shadow_beam._beam.rays, PowerAttribution.from_nolost(nolost))
+            is_empty = nolost == 2 and not incident_rays is None and not numpy.any(selection)
+        else:
+            selection, intensity, is_empty = None, None, False
+
+        if is_empty:
+            return self.get_empty_power_density(ticket_to_add, nbins_h, nbins_v, xrange, yrange, to_mm)
+
+        ticket = histo2(shadow_beam._beam.rays, var_x, var_y, nbins_h=nbins_h, nbins_v=nbins_v, xrange=xrange, yrange=yrange, nolost=1,
+                        selection=selection, intensity=intensity, ref=23)
+
+        ticket['bin_h_center'] *= to_mm
+        ticket['bin_v_center'] *= to_mm
+
+        bin_h_size = (ticket['bin_h_center'][1] - ticket['bin_h_center'][0])
+        bin_v_size = (ticket['bin_v_center'][1] - ticket['bin_v_center'][0])
+
+        if kind_of_calculation > 0:
+            if replace_poor_statistic == 0 or (replace_poor_statistic==1 and ticket['good_rays'] < good_rays_limit):
+                kernel = get_redistribution_kernel(kind_of_calculation, ticket['bin_h_center'], ticket['bin_v_center'],
+                                                   sigma_x=sigma_x, sigma_y=sigma_y, gamma=gamma, center_x=center_x, center_y=center_y)
+
+                numpy.multiply(kernel, ticket['intensity'], out=ticket['histogram']) # kernel with the total intensity of the step
+
+        ticket['histogram'][ticket['histogram'] < 1e-9] = 0.0
+
+        power = ticket['histogram'].sum() * (total_power / n_rays)
+
+        if ticket_to_add is None:
+            self.cumulated_power_plot = power
+        else:
+            self.cumulated_power_plot += power
+
+        ticket['histogram'] *= (total_power / n_rays) / (bin_h_size * bin_v_size)  # power density, in one pass
+
+        # the step is added in place to the cumulated arrays: no copy of the current or of the cumulated histograms
+        if ticket_to_add is None:
+            self.power_density_accumulator = PowerDensityAccumulator(ticket, copy=False)
+        else:
+            if self.power_density_accumulator is None or not self.power_density_accumulator.is_snapshot(ticket_to_add):
+                self.power_density_accumulator = PowerDensityAccumulator(ticket_to_add)
+
+            last_ticket = ticket
+
+        # step and metadata together: a copy taken by another thread never mixes two steps
+        with self.power_density_accumulator.lock:
+            if not ticket_to_add is None: self.power_density_accumulator.add(last_ticket)
+
+            ticket = self.power_density_accumulator.snapshot(h_label=var_x,
+                                                             v_label=var_y,
+                                                             # data for reload of the file
+                                                             energy_min=energy_min,
+                                                             energy_max=energy_max,
+                                                             energy_step=energy_step,
+                                                             plotted_power=self.cumulated_power_plot,
+                                                             incident_power=self.cumulated_previous_power_plot,
+                                                             total_power=cumulated_total_power)
+
+        if not ticket_to_add is None:
+            return ticket, last_ticket
+        else:
+            return ticket, None
+
+class PowerPlotAccumulation():
+    """
+    Status of the Power Plot XY changed at each step (running total, counters, autosave file, checkpoint schedule).
+    It is owned by the thread running the calculations: the GUI thread changes it only when no calculation is
+    running, and copies the running total to plot it while the steps are added (copy_cumulated_ticket)
+    """
+    def __init__(self):
+        self.calculator          = PowerDensityCalculator()
+        self.cumulated_ticket    = None
+        self.autosave_file       = None
+        self.checkpoint_schedule = None
+
+    def set_cumulated_ticket(self, ticket, cumulated_power_plot=0.0, cumulated_previous_power_plot=0.0):
+        self.cumulated_ticket = ticket
+
+        self.calculator.cumulated_power_plot          = cumulated_power_plot
+        self.calculator.cumulated_previous_power_plot = cumulated_previous_power_plot
+        self.calculator.power_density_accumulator     = None # rebuilt from the cumulated ticket at the next step
+
+    def set_autosave_file(self, autosave_file):
+        if not self.autosave_file is None and not self.autosave_file is autosave_file: self.autosave_file.close()
+
+        self.autosave_file = autosave_file
+
+    def copy_cumulated_ticket(self):
+        """
+        :return: a copy of the running total, consistent even if a step is being added by another thread
+        """
+        accumulator = self.calculator.power_density_accumulator
+        ticket      = self.cumulated_ticket
+
+        # a running total not coming from the current accumulator is not changed anymore
+        if not accumulator is None and accumulator.is_snapshot(ticket): return accumulator.copy()
+        else:                                                            return copy_ticket(ticket)
+
+    def clear(self):
+        self.set_cumulated_ticket(None)
+        self.set_autosave_file(None)
+        self.checkpoint_schedule = None
+
+def copy_ticket(ticket):
+    """
+    :return: a copy of the ticket with its own histograms, not changed by the next steps (updated in place)
+    """
+    if ticket is None: return None
+
+    ticket = ticket.copy()
+    for key in ["histogram", "histogram_h", "histogram_v"]:
+        if key in ticket: ticket[key] = numpy.array(ticket[key])
+
+    return ticket
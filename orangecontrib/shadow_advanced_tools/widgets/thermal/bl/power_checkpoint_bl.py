@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# #########################################################################
+# Copyright (c) 2026, UChicago Argonne, LLC. All rights reserved.         #
+#                                                                         #
+# Copyright 2026. UChicago Argonne, LLC. This software was produced       #
+# under U.S. Government contract DE-AC02-06CH11357 for Argonne National   #
+# Laboratory (ANL), which is operated by UChicago Argonne, LLC for the    #
+# U.S. Department of Energy. The U.S. Government has rights to use,       #
+# reproduce, and distribute this software.  NEITHER THE GOVERNMENT NOR    #
+# UChicago Argonne, LLC MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR        #
+# ASSUMES ANY LIABILITY FOR THE USE OF THIS SOFTWARE.  If software is     #
+# modified to produce derivative works, such modified software should     #
+# be clearly marked, so as not to confuse it with the version available   #
+# from ANL.                                                               #
+#                                                                         #
+# Additionally, redistribution and use in source and binary forms, with   #
+# or without modification, are permitted provided that the following      #
+# conditions are met:                                                     #
+#                                                                         #
+#     * Redistributions of source code must retain the above copyright    #
+#       notice, this list of conditions and the following disclaimer.     #
+#                                                                         #
+#     * Redistributions in binary form must reproduce the above copyright #
+#       notice, this list of conditions and the following disclaimer in   #
+#       the documentation and/or other materials provided with the        #
+#       distribution.                                                     #
+#                                                                         #
+#     * Neither the name of UChicago Argonne, LLC, Argonne National       #
+#       Laboratory, ANL, the U.S. Government, nor the names of its        #
+#       contributors may be used to endorse or promote products derived   #
+#       from this software without specific prior written permission.     #
+#                                                                         #
+# THIS SOFTWARE IS PROVIDED BY UChicago Argonne, LLC AND CONTRIBUTORS     #
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT       #
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS       #
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL UChicago     #
+# Argonne, LLC OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,        #
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,    #
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;        #
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER        #
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT      #
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN       #
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE         #
+# POSSIBILITY OF SUCH DAMAGE.                                             #
+# #########################################################################
+
+
+import numpy
+import os, time
+from types import SimpleNamespace
+import h5py
+
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_density_io_bl import PowerDensityHdf5File, get_autosave_step_data
+
+CHECKPOINT_FILE_FORMAT = "power_loop_checkpoint"
+
+# state of the loop at the last completed step
+CHECKPOINT_DATA = ["current_step", "total_steps", "last_energy_value", "last_energy_step", "seed",
+                   "energy_min", "energy_max", "cumulated_total_power", "cumulated_power_plot", "cumulated_previous_power_plot",
+                   "autosave_steps", "autosave_partial_results"]
+
+TICKET_METADATA = ["energy_min", "energy_max", "energy_step", "plotted_power", "incident_power", "total_power"]
+
+def get_checkpoint_file_name(autosave_file_name):
+    return os.path.splitext(autosave_file_name)[0] + "_checkpoint.h5"
+
+def is_checkpoint_file(file_name):
+    try:
+        with h5py.File(file_name, "r") as file: return file.attrs.get("format", None) == CHECKPOINT_FILE_FORMAT
+    except OSError:
+        return False
+
+def get_random_state():
+    name, keys, position, has_gauss, cached_gaussian = numpy.random.get_state()
+
+    return {"name" : name, "keys" : keys, "position" : position, "has_gauss" : has_gauss, "cached_gaussian" : cached_gaussian}
+
+def set_random_state(random_state):
+    numpy.random.set_state((random_state["name"], numpy.asarray(random_state["keys"], dtype=numpy.uint32), int(random_state["position"]),
+                            int(random_state["has_gauss"]), float(random_state["cached_gaussian"])))
+
+def write_checkpoint(file_name, ticket, checkpoint_data, random_state=None):
+    """
+    Atomic write: the checkpoint is written in a temporary file, synced to disk and renamed over the previous one,
+    so a crash leaves either the previous checkpoint or the new one, never a partial file.
+
+    :param ticket: cumulated ticket (None: no good rays yet)
+    :param checkpoint_data: values of CHECKPOINT_DATA (missing values are saved as NaN)
+    :param random_state: state of the numpy random generator, from get_random_state (None: not saved)
+    """
+    temporary_file_name = file_name + ".tmp"
+
+    with h5py.File(temporary_file_name, "w") as file:
+        file.attrs["format"] = CHECKPOINT_FILE_FORMAT
+
+        loop = file.create_group("loop")
+        for name in CHECKPOINT_DATA:
+            value = checkpoint_data.get(name, None)
+            loop.attrs[name] = numpy.nan if value is None else value
+
+        if not ticket is None:
+            power_density = file.create_group("power_density")
+            for name in ["histogram", "histogram_h", "histogram_v", "bin_h_center", "bin_v_center"]:
+                power_density.create_dataset(name, data=ticket[name], compression="gzip", shuffle=True)
+
+            power_density.attrs["intensity"] = ticket.get("intensity", 0.0)
+            power_density.attrs["nrays"]     = ticket.get("nrays", 0)
+            power_density.attrs["good_rays"] = ticket.get("good_rays", 0)
+            power_density.attrs["h_label"]   = ticket.get("h_label", "")
+            power_density.attrs["v_label"]   = ticket.get("v_label", "")
+            for name in TICKET_METADATA:
+                if name in ticket: power_density.attrs[name] = ticket[name]
+
+        if not random_state is None:
+            random = file.create_group("random_state")
+            random.create_dataset("keys", data=random_state["keys"])
+            for name in ["name", "position", "has_gauss", "cached_gaussian"]: random.attrs[name] = random_state[name]
+
+    with open(temporary_file_name, "rb+") as file: os.fsync(file.fileno())
+
+    os.replace(temporary_file_name, file_name)
+
+def read_checkpoint(file_name):
+    """
+    :return: checkpoint (ticket, data: values of CHECKPOINT_DATA, random_state)
+    """
+    if not is_checkpoint_file(file_name): raise ValueError("File " + file_name + " is not a power loop checkpoint")
+
+    with h5py.File(file_name, "r") as file:
+        data = {name : __to_value(file["loop"].attrs[name]) for name in CHECKPOINT_DATA}
+
+        if "power_density" in file:
+            power_density = file["power_density"]
+
+            ticket = {name : power_density[name][()] for name in ["histogram", "histogram_h", "histogram_v", "bin_h_center", "bin_v_center"]}
+            for name in ["intensity", "nrays", "good_rays", "h_label", "v_label"] + TICKET_METADATA:
+                if name in power_density.attrs: ticket[name] = __to_value(power_density.attrs[name])
+        else:
+            ticket = None
+
+        if "random_state" in file:
+            random_state = {name : __to_value(file["random_state"].attrs[name]) for name in ["name", "position", "has_gauss", "cached_gaussian"]}
+            random_state["keys"] = file["random_state/keys"][()]
+        else:
+            random_state = None
+
+    return SimpleNamespace(ticket=ticket, data=data, random_state=random_state)
+
+def __to_value(value):
+    if isinstance(value, numpy.generic): value = value.item()
+    if isinstance(value, bytes): value = value.decode("utf-8")
+    if isinstance(value, float) and numpy.isnan(value): value = None
+
+    return value
+
+class CheckpointSchedule():
+    """
+    A checkpoint is due every checkpoint_steps steps or checkpoint_interval seconds, whichever comes first
+    """
+    def __init__(self, checkpoint_steps=10, checkpoint_interval=300.0):
+        self.checkpoint_steps    = max(1, int(checkpoint_steps))
+        self.checkpoint_interval = checkpoint_interval
+
+        self.__steps           = 0
+        self.__last_checkpoint = time.monotonic()
+
+    def step(self, force=False):
+        """
+        :return: True if the checkpoint has to be written at this step
+        """
+        self.__steps += 1
+
+        if force or \
+                self.__steps >= self.checkpoint_steps or \
+                time.monotonic() - self.__last_checkpoint >= self.checkpoint_interval:
+            self.__steps           = 0
+            self.__last_checkpoint = time.monotonic()
+
+            return True
+        else:
+            return False
+
+def restore_autosave_file(file_name, checkpoint, swmr=False, flush_interval=5.0, flush_steps=10):
+    """
+    Reopens the autosave file of the loop at the status of the checkpoint. If the file cannot be read (crash during
+    a write) it is renamed and a new one is created with the cumulated plot of the checkpoint (partial results are lost).
+
+    :return: the autosave file, open in append mode
+    """
+    data = checkpoint.data
+
+    try:
+        autosave_file = PowerDensityHdf5File(file_name, append=True)
+        try:
+            autosave_file.restore(checkpoint.ticket, data["autosave_steps"] or 0, data["autosave_partial_results"] or 0)
+        finally:
+            autosave_file.close()
+    except (OSError, KeyError, ValueError) as e:
+        print("Autosave file " + file_name + " not readable (" + str(e) + "): recreated from the checkpoint")
+
+        if os.path.exists(file_name): os.replace(file_name, file_name + ".corrupted")
+
+        autosave_file = PowerDensityHdf5File(file_name)
+        try:
+            if not checkpoint.ticket is None:
+                autosave_file.write_step(checkpoint.ticket,
+                                         step_data=get_autosave_step_data(data["current_step"], data["total_steps"], data["last_energy_value"], numpy.nan, checkpoint.ticket),
+                                         force_flush=True)
+        finally:
+            autosave_file.close()
+
+    # shrinking datasets is not allowed in SWMR mode: the file is reopened after the restore
+    return PowerDensityHdf5File(file_name, swmr=swmr, flush_interval=flush_interval, flush_steps=flush_steps, append=True)
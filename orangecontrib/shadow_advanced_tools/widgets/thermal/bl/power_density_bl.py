@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# #########################################################################
+# Copyright (c) 2026, UChicago Argonne, LLC. All rights reserved.         #
+#                                                                         #
+# Copyright 2026. UChicago Argonne, LLC. This software was produced       #
+# under U.S. Government contract DE-AC02-06CH11357 for Argonne National   #
+# Laboratory (ANL), which is operated by UChicago Argonne, LLC for the    #
+# U.S. Department of Energy. The U.S. Government has rights to use,       #
+# reproduce, and distribute this software.  NEITHER THE GOVERNMENT NOR    #
+# UChicago Argonne, LLC MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR        #
+# ASSUMES ANY LIABILITY FOR THE USE OF THIS SOFTWARE.  If software is     #
+# modified to produce derivative works, such modified software should     #
+# be clearly marked, so as not to confuse it with the version available   #
+# from ANL.                                                               #
+#                                                                         #
+# Additionally, redistribution and use in source and binary forms, with   #
+# or without modification, are permitted provided that the following      #
+# conditions are met:                                                     #
+#                                                                         #
+#     * Redistributions of source code must retain the above copyright    #
+#       notice, this list of conditions and the following disclaimer.     #
+#                                                                         #
+#     * Redistributions in binary form must reproduce the above copyright #
+#       notice, this list of conditions and the following disclaimer in   #
+#       the documentation and/or other materials provided with the        #
+#       distribution.                                                     #
+#                                                                         #
+#     * Neither the name of UChicago Argonne, LLC, Argonne National       #
+#       Laboratory, ANL, the U.S. Government, nor the names of its        #
+#       contributors may be used to endorse or promote products derived   #
+#       from this software without specific prior written permission.     #
+#                                                                         #
+# THIS SOFTWARE IS PROVIDED BY UChicago Argonne, LLC AND CONTRIBUTORS     #
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT       #
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS       #
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL UChicago     #
+# Argonne, LLC OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,        #
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,    #
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;        #
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER        #
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT      #
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN       #
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE         #
+# POSSIBILITY OF SUCH DAMAGE.                                             #
+# #########################################################################
+
+import numpy, threading
+from scipy.sparse import csr_matrix
+from orangecontrib.shadow_advanced_tools.util.lru_cache import LRUCache
+
+
+####################################################################################
+# INCREMENTAL POWER DENSITY
+####################################################################################
+
+class PowerDensityAccumulator():
+    """
+    Cumulated power density of a loop: histograms and counters are allocated once and updated in place at
+    every step. Snapshots are tickets (as the ones of ShadowPlot) sharing read-only views of the cumulated
+    arrays: they are valid until the next step, so they must be copied to be kept longer than that.
+    Steps and copies are serialized by the lock, so another thread can copy the running total (copy).
+    """
+    def __init__(self, ticket, copy=True):
+        self.__histogram   = self.__init_array(ticket["histogram"], copy)
+        self.__histogram_h = self.__init_array(ticket.get("histogram_h", self.__histogram.sum(axis=1)), copy)
+        self.__histogram_v = self.__init_array(ticket.get("histogram_v", self.__histogram.sum(axis=0)), copy)
+
+        self.intensity = ticket["intensity"]
+        self.nrays     = ticket["nrays"]
+        self.good_rays = ticket["good_rays"]
+
+        self.__coordinates = {"bin_h_center" : self.__read_only(numpy.array(ticket["bin_h_center"], dtype=float)),
+                              "bin_v_center" : self.__read_only(numpy.array(ticket["bin_v_center"], dtype=float))}
+
+        for key in ["h_label", "v_label"]:
+            if key in ticket: self.__coordinates[key] = ticket[key]
+
+        self.__histogram_view   = self.__read_only(self.__histogram.view())
+        self.__histogram_h_view = self.__read_only(self.__histogram_h.view())
+        self.__histogram_v_view = self.__read_only(self.__histogram_v.view())
+
+        self.__metadata = {key : ticket[key] for key in ["energy_min", "energy_max", "energy_step", "plotted_power", "incident_power", "total_power"] if key in ticket}
+
+        self.lock = threading.RLock()
+
+    @classmethod
+    def __init_array(cls, array, copy):
+        return numpy.array(array, dtype=float) if copy else numpy.asarray(array, dtype=float)
+
+    @classmethod
+    def __read_only(cls, array):
+        array.flags.writeable = False
+
+        return array
+
+    def is_snapshot(self, ticket):
+        return not ticket is None and ticket.get("histogram") is self.__histogram_view
+
+    def add(self, ticket):
+        if ticket["histogram"].shape != self.__histogram.shape:
+            raise ValueError("The plots cannot be added: they should have same dimensions and ranges")
+
+        with self.lock:
+            numpy.add(self.__histogram, ticket["histogram"], out=self.__histogram)
+            if "histogram_h" in ticket: numpy.add(self.__histogram_h, ticket["histogram_h"], out=self.__histogram_h)
+            if "histogram_v" in ticket: numpy.add(self.__histogram_v, ticket["histogram_v"], out=self.__histogram_v)
+
+            self.intensity = self.intensity + ticket["intensity"]
+            self.nrays     += ticket["nrays"]
+            self.good_rays += ticket["good_rays"]
+
+    def snapshot(self, **metadata):
+        with self.lock:
+            self.__metadata.update(metadata)
+
+            ticket = dict(self.__coordinates)
+            ticket["histogram"]   = self.__histogram_view
+            ticket["histogram_h"] = self.__histogram_h_view
+            ticket["histogram_v"] = self.__histogram_v_view
+            ticket["intensity"]   = self.intensity
+            ticket["nrays"]       = self.nrays
+            ticket["good_rays"]   = self.good_rays
+            ticket.update(self.__metadata)
+
+        return ticket
+
+    def copy(self):
+        """
+        :return: the last snapshot, with its own histograms: it can be taken while another thread adds the steps
+        """
+        with self.lock:
+            ticket = self.snapshot()
+            for key in ["histogram", "histogram_h", "histogram_v"]: ticket[key] = numpy.array(ticket[key])
+
+        return ticket
+
+
+####################################################################################
+# HISTOGRAM ENGINE
+####################################################################################
+
+ELECTRIC_FIELD_COLUMNS = [6, 7, 8, 15, 16, 17] # Es, Ep (0-based)
+
+def get_ray_intensity(rays):
+    """
+    Intensity of the rays: |Es|^2 + |Ep|^2 (column 23 of Shadow)
+    """
+    intensity = numpy.square(rays[:, ELECTRIC_FIELD_COLUMNS[0]])
+    for column in ELECTRIC_FIELD_COLUMNS[1:]: intensity += numpy.square(rays[:, column])
+
+    return intensity
+
+
+def get_ray_selection(rays, nolost=1):
+    if nolost == 1:   return rays[:, 9] > 0.0 # good rays only
+    elif nolost == 2: return rays[:, 9] < 0.0 # lost rays only
+    else:             return None
+
+
+def get_incident_power(rays, total_power, n_rays):
+    """
+    Power carried by the good rays: the same value of the sum of the histogram of the beam (auto ranges include all
+    the good rays), computed as a direct weighted sum with no binning
+    """
+    return get_ray_intensity(rays)[rays[:, 9] > 0.0].sum() * (total_power / n_rays)
+
+
+def histo2(rays, col_h, col_v, nbins_h=100, nbins_v=100, xrange=None, yrange=None, nolost=1, ref=23, selection=None, intensity=None):
+    """
+    Drop-in of Shadow.Beam.histo2 for the power density: same binning (numpy.histogram2d) and ranges, only
+    the fields needed by the power plots are computed. Rays are binned with a single weighted bincount on
+    flat bin indices.
+    A boolean selection and a per-ray intensity can be given in place of nolost and of the electric fields.
+    """
+    if selection is None: selection = get_ray_selection(rays, nolost)
+    if intensity is None: intensity = get_ray_intensity(rays)
+
+    if selection is None:
+        column_h = rays[:, col_h - 1]
+        column_v = rays[:, col_v - 1]
+        selected_intensity = intensity
+    else:
+        column_h = rays[selection, col_h - 1]
+        column_v = rays[selection, col_v - 1]
+        selected_intensity = intensity[selection]
+
+    weights = selected_intensity if ref == 23 else None
+
+    if xrange is None: xrange = __get_good_range(column_h)
+    if yrange is None: yrange = __get_good_range(column_v)
+
+    bin_h_edges = numpy.linspace(xrange[0], xrange[1], nbins_h + 1)
+    bin_v_edges = numpy.linspace(yrange[0], yrange[1], nbins_v + 1)
+
+    inside = numpy.logical_and(numpy.logical_and(column_h >= bin_h_edges[0], column_h <= bin_h_edges[-1]),
+                               numpy.logical_and(column_v >= bin_v_edges[0], column_v <= bin_v_edges[-1]))
+
+    flat_indices = __get_bin_indices(column_h[inside], bin_h_edges) * nbins_v + __get_bin_indices(column_v[inside], bin_v_edges)
+
+    histogram = numpy.bincount(flat_indices,
+                               weights=None if weights is None else weights[inside],
+                               minlength=nbins_h * nbins_v).astype(float).reshape((nbins_h, nbins_v))
+
+    ticket = {}
+    ticket['xrange']       = xrange
+    ticket['yrange']       = yrange
+    ticket['bin_h_edges']  = bin_h_edges
+    ticket['bin_v_edges']  = bin_v_edges
+    ticket['bin_h_center'] = 0.5 * (bin_h_edges[:-1] + bin_h_edges[1:])
+    ticket['bin_v_center'] = 0.5 * (bin_v_edges[:-1] + bin_v_edges[1:])
+    ticket['histogram']    = histogram
+    ticket['histogram_h']  = histogram.sum(axis=1)
+    ticket['histogram_v']  = histogram.sum(axis=0)
+    ticket['intensity']    = selected_intensity.sum()
+    ticket['nrays']        = len(rays)
+    # rays of the plot: with a selection (e.g. lost rays), the statistic is the one of the selected rays
+    ticket['good_rays']    = int(numpy.count_nonzero(rays[:, 9] > 0.0 if selection is None else selection))
+
+    return ticket
+
+
+def __get_good_range(column):  # as Shadow.Beam.get_good_range
+    if column.size == 0: return [-1, 1]
+
+    rmin = numpy.min(column)
+    rmax = numpy.max(column)
+
+    rmin = rmin * 0.95 if rmin > 0.0 else rmin * 1.05
+    rmax = rmax * 0.95 if rmax < 0.0 else rmax * 1.05
+
+    if rmin == rmax: rmin, rmax = -1.0, 1.0
+
+    return [rmin, rmax]
+
+
+def __get_bin_indices(column, bin_edges):  # as numpy.histogram with uniform bins: the last bin includes the right edge
+    nbins = len(bin_edges) - 1
+
+    indices = ((column - bin_edges[0]) * (nbins / (bin_edges[-1] - bin_edges[0]))).astype(numpy.intp)
+    indices[indices == nbins] -= 1
+
+    indices[column < bin_edges[indices]] -= 1
+    indices[numpy.logical_and(column >= bin_edges[indices + 1], indices != nbins - 1)] += 1
+
+    return indices
+
+
+####################################################################################
+# REDISTRIBUTION KERNELS
+####################################################################################
+
+class RedistributionKernel:
+    FLAT       = 1
+    GAUSSIAN   = 2
+    LORENTZIAN = 3
+
+__kernels_cache = LRUCache(max_size=10)
+
+def get_redistribution_kernel(kind, x, y, sigma_x=1.0, sigma_y=1.0, gamma=1.0, center_x=0.0, center_y=0.0):
+    """
+    Normalized (sum = 1) kernel on the grid of the bin centers x, y. Kernels depend only on the (uniform) bins
+    and on the parameters: they are computed once, by broadcasting, and cached (read-only).
+    """
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+
+    if   kind == RedistributionKernel.FLAT:       parameters = ()
+    elif kind == RedistributionKernel.GAUSSIAN:   parameters = (sigma_x, sigma_y, center_x, center_y)
+    elif kind == RedistributionKernel.LORENTZIAN: parameters = (gamma, center_x, center_y)
+    else: raise ValueError("Kind of kernel not recognized: " + str(kind))
+
+    key = (kind, len(x), x[0], x[-1], len(y), y[0], y[-1]) + parameters
+
+    kernel = __kernels_cache.get(key)
+
+    if kernel is None:
+        if kind == RedistributionKernel.FLAT:
+            kernel = numpy.ones((len(x), len(y)))
+        elif kind == RedistributionKernel.GAUSSIAN: # separable
+            kernel = numpy.outer(numpy.exp(-0.5*((x-center_x)/sigma_x)**2),
+                                 numpy.exp(-0.5*((y-center_y)/sigma_y)**2))
+        elif kind == RedistributionKernel.LORENTZIAN:
+            kernel = gamma/((x[:, numpy.newaxis]-center_x)**2 + (y[numpy.newaxis, :]-center_y)**2 + gamma**2)
+
+        kernel /= numpy.sum(kernel)
+        kernel.setflags(write=False)
+
+        __kernels_cache[key] = kernel
+
+    return kernel
+
+####################################################################################
+# CONSERVATIVE REBINNING
+####################################################################################
+
+def get_bin_edges(centers):
+    """
+    Edges of the bins with the given centers. A single center has no width: it gets a unit bin, so targets of a
+    rebinning are given by their edges (get_rebinned_edges).
+    """
+    centers = numpy.asarray(centers, dtype=float)
+
+    if len(centers) == 1: return numpy.array([centers[0] - 0.5, centers[0] + 0.5])
+
+    middle = 0.5*(centers[1:] + centers[:-1])
+
+    return numpy.concatenate(([2*centers[0] - middle[0]], middle, [2*centers[-1] - middle[-1]]))
+
+def get_bin_centers(edges):
+    edges = numpy.asarray(edges, dtype=float)
+
+    return 0.5*(edges[1:] + edges[:-1])
+
+def get_rebinned_edges(centers, nbins):
+    """
+    Edges of nbins uniform bins covering the same range (edges) of the given bins.
+    """
+    edges = get_bin_edges(centers)
+
+    return numpy.linspace(edges[0], edges[-1], int(nbins) + 1)
+
+def rebin_power_density(x, y, histogram, new_x_edges, new_y_edges):
+    """
+    Conservative (area weighted) rebinning of a power density histogram[x, y] on the bins with edges new_x_edges,
+    new_y_edges, of any size: new = Ax . histogram . Ay^T, with Ax, Ay the (cached, sparse) overlaps of the old bins
+    with the new ones, divided by the width of the new bins. The power in the intersection of the two grids is
+    preserved exactly: maps of different runs can be put on a common grid and summed.
+    """
+    overlap_x = get_overlap_matrix(x, new_x_edges)
+    overlap_y = get_overlap_matrix(y, new_y_edges)
+
+    return numpy.ascontiguousarray((overlap_y @ (overlap_x @ numpy.asarray(histogram, dtype=float)).T).T)
+
+__overlaps_cache = LRUCache(max_size=10)
+
+def get_overlap_matrix(centers, new_edges):
+    """
+    Sparse matrix [new bin, old bin] of the overlap length of the bins, divided by the width of the new bin.
+    """
+    centers   = numpy.asarray(centers, dtype=float)
+    new_edges = numpy.asarray(new_edges, dtype=float)
+
+    key     = (len(centers), centers[0], centers[-1], len(new_edges), new_edges[0], new_edges[-1])
+    overlap = __overlaps_cache.get(key)
+
+    if overlap is None:
+        edges = get_bin_edges(centers)
+        n_new = len(new_edges) - 1
+
+        # each old bin overlaps a contiguous range of new bins
+        first  = numpy.clip(numpy.searchsorted(new_edges, edges[:-1], side="right") - 1, 0, n_new - 1)
+        last   = numpy.clip(numpy.searchsorted(new_edges, edges[1:], side="left") - 1, 0, n_new - 1)
+        counts = numpy.maximum(last - first + 1, 1)
+
+        old_bins = numpy.repeat(numpy.arange(len(centers)), counts)
+        new_bins = numpy.repeat(first, counts) + numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+
+        lengths = numpy.minimum(edges[1:][old_bins], new_edges[1:][new_bins]) - numpy.maximum(edges[:-1][old_bins], new_edges[:-1][new_bins])
+        good    = lengths > 0
+
+        overlap = csr_matrix((lengths[good]/numpy.diff(new_edges)[new_bins[good]], (new_bins[good], old_bins[good])), shape=(n_new, len(centers)))
+
+        __overlaps_cache[key] = overlap
+
+    return overlap
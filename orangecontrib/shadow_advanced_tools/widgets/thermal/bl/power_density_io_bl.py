@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# #########################################################################
+# Copyright (c) 2026, UChicago Argonne, LLC. All rights reserved.         #
+#                                                                         #
+# Copyright 2026. UChicago Argonne, LLC. This software was produced       #
+# under U.S. Government contract DE-AC02-06CH11357 for Argonne National   #
+# Laboratory (ANL), which is operated by UChicago Argonne, LLC for the    #
+# U.S. Department of Energy. The U.S. Government has rights to use,       #
+# reproduce, and distribute this software.  NEITHER THE GOVERNMENT NOR    #
+# UChicago Argonne, LLC MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR        #
+# ASSUMES ANY LIABILITY FOR THE USE OF THIS SOFTWARE.  If software is     #
+# modified to produce derivative works, such modified software should     #
+# be clearly marked, so as not to confuse it with the version available   #
+# from ANL.                                                               #
+#                                                                         #
+# Additionally, redistribution and use in source and binary forms, with   #
+# or without modification, are permitted provided that the following      #
+# conditions are met:                                                     #
+#                                                                         #
+#     * Redistributions of source code must retain the above copyright    #
+#       notice, this list of conditions and the following disclaimer.     #
+#                                                                         #
+#     * Redistributions in binary form must reproduce the above copyright #
+#       notice, this list of conditions and the following disclaimer in   #
+#       the documentation and/or other materials provided with the        #
+#       distribution.                                                     #
+#                                                                         #
+#     * Neither the name of UChicago Argonne, LLC, Argonne National       #
+#       Laboratory, ANL, the U.S. Government, nor the names of its        #
+#       contributors may be used to endorse or promote products derived   #
+#       from this software without specific prior written permission.     #
+#                                                                         #
+# THIS SOFTWARE IS PROVIDED BY UChicago Argonne, LLC AND CONTRIBUTORS     #
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT       #
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS       #
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL UChicago     #
+# Argonne, LLC OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,        #
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,    #
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;        #
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER        #
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT      #
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN       #
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE         #
+# POSSIBILITY OF SUCH DAMAGE.                                             #
+# #########################################################################
+
+import numpy
+import os, time, json
+import h5py
+
+####################################################################################
+# AUTOSAVE FILE
+####################################################################################
+
+POWER_DENSITY_FILE_FORMAT = "power_density_autosave"
+
+STEP_DATA = ["current_step", "total_steps", "last_energy_value", "last_power_value",
+             "plotted_power", "incident_power", "total_power", "energy_min", "energy_max", "energy_step"]
+
+class PowerDensityHdf5File():
+    """
+    Autosave of the power density loops, kept open for the whole loop:
+
+    /coordinates             X, Y bin centers (attributes: x_label, y_label), written once
+    /power_density           running total: histogram, histogram_h, histogram_v, intensity, total_rays, good_rays
+    /partial_results         stack of the partial plots (histogram[step, h, v]) with their energy ranges
+    /steps                   one value per step of: STEP_DATA
+
+    Datasets are chunked, compressed and resizable, created at the first step: no object is created afterwards,
+    so the file can be written in SWMR mode and read live by other processes (h5py.File(..., "r", swmr=True)).
+    The file is flushed every flush_interval seconds or flush_steps steps, whichever comes first.
+    With append=True an existing autosave file is reopened and the next steps are appended to it.
+    """
+    def __init__(self, file_name, swmr=False, flush_interval=5.0, flush_steps=10, compression_level=4, append=False):
+        self.filename          = file_name
+        self.swmr              = swmr
+        self.flush_interval    = flush_interval
+        self.flush_steps       = max(1, int(flush_steps))
+        self.compression_level = compression_level
+
+        mode = "a" if append else "w"
+
+        self.__file = h5py.File(file_name, mode, libver="latest") if swmr else h5py.File(file_name, mode)
+
+        self.__initialized = append and "power_density" in self.__file
+
+        if not self.__initialized:
+            self.__file.attrs["format"] = POWER_DENSITY_FILE_FORMAT
+        elif self.__file.attrs.get("format", None) != POWER_DENSITY_FILE_FORMAT:
+            self.__file.close()
+            raise ValueError("File " + file_name + " is not a power density autosave file")
+        elif swmr:
+            self.__file.swmr_mode = True
+
+        self.__unflushed_steps = 0
+        self.__last_flush      = time.monotonic()
+
+    def write_step(self, ticket, last_ticket=None, step_data={}, force_flush=False):
+        """
+        :param ticket: running total (cumulated ticket, or the ticket of the step if results are not kept)
+        :param last_ticket: ticket of the step, appended to the partial results (None: not saved)
+        :param step_data: values of STEP_DATA for the step (missing values are saved as NaN)
+        """
+        if not self.__initialized: self.__initialize(ticket)
+
+        histogram = self.__file["power_density/histogram"]
+
+        if histogram.shape != ticket["histogram"].shape:
+            raise ValueError("Autosave file " + self.filename + " has plots of shape " + str(histogram.shape) + ": clear the results to change the bins")
+
+        histogram[...]                                   = ticket["histogram"]
+        self.__file["power_density/histogram_h"][...]    = ticket["histogram_h"]
+        self.__file["power_density/histogram_v"][...]    = ticket["histogram_v"]
+        self.__file["power_density/intensity"][...]      = ticket.get("intensity", 0.0)
+        self.__file["power_density/total_rays"][...]     = ticket.get("nrays", 0)
+        self.__file["power_density/good_rays"][...]      = ticket.get("good_rays", 0)
+
+        for name in STEP_DATA: self.__append(self.__file["steps/" + name], step_data.get(name, numpy.nan))
+
+        if not last_ticket is None:
+            self.__append(self.__file["partial_results/histogram"], last_ticket["histogram"])
+            self.__append(self.__file["partial_results/energy_from"], step_data.get("energy_max", numpy.nan) - step_data.get("energy_step", numpy.nan))
+            self.__append(self.__file["partial_results/energy_to"], step_data.get("energy_max", numpy.nan))
+
+        self.__unflushed_steps += 1
+
+        if force_flush or \
+                self.__unflushed_steps >= self.flush_steps or \
+                time.monotonic() - self.__last_flush >= self.flush_interval:
+            self.flush()
+
+    def get_number_of_steps(self):
+        """
+        :return: number of steps, number of partial results
+        """
+        if not self.__initialized: return 0, 0
+        else: return self.__file["steps/current_step"].shape[0], self.__file["partial_results/histogram"].shape[0]
+
+    def restore(self, ticket, number_of_steps, number_of_partial_results):
+        """
+        Back to the status of a checkpoint: steps and partial results written after it are discarded,
+        the running total is the one of the checkpoint.
+        """
+        if not self.__initialized:
+            if ticket is None: return
+            self.__initialize(ticket)
+
+        for name in STEP_DATA: self.__file["steps/" + name].resize(min(number_of_steps, self.__file["steps/" + name].shape[0]), axis=0)
+        for name in ["histogram", "energy_from", "energy_to"]:
+            self.__file["partial_results/" + name].resize(min(number_of_partial_results, self.__file["partial_results/" + name].shape[0]), axis=0)
+
+        if not ticket is None:
+            self.__file["power_density/histogram"][...]   = ticket["histogram"]
+            self.__file["power_density/histogram_h"][...] = ticket["histogram_h"]
+            self.__file["power_density/histogram_v"][...] = ticket["histogram_v"]
+            self.__file["power_density/intensity"][...]   = ticket.get("intensity", 0.0)
+            self.__file["power_density/total_rays"][...]  = ticket.get("nrays", 0)
+            self.__file["power_density/good_rays"][...]   = ticket.get("good_rays", 0)
+
+        self.flush()
+
+    def flush(self):
+        self.__file.flush()
+
+        self.__unflushed_steps = 0
+        self.__last_flush      = time.monotonic()
+
+    def close(self):
+        if self.__file:
+            self.__file.flush()
+            self.__file.close()
+
+    def read(self):
+        if self.__unflushed_steps > 0: self.flush()
+
+        return read_power_density_data(self.__file)
+
+    def __initialize(self, ticket):
+        shape       = ticket["histogram"].shape
+        compression = {"compression" : "gzip", "compression_opts" : self.compression_level, "shuffle" : True}
+
+        coordinates = self.__file.create_group("coordinates")
+        coordinates.create_dataset("X", data=ticket["bin_h_center"])
+        coordinates.create_dataset("Y", data=ticket["bin_v_center"])
+        coordinates.attrs["x_label"] = ticket.get("h_label", "") # column index or label
+        coordinates.attrs["y_label"] = ticket.get("v_label", "")
+
+        power_density = self.__file.create_group("power_density")
+        power_density.create_dataset("histogram", shape=shape, dtype=float, chunks=shape, **compression)
+        power_density.create_dataset("histogram_h", shape=(shape[0],), dtype=float)
+        power_density.create_dataset("histogram_v", shape=(shape[1],), dtype=float)
+        power_density.create_dataset("intensity", shape=(), dtype=float)
+        power_density.create_dataset("total_rays", shape=(), dtype=int)
+        power_density.create_dataset("good_rays", shape=(), dtype=int)
+
+        partial_results = self.__file.create_group("partial_results")
+        partial_results.create_dataset("histogram", shape=(0,) + shape, maxshape=(None,) + shape, dtype=float, chunks=(1,) + shape, **compression)
+        partial_results.create_dataset("energy_from", shape=(0,), maxshape=(None,), dtype=float, chunks=(256,))
+        partial_results.create_dataset("energy_to", shape=(0,), maxshape=(None,), dtype=float, chunks=(256,))
+
+        steps = self.__file.create_group("steps")
+        for name in STEP_DATA: steps.create_dataset(name, shape=(0,), maxshape=(None,), dtype=float, chunks=(256,))
+
+        if self.swmr: self.__file.swmr_mode = True
+
+        self.__initialized = True
+
+    @classmethod
+    def __append(cls, dataset, value):
+        size = dataset.shape[0]
+
+        dataset.resize(size + 1, axis=0)
+        dataset[size] = value
+
+def get_autosave_step_data(current_step, total_steps, last_energy_value, last_power_value, ticket):
+    return {"current_step"      : current_step,
+            "total_steps"       : total_steps,
+            "last_energy_value" : last_energy_value,
+            "last_power_value"  : last_power_value,
+            "plotted_power"     : ticket.get('plotted_power', numpy.nan),
+            "incident_power"    : ticket.get('incident_power', numpy.nan),
+            "total_power"       : ticket.get('total_power', numpy.nan),
+            "energy_min"        : ticket.get('energy_min', numpy.nan),
+            "energy_max"        : ticket.get('energy_max', numpy.nan),
+            "energy_step"       : ticket.get('energy_step', numpy.nan)}
+
+def is_power_density_file(file_name):
+    try:
+        with h5py.File(file_name, "r") as file: return file.attrs.get("format", None) == POWER_DENSITY_FILE_FORMAT
+    except OSError:
+        return False
+
+def read_power_density_file(file_name):
+    with h5py.File(file_name, "r") as file: return read_power_density_data(file)
+
+def read_power_density_data(file):
+    """
+    :return: ticket of the running total, additional data (values of STEP_DATA at the last step, prefixed by "last_",
+             None if no step has been saved)
+    """
+    ticket = {}
+    ticket["histogram"]    = file["power_density/histogram"][()]
+    ticket["histogram_h"]  = file["power_density/histogram_h"][()]
+    ticket["histogram_v"]  = file["power_density/histogram_v"][()]
+    ticket["intensity"]    = file["power_density/intensity"][()]
+    ticket["nrays"]        = file["power_density/total_rays"][()]
+    ticket["good_rays"]    = file["power_density/good_rays"][()]
+    ticket["bin_h_center"] = file["coordinates/X"][()]
+    ticket["bin_v_center"] = file["coordinates/Y"][()]
+    ticket["h_label"]      = file["coordinates"].attrs["x_label"]
+    ticket["v_label"]      = file["coordinates"].attrs["y_label"]
+
+    if file["steps/current_step"].shape[0] == 0:
+        additional_data = None
+    else:
+        additional_data = {}
+        for name in STEP_DATA: additional_data[name if name.startswith("last_") else "last_" + name] = file["steps/" + name][-1]
+
+    return ticket, additional_data
+
+
+####################################################################################
+# TEXT EXPORT
+####################################################################################
+
+def write_power_density_columns(file_name, ticket, separator=" ", empty_column=None, block_size=1000000):
+    """
+    Writes the rows "x y value" (x in the outer loop) with the values formatted as str(): the same output of the
+    row by row writing, built by vectorised formatting and written in blocks of block_size rows.
+
+    :param empty_column: position (0, 1, 2) of an additional "0.0" axis column (ANSYS files)
+    """
+    x_values = __to_str(ticket["bin_h_center"])
+    y_values = __to_str(ticket["bin_v_center"])
+    z_values = ticket["histogram"]
+
+    n_x = len(x_values)
+    n_y = len(y_values)
+
+    x_per_block = max(1, block_size // max(1, n_y))
+
+    with open(file_name, "w") as file:
+        for start in range(0, n_x, x_per_block):
+            stop = min(n_x, start + x_per_block)
+
+            columns = [numpy.repeat(x_values[start:stop], n_y),
+                       numpy.tile(y_values, stop - start),
+                       __to_str(z_values[start:stop, :].ravel())]
+
+            if not empty_column is None: columns.insert(empty_column, numpy.full(columns[0].shape, "0.0"))
+
+            rows = columns[0]
+            for column in columns[1:]: rows = numpy.char.add(numpy.char.add(rows, separator), column)
+
+            if start > 0: file.write("\n")
+            file.write("\n".join(rows.tolist()))
+
+def __to_str(values):
+    return numpy.asarray(values).astype(str) # as str() of each value
+
+
+####################################################################################
+# BINARY EXPORT (NPY + JSON)
+####################################################################################
+
+POWER_DENSITY_NPY_FORMAT = "power_density_npy"
+
+def save_power_density_npy(file_name, ticket, metadata={}):
+    """
+    Writes <name>.npy (histogram[h, v]), <name>_h.npy, <name>_v.npy (bin centers), memory-mappable with
+    numpy.load(..., mmap_mode="r"), and the sidecar <name>.json with labels, units, energy range and power totals.
+    """
+    base_name = os.path.splitext(file_name)[0]
+    prefix    = os.path.basename(base_name)
+
+    numpy.save(base_name + ".npy",   numpy.ascontiguousarray(ticket["histogram"], dtype=float))
+    numpy.save(base_name + "_h.npy", numpy.ascontiguousarray(ticket["bin_h_center"], dtype=float))
+    numpy.save(base_name + "_v.npy", numpy.ascontiguousarray(ticket["bin_v_center"], dtype=float))
+
+    sidecar = {"format"       : POWER_DENSITY_NPY_FORMAT,
+               "version"      : 1,
+               "histogram"    : prefix + ".npy",
+               "bin_h_center" : prefix + "_h.npy",
+               "bin_v_center" : prefix + "_v.npy",
+               "shape"        : list(ticket["histogram"].shape),
+               "h_label"      : __to_json(ticket.get("h_label", "")),
+               "v_label"      : __to_json(ticket.get("v_label", "")),
+               "intensity"    : __to_json(ticket.get("intensity", 0.0)),
+               "nrays"        : __to_json(ticket.get("nrays", 0)),
+               "good_rays"    : __to_json(ticket.get("good_rays", 0))}
+
+    for key, value in metadata.items(): sidecar[key] = __to_json(value)
+
+    with open(base_name + ".json", "w") as file: json.dump(sidecar, file, indent=2)
+
+def is_power_density_npy_file(file_name):
+    return os.path.splitext(file_name)[1].lower() in [".npy", ".json"] and os.path.exists(__get_npy_base_name(file_name) + ".json")
+
+def read_power_density_npy(file_name, mmap_mode=None):
+    """
+    :param file_name: the .json sidecar or one of the .npy files
+    :return: ticket, additional data ("last_" + power totals and energy range, None if not available)
+    """
+    base_name = __get_npy_base_name(file_name)
+    directory = os.path.dirname(base_name)
+
+    with open(base_name + ".json", "r") as file: sidecar = json.load(file)
+
+    if sidecar.get("format", None) != POWER_DENSITY_NPY_FORMAT: raise ValueError("File " + base_name + ".json is not a power density sidecar")
+
+    ticket = {}
+    ticket["histogram"]    = numpy.load(os.path.join(directory, sidecar["histogram"]), mmap_mode=mmap_mode)
+    ticket["bin_h_center"] = numpy.load(os.path.join(directory, sidecar["bin_h_center"]), mmap_mode=mmap_mode)
+    ticket["bin_v_center"] = numpy.load(os.path.join(directory, sidecar["bin_v_center"]), mmap_mode=mmap_mode)
+    ticket["histogram_h"]  = ticket["histogram"].sum(axis=1)
+    ticket["histogram_v"]  = ticket["histogram"].sum(axis=0)
+    ticket["h_label"]      = sidecar["h_label"]
+    ticket["v_label"]      = sidecar["v_label"]
+    ticket["intensity"]    = sidecar["intensity"]
+    ticket["nrays"]        = sidecar["nrays"]
+    ticket["good_rays"]    = sidecar["good_rays"]
+
+    try:
+        additional_data = {}
+        for name in ["plotted_power", "incident_power", "total_power", "energy_min", "energy_max", "energy_step"]:
+            additional_data["last_" + name] = sidecar[name]
+    except KeyError:
+        additional_data = None
+
+    return ticket, additional_data
+
+def __get_npy_base_name(file_name):
+    base_name, extension = os.path.splitext(file_name)
+
+    # <name>_h.npy and <name>_v.npy (bin centers) belong to <name>.json
+    if extension.lower() == ".npy" and base_name[-2:] in ["_h", "_v"] and not os.path.exists(base_name + ".json"):
+        base_name = base_name[:-2]
+
+    return base_name
+
+def __to_json(value):
+    return value.item() if isinstance(value, numpy.generic) else value
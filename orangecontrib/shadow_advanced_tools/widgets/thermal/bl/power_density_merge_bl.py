@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# #########################################################################
+# Copyright (c) 2026, UChicago Argonne, LLC. All rights reserved.         #
+#                                                                         #
+# Copyright 2026. UChicago Argonne, LLC. This software was produced       #
+# under U.S. Government contract DE-AC02-06CH11357 for Argonne National   #
+# Laboratory (ANL), which is operated by UChicago Argonne, LLC for the    #
+# U.S. Department of Energy. The U.S. Government has rights to use,       #
+# reproduce, and distribute this software.  NEITHER THE GOVERNMENT NOR    #
+# UChicago Argonne, LLC MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR        #
+# ASSUMES ANY LIABILITY FOR THE USE OF THIS SOFTWARE.  If software is     #
+# modified to produce derivative works, such modified software should     #
+# be clearly marked, so as not to confuse it with the version available   #
+# from ANL.                                                               #
+#                                                                         #
+# Additionally, redistribution and use in source and binary forms, with   #
+# or without modification, are permitted provided that the following      #
+# conditions are met:                                                     #
+#                                                                         #
+#     * Redistributions of source code must retain the above copyright    #
+#       notice, this list of conditions and the following disclaimer.     #
+#                                                                         #
+#     * Redistributions in binary form must reproduce the above copyright #
+#       notice, this list of conditions and the following disclaimer in   #
+#       the documentation and/or other materials provided with the        #
+#       distribution.                                                     #
+#                                                                         #
+#     * Neither the name of UChicago Argonne, LLC, Argonne National       #
+#       Laboratory, ANL, the U.S. Government, nor the names of its        #
+#       contributors may be used to endorse or promote products derived   #
+#       from this software without specific prior written permission.     #
+#                                                                         #
+# THIS SOFTWARE IS PROVIDED BY UChicago Argonne, LLC AND CONTRIBUTORS     #
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT       #
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS       #
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL UChicago     #
+# Argonne, LLC OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,        #
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,    #
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;        #
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER        #
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT      #
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN       #
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE         #
+# POSSIBILITY OF SUCH DAMAGE.                                             #
+# #########################################################################
+
+
+import numpy
+import os, json, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import h5py
+
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_density_bl import get_bin_edges, get_bin_centers, rebin_power_density
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_density_io_bl import PowerDensityHdf5File, \
+    is_power_density_file, read_power_density_file, is_power_density_npy_file, read_power_density_npy
+
+####################################################################################
+# COMPENSATED SUMMATION
+####################################################################################
+
+class CompensatedSum():
+    """
+    Kahan-Babuska (Neumaier) summation of arrays or scalars: the rounding errors of the running sum are
+    accumulated separately and added back at the end.
+    """
+    def __init__(self, shape=()):
+        self.sum          = numpy.zeros(shape)
+        self.compensation = numpy.zeros(shape)
+
+    def add(self, value):
+        total = self.sum + value
+
+        self.compensation += numpy.where(numpy.abs(self.sum) >= numpy.abs(value), (self.sum - total) + value, (value - total) + self.sum)
+        self.sum = total
+
+    def merge(self, other):
+        self.add(other.sum)
+        self.add(other.compensation)
+
+    def get(self):
+        return self.sum + self.compensation
+
+####################################################################################
+# MERGE OF POWER DENSITY FILES
+####################################################################################
+
+SUMMED_DATA = ["plotted_power", "incident_power", "total_power", "intensity", "nrays", "good_rays"]
+
+def merge_power_density_files(file_names, output_file_name, average=False, x_edges=None, y_edges=None, n_processes=0):
+    """
+    Sums (or averages) the cumulated plots of power density files (autosave HDF5 or NPY + JSON) and writes the
+    result as a power density autosave file. Histograms and power values are summed with compensated summation.
+    The files are split among worker processes (n_processes=0: one per CPU), each one reading a file at a time.
+
+    :param x_edges, y_edges: bin edges of the merged plot. If None: the common grid if all the files have the same
+                             bins, otherwise the union of their ranges with the bin size of the first file. Plots on
+                             different bins are rebinned conservatively (same power).
+    :return: the merged ticket
+    """
+    file_names = list(file_names)
+
+    if len(file_names) == 0: raise ValueError("No files to merge")
+
+    for file_name in file_names:
+        if not (is_power_density_file(file_name) or is_power_density_npy_file(file_name)):
+            raise ValueError("File " + file_name + " is not a power density file")
+
+    coordinates = [__read_coordinates(file_name) for file_name in file_names]
+
+    if x_edges is None or y_edges is None: x_edges, y_edges = __get_common_grid(coordinates)
+
+    x_edges, y_edges = numpy.asarray(x_edges, dtype=float), numpy.asarray(y_edges, dtype=float)
+    x, y             = get_bin_centers(x_edges), get_bin_centers(y_edges)
+
+    n_processes = int(n_processes) if n_processes and int(n_processes) > 0 else (os.cpu_count() or 1)
+    n_processes = max(1, min(n_processes, len(file_names)))
+    chunks      = [chunk.tolist() for chunk in numpy.array_split(numpy.array(file_names, dtype=object), n_processes)]
+
+    if n_processes == 1:
+        partial_results = [__reduce_files(chunks[0], x_edges, y_edges)]
+    else:
+        with ProcessPoolExecutor(max_workers=n_processes, mp_context=multiprocessing.get_context("spawn")) as executor:
+            partial_results = list(executor.map(__reduce_files, chunks, [x_edges]*n_processes, [y_edges]*n_processes))
+
+    histogram = CompensatedSum((len(x), len(y)))
+    summed    = {name : CompensatedSum() for name in SUMMED_DATA}
+
+    for partial_result in partial_results:
+        histogram.merge(partial_result["histogram"])
+        for name in SUMMED_DATA: summed[name].merge(partial_result[name])
+
+    scale = 1/len(file_names) if average else 1.0
+
+    ticket = {"histogram"    : histogram.get()*scale,
+              "bin_h_center" : x,
+              "bin_v_center" : y,
+              "h_label"      : partial_results[0]["h_label"],
+              "v_label"      : partial_results[0]["v_label"]}
+    ticket["histogram_h"] = ticket["histogram"].sum(axis=1)
+    ticket["histogram_v"] = ticket["histogram"].sum(axis=0)
+    ticket["intensity"]   = summed["intensity"].get()*scale
+    ticket["nrays"]       = int(round(float(summed["nrays"].get())))
+    ticket["good_rays"]   = int(round(float(summed["good_rays"].get())))
+
+    step_data = {"plotted_power"  : float(summed["plotted_power"].get())*scale,
+                 "incident_power" : float(summed["incident_power"].get())*scale,
+                 "total_power"    : float(summed["total_power"].get())*scale,
+                 "energy_min"     : numpy.nanmin([partial_result["energy_min"] for partial_result in partial_results]),
+                 "energy_max"     : numpy.nanmax([partial_result["energy_max"] for partial_result in partial_results]),
+                 "energy_step"    : partial_results[0]["energy_step"]}
+
+    output_file = PowerDensityHdf5File(output_file_name)
+    try:
+        output_file.write_step(ticket, step_data=step_data, force_flush=True)
+    finally:
+        output_file.close()
+
+    with h5py.File(output_file_name, "a") as file:
+        file.attrs["merged_files"] = json.dumps([os.path.abspath(file_name) for file_name in file_names])
+        file.attrs["merge_operation"] = "average" if average else "sum"
+
+    return ticket
+
+def __read_coordinates(file_name):
+    if is_power_density_file(file_name):
+        with h5py.File(file_name, "r") as file: return file["coordinates/X"][()], file["coordinates/Y"][()]
+    else:
+        ticket, _ = read_power_density_npy(file_name, mmap_mode="r")
+
+        return numpy.array(ticket["bin_h_center"]), numpy.array(ticket["bin_v_center"])
+
+def __get_common_grid(coordinates):
+    # edges of the merged plot
+    x, y = coordinates[0]
+
+    if all(len(xi) == len(x) and len(yi) == len(y) and numpy.allclose(xi, x) and numpy.allclose(yi, y) for xi, yi in coordinates[1:]):
+        return get_bin_edges(x), get_bin_edges(y)
+
+    return __get_union_grid([xi for xi, _ in coordinates]), __get_union_grid([yi for _, yi in coordinates])
+
+def __get_union_grid(centers):
+    edges = [get_bin_edges(center) for center in centers]
+    start = min(edge[0] for edge in edges)
+    stop  = max(edge[-1] for edge in edges)
+    nbins = max(1, int(numpy.ceil((stop - start)/(edges[0][1] - edges[0][0]) - 1e-9)))
+
+    return numpy.linspace(start, stop, nbins + 1)
+
+def __reduce_files(file_names, x_edges, y_edges):
+    # one file in memory at a time
+    histogram = CompensatedSum((len(x_edges) - 1, len(y_edges) - 1))
+    summed    = {name : CompensatedSum() for name in SUMMED_DATA}
+    result    = {"energy_min" : numpy.nan, "energy_max" : numpy.nan, "energy_step" : numpy.nan, "h_label" : "", "v_label" : ""}
+
+    for index, file_name in enumerate(file_names):
+        if is_power_density_file(file_name): ticket, additional_data = read_power_density_file(file_name)
+        else:                                ticket, additional_data = read_power_density_npy(file_name)
+
+        file_x, file_y = ticket["bin_h_center"], ticket["bin_v_center"]
+
+        file_x_edges, file_y_edges = get_bin_edges(file_x), get_bin_edges(file_y)
+
+        if len(file_x_edges) == len(x_edges) and len(file_y_edges) == len(y_edges) and numpy.allclose(file_x_edges, x_edges) and numpy.allclose(file_y_edges, y_edges):
+            histogram.add(ticket["histogram"])
+        else:
+            histogram.add(rebin_power_density(file_x, file_y, ticket["histogram"], x_edges, y_edges))
+
+        summed["intensity"].add(float(ticket.get("intensity", 0.0)))
+        summed["nrays"].add(float(ticket.get("nrays", 0)))
+        summed["good_rays"].add(float(ticket.get("good_rays", 0)))
+
+        if additional_data is None:
+            pixel_area = numpy.diff(file_x_edges[:2])[0]*numpy.diff(file_y_edges[:2])[0]
+
+            summed["plotted_power"].add(float(numpy.sum(ticket["histogram"])*pixel_area))
+        else:
+            for name in ["plotted_power", "incident_power", "total_power"]:
+                value = float(additional_data["last_" + name])
+                if not numpy.isnan(value): summed[name].add(value)
+
+            result["energy_min"] = numpy.nanmin([result["energy_min"], additional_data["last_energy_min"]])
+            result["energy_max"] = numpy.nanmax([result["energy_max"], additional_data["last_energy_max"]])
+            if numpy.isnan(result["energy_step"]): result["energy_step"] = additional_data["last_energy_step"]
+
+        if index == 0: result["h_label"], result["v_label"] = ticket["h_label"], ticket["v_label"]
+
+    result["histogram"] = histogram
+    result.update(summed)
+
+    return result
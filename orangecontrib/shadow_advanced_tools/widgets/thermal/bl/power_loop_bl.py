@@ -0,0 +1,789 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# #########################################################################
+# Copyright (c) 2026, UChicago Argonne, LLC. All rights reserved.         #
+#                                                                         #
+# Copyright 2026. UChicago Argonne, LLC. This software was produced       #
+# under U.S. Government contract DE-AC02-06CH11357 for Argonne National   #
+# Laboratory (ANL), which is operated by UChicago Argonne, LLC for the    #
+# U.S. Department of Energy. The U.S. Government has rights to use,       #
+# reproduce, and distribute this software.  NEITHER THE GOVERNMENT NOR    #
+# UChicago Argonne, LLC MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR        #
+# ASSUMES ANY LIABILITY FOR THE USE OF THIS SOFTWARE.  If software is     #
+# modified to produce derivative works, such modified software should     #
+# be clearly marked, so as not to confuse it with the version available   #
+# from ANL.                                                               #
+#                                                                         #
+# Additionally, redistribution and use in source and binary forms, with   #
+# or without modification, are permitted provided that the following      #
+# conditions are met:                                                     #
+#                                                                         #
+#     * Redistributions of source code must retain the above copyright    #
+#       notice, this list of conditions and the following disclaimer.     #
+#                                                                         #
+#     * Redistributions in binary form must reproduce the above copyright #
+#       notice, this list of conditions and the following disclaimer in   #
+#       the documentation and/or other materials provided with the        #
+#       distribution.                                                     #
+#                                                                         #
+#     * Neither the name of UChicago Argonne, LLC, Argonne National       #
+#       Laboratory, ANL, the U.S. Government, nor the names of its        #
+#       contributors may be used to endorse or promote products derived   #
+#       from this software without specific prior written permission.     #
+#                                                                         #
+# THIS SOFTWARE IS PROVIDED BY UChicago Argonne, LLC AND CONTRIBUTORS     #
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT       #
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS       #
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL UChicago     #
+# Argonne, LLC OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,        #
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,    #
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;        #
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER        #
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT      #
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN       #
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE         #
+# POSSIBILITY OF SUCH DAMAGE.                                             #
+# #########################################################################
+
+
+import numpy
+import os, copy, ast, json, base64, pickle, importlib, importlib.util, multiprocessing
+import xml.etree.ElementTree as ElementTree
+from functools import partial
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor
+
+import scipy.constants as codata
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from orangewidget.settings import Setting
+from oasys.widgets import congruence
+
+from orangecontrib.shadow.util.shadow_objects import ShadowBeam, ShadowSource, ShadowOpticalElement, ShadowOEHistoryItem
+from orangecontrib.shadow.util.shadow_util import ShadowCongruence
+
+from orangecontrib.shadow_advanced_tools.widgets.sources.attributes.hybrid_undulator_attributes import HybridUndulatorAttributes
+from orangecontrib.shadow_advanced_tools.widgets.sources.bl.hybrid_undulator_bl import run_hybrid_undulator_simulation
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_calculation_bl import PowerDensityCalculator
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_density_io_bl import PowerDensityHdf5File, get_autosave_step_data
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_density_merge_bl import merge_power_density_files
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_checkpoint_bl import CheckpointSchedule, write_checkpoint, read_checkpoint, \
+    restore_autosave_file, get_random_state, set_random_state, get_checkpoint_file_name
+
+####################################################################################
+# ENERGY STEPS
+####################################################################################
+
+AUTOBINNING_FILE = "autobinning.dat"
+FILTERS_FILE     = "filters.dat"
+
+def get_energy_binnings(energies, external_binning=False):
+    """
+    :param energies: text with one binning per row, as in the Power Density Loop Point:
+                     "from, to, step" (manual binning) or "energy, step, power" (external binning, e.g. autobinning)
+    :return: list of binnings, with the attributes of EnergyBinning
+    """
+    energy_binnings = []
+
+    for row in energies.split("\n"):
+        data = [token.strip() for token in row.split(",")]
+
+        if len(data) == 3:
+            if external_binning:
+                energy_binnings.append(SimpleNamespace(energy_value=float(data[0]), energy_value_to=None, energy_step=float(data[1]), power_step=float(data[2])))
+            else:
+                energy_binnings.append(SimpleNamespace(energy_value=float(data[0]), energy_value_to=float(data[1]), energy_step=float(data[2]), power_step=None))
+
+    if len(energy_binnings) == 0: raise ValueError("No energy binning specified")
+
+    return energy_binnings
+
+def get_auto_energy_binnings(spectrum_data, autobinning=1, auto_n_step=1001, auto_perc_total_power=99, filters=None):
+    """
+    Automatic binning of the Power Density Loop Point, on the spectrum up to auto_perc_total_power % of the total power
+
+    :param spectrum_data: columns energy [eV], flux [ph/s/0.1%bw]
+    :param autobinning: 1 = constant power, 2 = constant energy
+    :param filters: columns energy [eV], intensity factor (None: no filters)
+    :return: binnings (external binning) and the curves of the calculation
+    """
+    congruence.checkStrictlyPositiveNumber(auto_n_step, "(Auto) % Number of Steps")
+    congruence.checkStrictlyPositiveNumber(auto_perc_total_power, "(Auto) % Total Power")
+
+    energies                              = spectrum_data[:, 0]
+    flux_through_finite_aperture          = spectrum_data[:, 1]
+    flux_through_finite_aperture_filtered = flux_through_finite_aperture.copy()
+
+    use_filters = not filters is None
+
+    if use_filters: flux_through_finite_aperture_filtered *= numpy.interp(energies, filters[:, 0], filters[:, 1])
+
+    energy_step = energies[1] - energies[0]
+
+    # last energy do not contribute to the total (the approximated integral of the power is out of the range)
+
+    cumulated_power          = numpy.cumsum(flux_through_finite_aperture * (1e3 * energy_step * codata.e))
+    cumulated_power_filtered = numpy.cumsum(flux_through_finite_aperture_filtered * (1e3 * energy_step * codata.e))
+
+    if use_filters:
+        cumulated_power_binning              = cumulated_power_filtered
+        flux_through_finite_aperture_binning = flux_through_finite_aperture_filtered
+    else:
+        cumulated_power_binning              = cumulated_power
+        flux_through_finite_aperture_binning = flux_through_finite_aperture
+
+    good = numpy.where(cumulated_power_binning <= auto_perc_total_power*0.01*cumulated_power_binning[-1])
+
+    energies                              = energies[good]
+    cumulated_power                       = cumulated_power[good]
+    cumulated_power_filtered              = cumulated_power_filtered[good]
+    cumulated_power_binning               = cumulated_power_binning[good]
+    flux_through_finite_aperture          = flux_through_finite_aperture[good]
+    flux_through_finite_aperture_filtered = flux_through_finite_aperture_filtered[good]
+    flux_through_finite_aperture_binning  = flux_through_finite_aperture_binning[good]
+
+    if autobinning == 1: # constant power
+        interpolated_cumulated_power = numpy.linspace(start=numpy.min(cumulated_power_binning), stop=numpy.max(cumulated_power_binning), num=auto_n_step+1)
+        interpolated_energies        = numpy.interp(interpolated_cumulated_power, cumulated_power_binning, energies)
+        energy_steps = numpy.ediff1d(interpolated_energies)
+
+        interpolated_energies        = interpolated_energies[:-1]
+        interpolated_cumulated_power = interpolated_cumulated_power[:-1]
+
+        power_steps  = numpy.ones(auto_n_step)*cumulated_power_binning[-1]/auto_n_step
+    elif autobinning == 2: # constant energy
+        minimum_energy = energies[0]
+        maximum_energy = energies[-1]
+        energy_step = (maximum_energy-minimum_energy)/auto_n_step
+
+        interpolated_energies        = numpy.arange(minimum_energy, maximum_energy, energy_step)
+        interpolated_cumulated_power = numpy.interp(interpolated_energies, energies, cumulated_power_binning)
+
+        energy_steps = numpy.ones(auto_n_step)*energy_step
+        power_steps  = numpy.ediff1d(numpy.append(numpy.zeros(1), interpolated_cumulated_power))
+    else:
+        raise ValueError("Automatic binning must be 1 (constant power) or 2 (constant energy)")
+
+    energy_binnings = [SimpleNamespace(energy_value=round(energy_value, 3), energy_value_to=None, energy_step=round(energy_step, 3), power_step=round(power_step, 4))
+                       for energy_value, energy_step, power_step in zip(interpolated_energies, energy_steps, power_steps)]
+
+    return SimpleNamespace(energy_binnings=energy_binnings,
+                           energies=energies,
+                           cumulated_power=cumulated_power,
+                           cumulated_power_filtered=cumulated_power_filtered,
+                           flux_through_finite_aperture=flux_through_finite_aperture,
+                           flux_through_finite_aperture_filtered=flux_through_finite_aperture_filtered,
+                           interpolated_energies=interpolated_energies,
+                           interpolated_cumulated_power=interpolated_cumulated_power,
+                           flux_steps=numpy.interp(interpolated_energies, energies, flux_through_finite_aperture_binning),
+                           power_steps=power_steps)
+
+def get_energy_steps(energy_binnings, external_binning=False, send_power_step=False):
+    """
+    Steps sent by the Power Density Loop Point for the binnings, in the same order and with the same values.
+
+    :return: list of steps (current_step, total_steps, energy_value, energy_step, power_step)
+    """
+    steps = []
+
+    for energy_binning in energy_binnings:
+        number_of_steps = __get_number_of_steps(energy_binning, external_binning)
+
+        power_step   = None if energy_binning.power_step is None or not send_power_step else round(energy_binning.power_step, 8)
+        energy_value = round(energy_binning.energy_value, 8)
+
+        for index in range(number_of_steps):
+            if index > 0: energy_value = round(energy_value + energy_binning.energy_step, 8)
+
+            steps.append(SimpleNamespace(current_step=len(steps) + 1,
+                                         energy_value=energy_value,
+                                         energy_step=energy_binning.energy_step,
+                                         power_step=power_step))
+
+    for step in steps: step.total_steps = len(steps)
+
+    return steps
+
+def get_binning_position(energy_binnings, current_step, external_binning=False):
+    """
+    :return: index of the binning of the step (current_step is 1-based), position of the step in the binning (1-based)
+    """
+    first_step = 1
+
+    for index, energy_binning in enumerate(energy_binnings):
+        number_of_steps = __get_number_of_steps(energy_binning, external_binning)
+
+        if current_step < first_step + number_of_steps: return index, current_step - first_step + 1
+
+        first_step += number_of_steps
+
+    raise ValueError("Step " + str(current_step) + " is not part of the loop")
+
+def __get_number_of_steps(energy_binning, external_binning):
+    if external_binning: return 1
+    else:                return int((energy_binning.energy_value_to - energy_binning.energy_value) / energy_binning.energy_step)
+
+def get_shard(steps, n_shards, index):
+    """
+    :return: the index-th of n_shards contiguous blocks of steps, of (almost) equal size
+    """
+    if not 0 <= index < n_shards: raise ValueError("Shard index must be between 0 and " + str(n_shards - 1))
+
+    bounds = numpy.linspace(0, len(steps), n_shards + 1).round().astype(int)
+
+    return steps[bounds[index]:bounds[index + 1]]
+
+def get_shard_file_name(working_directory, index, n_shards):
+    return os.path.join(working_directory, "power_loop_shard_" + str(index + 1).zfill(4) + "_of_" + str(n_shards).zfill(4) + ".hdf5")
+
+####################################################################################
+# HEADLESS SOURCE AND BEAMLINE
+####################################################################################
+
+# settings of the Power Plot XY used by the loop, with the defaults of the widget
+POWER_PLOT_SETTINGS = {"image_plane"                  : 0,
+                       "image_plane_new_position"     : 10.0,
+                       "image_plane_rel_abs_position" : 0,
+                       "x_column_index"               : 0,
+                       "y_column_index"               : 2,
+                       "x_range"                      : 0,
+                       "x_range_min"                  : 0.0,
+                       "x_range_max"                  : 0.0,
+                       "y_range"                      : 0,
+                       "y_range_min"                  : 0.0,
+                       "y_range_max"                  : 0.0,
+                       "rays"                         : 1,
+                       "number_of_bins"               : 100,
+                       "number_of_bins_v"             : 100,
+                       "kind_of_calculation"          : 0,
+                       "replace_poor_statistic"       : 0,
+                       "good_rays_limit"              : 100,
+                       "center_x"                     : 0.0,
+                       "center_y"                     : 0.0,
+                       "sigma_x"                      : 0.0,
+                       "sigma_y"                      : 0.0,
+                       "gamma"                        : 0.0,
+                       "cumulated_quantity"           : 0,
+                       "autosave_partial_results"     : 0,
+                       "autosave_swmr"                : 0,
+                       "autosave_flush_interval"      : 5.0,
+                       "autosave_flush_steps"         : 10}
+
+class HeadlessHybridUndulator(HybridUndulatorAttributes):
+    """
+    Hybrid Undulator without GUI: settings (widget defaults, overwritten by the given ones) and the widget methods
+    called by the hybrid undulator calculation
+    """
+    def __init__(self, settings={}, workspace_units_to_m=1.0):
+        for name in dir(HybridUndulatorAttributes):
+            value = getattr(HybridUndulatorAttributes, name)
+            if isinstance(value, Setting): setattr(self, name, copy.deepcopy(value.default))
+
+        for name, value in settings.items(): setattr(self, name, value)
+
+        self.workspace_units_to_m = workspace_units_to_m
+
+        # the automatic waist calculation draws on these, off screen
+        figure = Figure()
+        self.waist_axes   = figure.subplots(1, 2)
+        self.waist_figure = FigureCanvasAgg(figure)
+
+    def progressBarSet(self, value): pass
+
+    def setStatusMessage(self, message):
+        if message: print(message)
+
+    def fixWeirdShadowBug(self): pass # workaround of the GUI environment
+
+def get_beamline(beamline):
+    """
+    :param beamline: None (power at the source), "module:function" or "file.py:function" (function(beam) -> traced
+                     ShadowBeam), or list of SHADOW start files of the optical elements (start.01, start.02, ...)
+    :return: function(beam) -> traced ShadowBeam
+    """
+    if beamline is None or len(beamline) == 0:
+        return __no_beamline
+    elif isinstance(beamline, str):
+        module_name, function_name = beamline.rsplit(":", 1)
+
+        if module_name.endswith(".py"):
+            specification = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(module_name))[0], module_name)
+            module = importlib.util.module_from_spec(specification)
+            specification.loader.exec_module(module)
+        else:
+            module = importlib.import_module(module_name)
+
+        return getattr(module, function_name)
+    else:
+        for start_file in beamline: congruence.checkFile(start_file)
+
+        return partial(__trace_start_files, list(beamline))
+
+def __no_beamline(beam):
+    return beam
+
+def __trace_start_files(start_files, beam):
+    for start_file in start_files:
+        shadow_oe = ShadowOpticalElement.create_empty_oe()
+        shadow_oe._oe.load(start_file)
+
+        beam = ShadowBeam.traceFromOE(beam, shadow_oe, history=True, widget_class_name="Headless Optical Element")
+
+    return beam
+
+####################################################################################
+# POWER LOOP
+####################################################################################
+
+def trace_power_step(source, beamline, step, seed):
+    """
+    Step of the loop as run by the widgets: Hybrid Undulator at the energy of the step, then the beamline
+
+    :return: traced beam, with the scanning data of the step (None if the source has no power)
+    """
+    source.seed                = seed
+    source.compute_power       = True
+    source.use_harmonic        = 1
+    source.distribution_source = 0
+    source.save_srw_result     = 0
+    source.energy              = step.energy_value
+    source.energy_step         = step.energy_step
+    source.power_step          = -1 if step.power_step is None else step.power_step
+    source.current_step        = step.current_step
+    source.total_steps         = step.total_steps
+    source.start_event         = step.current_step == 1
+
+    beam_out, total_power = run_hybrid_undulator_simulation(source, do_cumulated_calculations=False)
+
+    if not total_power: return None
+
+    beam_out.getOEHistory().append(ShadowOEHistoryItem(shadow_source_start=ShadowSource.create_src(),
+                                                       shadow_source_end=ShadowSource.create_src(),
+                                                       widget_class_name="Hybrid Undulator"))
+
+    scanning_data = ShadowBeam.ScanningData("photon_energy", step.energy_value, "Energy for Power Calculation", "eV",
+                                            {"total_power"        : total_power,
+                                             "photon_energy_step" : step.energy_step,
+                                             "current_step"       : step.current_step,
+                                             "total_steps"        : step.total_steps,
+                                             "seed"               : seed})
+    beam_out.setScanningData(scanning_data)
+
+    beam = beamline(beam_out)
+    beam.setScanningData(scanning_data)
+
+    return beam
+
+class PowerLoopState():
+    """
+    Running total of the loop, as kept by the Power Plot XY
+    """
+    def __init__(self):
+        self.calculator            = PowerDensityCalculator()
+        self.cumulated_ticket      = None
+        self.energy_min            = None
+        self.energy_max            = None
+        self.cumulated_total_power = None
+
+    def add_step(self, beam, settings, workspace_units_to_m=1.0):
+        """
+        :return: ticket of the step (None if the beam has no good rays: the power is counted, nothing is plotted)
+        """
+        data = beam.scanned_variable_data
+
+        total_power = data.get_additional_parameter("total_power")
+        energy_step = data.get_additional_parameter("photon_energy_step")
+
+        if settings["cumulated_quantity"] == 1: total_power /= (1e3 * energy_step * codata.e)  # to ph/s
+
+        self.energy_max = data.get_scanned_variable_value()
+
+        if self.energy_min is None:
+            self.energy_min            = self.energy_max
+            self.cumulated_total_power = total_power
+        else:
+            self.cumulated_total_power += total_power
+
+        if not (ShadowCongruence.checkEmptyBeam(beam) and ShadowCongruence.checkGoodBeam(beam)): return None
+
+        to_mm = workspace_units_to_m * 1e3
+
+        xrange, yrange = self.__get_ranges(settings, to_mm)
+
+        self.cumulated_ticket, last_ticket = self.calculator.calculate_power_density(self.__get_beam_to_plot(beam, settings),
+                                                                                     settings["x_column_index"] + 1,
+                                                                                     settings["y_column_index"] + 1,
+                                                                                     total_power, self.cumulated_total_power,
+                                                                                     self.energy_min, self.energy_max, energy_step,
+                                                                                     nbins_h=int(settings["number_of_bins"]),
+                                                                                     nbins_v=int(settings["number_of_bins_v"]),
+                                                                                     xrange=xrange, yrange=yrange,
+                                                                                     nolost=settings["rays"] + 1,
+                                                                                     ticket_to_add=self.cumulated_ticket,
+                                                                                     to_mm=to_mm,
+                                                                                     kind_of_calculation=settings["kind_of_calculation"],
+                                                                                     replace_poor_statistic=settings["replace_poor_statistic"],
+                                                                                     good_rays_limit=settings["good_rays_limit"],
+                                                                                     center_x=settings["center_x"],
+                                                                                     center_y=settings["center_y"],
+                                                                                     sigma_x=settings["sigma_x"],
+                                                                                     sigma_y=settings["sigma_y"],
+                                                                                     gamma=settings["gamma"])
+
+        return self.cumulated_ticket if last_ticket is None else last_ticket
+
+    def get_checkpoint_data(self):
+        return {"energy_min"                    : self.energy_min,
+                "energy_max"                    : self.energy_max,
+                "cumulated_total_power"         : self.cumulated_total_power,
+                "cumulated_power_plot"          : self.calculator.cumulated_power_plot,
+                "cumulated_previous_power_plot" : self.calculator.cumulated_previous_power_plot}
+
+    def restore(self, checkpoint):
+        data = checkpoint.data
+
+        self.cumulated_ticket      = checkpoint.ticket
+        self.energy_min            = data["energy_min"]
+        self.energy_max            = data["energy_max"]
+        self.cumulated_total_power = data["cumulated_total_power"]
+
+        self.calculator.cumulated_power_plot          = data["cumulated_power_plot"] or 0.0
+        self.calculator.cumulated_previous_power_plot = data["cumulated_previous_power_plot"] or 0.0
+        self.calculator.power_density_accumulator     = None # rebuilt from the cumulated ticket at the next step
+
+    @classmethod
+    def __get_ranges(cls, settings, to_mm):
+        xrange = None
+        yrange = None
+
+        if settings["x_range"] == 1:
+            congruence.checkLessThan(settings["x_range_min"], settings["x_range_max"], "X range min", "X range max")
+            xrange = [settings["x_range_min"] / to_mm, settings["x_range_max"] / to_mm]
+
+        if settings["y_range"] == 1:
+            congruence.checkLessThan(settings["y_range_min"], settings["y_range_max"], "Y range min", "Y range max")
+            yrange = [settings["y_range_min"] / to_mm, settings["y_range_max"] / to_mm]
+
+        return xrange, yrange
+
+    @classmethod
+    def __get_beam_to_plot(cls, beam, settings):
+        if settings["image_plane"] == 0: return beam
+
+        new_shadow_beam = beam.duplicate(history=False)
+
+        if settings["image_plane_rel_abs_position"] == 1:  # relative
+            dist = settings["image_plane_new_position"]
+        else:  # absolute
+            history_item = None if beam.historySize() == 0 else beam.getOEHistory(oe_number=beam._oe_number)
+
+            if history_item is None or beam._oe_number == 0: image_plane = 0.0
+            else: image_plane = history_item._shadow_oe_end._oe.T_IMAGE
+
+            dist = settings["image_plane_new_position"] - image_plane
+
+        new_shadow_beam._beam.retrace(dist)
+
+        return new_shadow_beam
+
+def get_power_plot_settings(configuration):
+    settings = dict(POWER_PLOT_SETTINGS)
+    settings.update(configuration.get("power_plot", {}))
+
+    congruence.checkStrictlyPositiveNumber(settings["number_of_bins"], "Number of Bins")
+    congruence.checkStrictlyPositiveNumber(settings["number_of_bins_v"], "Number of Bins V")
+
+    return settings
+
+def run_power_loop(configuration, steps, autosave_file_name, checkpoint_file_name=None, checkpoint_steps=10, checkpoint_interval=300.0, resume=False):
+    """
+    Headless power density loop: every step is traced (source and beamline) and accumulated as in the widgets,
+    the running total is written in a power density autosave file.
+
+    :param configuration: dictionary with keys:
+                          "source": settings of the Hybrid Undulator,
+                          "beamline": see get_beamline,
+                          "power_plot": settings of the Power Plot XY (POWER_PLOT_SETTINGS),
+                          "workspace_units_to_m": workspace units (default 1.0),
+                          "loop": settings of the Power Density Loop Point (LOOP_SETTINGS), for the seed increment
+    :param steps: steps to run (from get_energy_steps or get_shard): with the same seed increment, the result of a
+                  step does not depend on the other steps
+    :param checkpoint_file_name: checkpoint of the loop, written every checkpoint_steps steps or checkpoint_interval
+                                 seconds (None: no checkpoint)
+    :param resume: restart from the checkpoint (if it exists): the steps already done are skipped, the cumulated plot,
+                   the autosave file and the state of the random generator are restored
+    :return: the cumulated ticket
+    """
+    workspace_units_to_m = configuration.get("workspace_units_to_m", 1.0)
+    seed_increment       = get_loop_settings(configuration)["seed_increment"]
+    settings             = get_power_plot_settings(configuration)
+
+    source   = HeadlessHybridUndulator(configuration.get("source", {}), workspace_units_to_m)
+    beamline = get_beamline(configuration.get("beamline", None))
+    seed     = source.seed
+    state    = PowerLoopState()
+
+    congruence.checkDir(autosave_file_name)
+
+    autosave_options = {"swmr"           : settings["autosave_swmr"] == 1,
+                        "flush_interval" : settings["autosave_flush_interval"],
+                        "flush_steps"    : settings["autosave_flush_steps"]}
+
+    if resume and not checkpoint_file_name is None and os.path.exists(checkpoint_file_name):
+        checkpoint = read_checkpoint(checkpoint_file_name)
+        last_step  = checkpoint.data["current_step"]
+
+        if len(steps) > 0 and (checkpoint.data["total_steps"] != steps[0].total_steps or not steps[0].current_step - 1 <= last_step <= steps[-1].current_step):
+            raise ValueError("Checkpoint " + checkpoint_file_name + " belongs to a different loop")
+
+        state.restore(checkpoint)
+        if not checkpoint.random_state is None: set_random_state(checkpoint.random_state)
+
+        autosave_file = restore_autosave_file(autosave_file_name, checkpoint, **autosave_options)
+        steps         = [step for step in steps if step.current_step > last_step]
+
+        print("Power Loop: resumed from " + checkpoint_file_name + ", after step " + str(last_step))
+    else:
+        autosave_file = PowerDensityHdf5File(autosave_file_name, **autosave_options)
+
+    checkpoint_schedule = None if checkpoint_file_name is None else CheckpointSchedule(checkpoint_steps, checkpoint_interval)
+
+    try:
+        for index, step in enumerate(steps):
+            print("Power Loop: step " + str(step.current_step) + " of " + str(step.total_steps) + ", energy " + str(step.energy_value) + " eV")
+
+            # the seed the source would have at this step in the widget loop
+            step_seed = seed + step.current_step * seed_increment
+
+            beam = trace_power_step(source, beamline, step, step_seed)
+
+            last_ticket = None if beam is None else state.add_step(beam, settings, workspace_units_to_m)
+
+            if not last_ticket is None:
+                autosave_file.write_step(state.cumulated_ticket,
+                                         last_ticket=last_ticket if settings["autosave_partial_results"] == 1 else None,
+                                         step_data=get_autosave_step_data(step.current_step, step.total_steps, state.energy_max,
+                                                                          beam.scanned_variable_data.get_additional_parameter("total_power"),
+                                                                          state.cumulated_ticket),
+                                         force_flush=index == len(steps) - 1)
+
+            if not checkpoint_schedule is None and checkpoint_schedule.step(force=index == len(steps) - 1):
+                autosave_file.flush() # the autosave file can have more steps than the checkpoint, never less
+
+                autosave_steps, autosave_partial_results = autosave_file.get_number_of_steps()
+
+                checkpoint_data = state.get_checkpoint_data()
+                checkpoint_data.update({"current_step"             : step.current_step,
+                                        "total_steps"              : step.total_steps,
+                                        "last_energy_value"        : step.energy_value,
+                                        "last_energy_step"         : step.energy_step,
+                                        "seed"                     : step_seed,
+                                        "autosave_steps"           : autosave_steps,
+                                        "autosave_partial_results" : autosave_partial_results})
+
+                write_checkpoint(checkpoint_file_name, state.cumulated_ticket, checkpoint_data, random_state=get_random_state())
+    finally:
+        autosave_file.close()
+
+    return state.cumulated_ticket
+
+####################################################################################
+# DISTRIBUTED POWER LOOP
+####################################################################################
+
+def run_power_loop_shard(configuration, n_shards, index, working_directory, checkpoint_steps=10, checkpoint_interval=300.0, resume=False):
+    """
+    Runs one shard of the loop of configuration["loop"] (see get_loop_steps), writing
+    its power density file (and its checkpoint) in working_directory. Shards can run on different nodes sharing working_directory.
+
+    :return: file name of the shard
+    """
+    steps = get_shard(get_loop_steps(configuration), n_shards, index)
+
+    shard_file_name = get_shard_file_name(working_directory, index, n_shards)
+
+    if len(steps) > 0 and run_power_loop(configuration, steps, shard_file_name,
+                                         checkpoint_file_name=get_checkpoint_file_name(shard_file_name),
+                                         checkpoint_steps=checkpoint_steps,
+                                         checkpoint_interval=checkpoint_interval,
+                                         resume=resume) is None:
+        os.remove(shard_file_name) # no power in the shard: nothing to merge
+
+    return shard_file_name
+
+def merge_power_loop_shards(working_directory, n_shards, output_file_name, n_processes=0):
+    """
+    Sums the power density files of the shards into output_file_name (all the shards must be completed)
+    """
+    shard_file_names = [get_shard_file_name(working_directory, index, n_shards) for index in range(n_shards)]
+    shard_file_names = [file_name for file_name in shard_file_names if os.path.exists(file_name)]
+
+    if len(shard_file_names) == 0: raise ValueError("No shard found in " + working_directory)
+
+    return merge_power_density_files(shard_file_names, output_file_name, average=False, n_processes=n_processes)
+
+def run_distributed_power_loop(configuration, output_file_name, n_workers=0, working_directory=None, checkpoint_steps=10, checkpoint_interval=300.0, resume=False):
+    """
+    Runs the loop of configuration["loop"] on a local pool of n_workers processes (0: one per CPU): the steps are split
+    in contiguous shards, each one traced and accumulated in its own process and file, then the shards are summed.
+    With resume, every shard restarts from its checkpoint (same number of workers as the interrupted run).
+
+    :return: the cumulated ticket
+    """
+    n_steps   = len(get_loop_steps(configuration))
+    n_workers = int(n_workers) if n_workers and int(n_workers) > 0 else (os.cpu_count() or 1)
+    n_workers = max(1, min(n_workers, n_steps))
+
+    if working_directory is None: working_directory = os.path.join(os.path.dirname(os.path.abspath(output_file_name)), "power_loop_shards")
+    os.makedirs(working_directory, exist_ok=True)
+
+    configuration = get_absolute_paths(configuration)
+
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(run_power_loop_shard, configuration, n_workers, index, working_directory,
+                                   checkpoint_steps, checkpoint_interval, resume) for index in range(n_workers)]
+
+        for future in futures: future.result()
+
+    return merge_power_loop_shards(working_directory, n_workers, output_file_name, n_processes=1)
+
+# settings of the Power Density Loop Point used by the loop, with the defaults of the widget
+LOOP_SETTINGS = {"energies"              : "",
+                 "seed_increment"        : 1,
+                 "autobinning"           : 1,
+                 "auto_n_step"           : 1001,
+                 "auto_perc_total_power" : 99,
+                 "send_power_step"       : 0,
+                 "load_file_mode"        : 1,
+                 "skip_rows"             : 1,
+                 "autobinning_file_name" : AUTOBINNING_FILE,
+                 "filters_file_name"     : FILTERS_FILE,
+                 "use_filters"           : 0,
+                 "external_binning"      : 0}
+
+def get_loop_settings(configuration):
+    settings = dict(LOOP_SETTINGS)
+    settings.update(configuration.get("loop", {}))
+
+    return settings
+
+def get_loop_steps(configuration):
+    """
+    Steps of the loop of configuration["loop"] (LOOP_SETTINGS): manual binning ("energies") if autobinning is 0, otherwise
+    automatic binning of the spectrum file (and of the filters file, if use_filters is 1)
+    """
+    settings = get_loop_settings(configuration)
+
+    if settings["autobinning"] == 0:
+        external_binning = settings["external_binning"] == 1
+        energy_binnings  = get_energy_binnings(settings["energies"], external_binning)
+    else:
+        if settings["load_file_mode"] == 1:
+            autobinning_file_name, filters_file_name, skip_rows = AUTOBINNING_FILE, FILTERS_FILE, 1
+        else:
+            autobinning_file_name = settings["autobinning_file_name"]
+            filters_file_name     = settings["filters_file_name"]
+            skip_rows             = congruence.checkPositiveNumber(settings["skip_rows"], "Skip Rows")
+
+        spectrum_data = numpy.loadtxt(congruence.checkFile(autobinning_file_name), skiprows=skip_rows)
+        filters       = numpy.loadtxt(congruence.checkFile(filters_file_name), skiprows=skip_rows) if settings["use_filters"] == 1 else None
+
+        external_binning = True
+        energy_binnings  = get_auto_energy_binnings(spectrum_data,
+                                                    autobinning=settings["autobinning"],
+                                                    auto_n_step=settings["auto_n_step"],
+                                                    auto_perc_total_power=settings["auto_perc_total_power"],
+                                                    filters=filters).energy_binnings
+
+    return get_energy_steps(energy_binnings, external_binning=external_binning, send_power_step=settings["send_power_step"] == 1)
+
+def get_absolute_paths(configuration):
+    # workers and nodes can run in other directories
+    configuration = copy.deepcopy(configuration)
+    beamline      = configuration.get("beamline", None)
+
+    if isinstance(beamline, str):
+        module_name, function_name = beamline.rsplit(":", 1)
+        if module_name.endswith(".py"): configuration["beamline"] = os.path.abspath(module_name) + ":" + function_name
+    elif not beamline is None:
+        configuration["beamline"] = [os.path.abspath(start_file) for start_file in beamline]
+
+    loop = get_loop_settings(configuration)
+
+    if loop["load_file_mode"] == 1:
+        loop["load_file_mode"]        = 0
+        loop["autobinning_file_name"] = AUTOBINNING_FILE
+        loop["filters_file_name"]     = FILTERS_FILE
+        loop["skip_rows"]             = 1
+
+    loop["autobinning_file_name"] = os.path.abspath(loop["autobinning_file_name"])
+    loop["filters_file_name"]     = os.path.abspath(loop["filters_file_name"])
+
+    configuration["loop"] = loop
+
+    return configuration
+
+####################################################################################
+# WORKFLOW AND PARAMETER FILES
+####################################################################################
+
+# configuration key: class of the widget in the workflow
+WORKFLOW_WIDGETS = {"source"     : "HybridUndulator",
+                    "loop"       : "PowerLoopPoint",
+                    "power_plot" : "PowerPlotXY"}
+
+def read_workflow_configuration(file_name):
+    """
+    Configuration of the loop from the settings of the Hybrid Undulator, Power Density Loop Point and Power Plot XY
+    saved in an OASYS workflow (.ows). The beamline and the workspace units are not part of it.
+    """
+    root = ElementTree.parse(congruence.checkFile(file_name)).getroot()
+
+    widget_classes = {node.get("id") : node.get("qualified_name", "").split(".")[-1] for node in root.iter("node")}
+    configuration  = {}
+
+    for properties in root.iter("properties"):
+        widget_class = widget_classes.get(properties.get("node_id"), None)
+
+        for key, name in WORKFLOW_WIDGETS.items():
+            if widget_class == name:
+                if key in configuration: raise ValueError("Workflow " + file_name + " contains more than one " + name + " widget")
+
+                configuration[key] = __read_properties(properties)
+
+    for key, name in WORKFLOW_WIDGETS.items():
+        if not key in configuration: raise ValueError("Workflow " + file_name + " does not contain a " + name + " widget")
+
+    return configuration
+
+def __read_properties(properties):
+    properties_format = properties.get("format", "literal")
+    data              = properties.text or ""
+
+    if properties_format == "literal":  settings = ast.literal_eval(data)
+    elif properties_format == "json":   settings = json.loads(data)
+    elif properties_format == "pickle": settings = pickle.loads(base64.decodebytes(data.encode("ascii")))
+    else: raise ValueError("Format of the widget settings not recognized: " + properties_format)
+
+    # geometry and internal data of the widget are not settings of the calculation
+    return {name : value for name, value in settings.items() if not name.startswith("__") and not isinstance(value, bytes)}
+
+def read_parameter_file(file_name):
+    """
+    Configuration of the loop from a JSON file, with the keys of run_power_loop and "loop"
+    """
+    with open(congruence.checkFile(file_name), "r") as file: return json.load(file)
+
+def write_parameter_file(configuration, file_name):
+    with open(file_name, "w") as file: json.dump(configuration, file, indent=4, default=__to_json)
+
+def read_configuration(file_name):
+    if os.path.splitext(file_name)[1].lower() == ".ows": return read_workflow_configuration(file_name)
+    else:                                                return read_parameter_file(file_name)
+
+def __to_json(value):
+    if isinstance(value, numpy.ndarray): return value.tolist()
+    elif isinstance(value, numpy.generic): return value.item()
+    else: return str(value)
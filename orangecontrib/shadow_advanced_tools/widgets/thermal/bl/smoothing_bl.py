@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# #########################################################################
+# Copyright (c) 2026, UChicago Argonne, LLC. All rights reserved.         #
+#                                                                         #
+# Copyright 2026. UChicago Argonne, LLC. This software was produced       #
+# under U.S. Government contract DE-AC02-06CH11357 for Argonne National   #
+# Laboratory (ANL), which is operated by UChicago Argonne, LLC for the    #
+# U.S. Department of Energy. The U.S. Government has rights to use,       #
+# reproduce, and distribute this software.  NEITHER THE GOVERNMENT NOR    #
+# UChicago Argonne, LLC MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR        #
+# ASSUMES ANY LIABILITY FOR THE USE OF THIS SOFTWARE.  If software is     #
+# modified to produce derivative works, such modified software should     #
+# be clearly marked, so as not to confuse it with the version available   #
+# from ANL.                                                               #
+#                                                                         #
+# Additionally, redistribution and use in source and binary forms, with   #
+# or without modification, are permitted provided that the following      #
+# conditions are met:                                                     #
+#                                                                         #
+#     * Redistributions of source code must retain the above copyright    #
+#       notice, this list of conditions and the following disclaimer.     #
+#                                                                         #
+#     * Redistributions in binary form must reproduce the above copyright #
+#       notice, this list of conditions and the following disclaimer in   #
+#       the documentation and/or other materials provided with the        #
+#       distribution.                                                     #
+#                                                                         #
+#     * Neither the name of UChicago Argonne, LLC, Argonne National       #
+#       Laboratory, ANL, the U.S. Government, nor the names of its        #
+#       contributors may be used to endorse or promote products derived   #
+#       from this software without specific prior written permission.     #
+#                                                                         #
+# THIS SOFTWARE IS PROVIDED BY UChicago Argonne, LLC AND CONTRIBUTORS     #
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT       #
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS       #
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL UChicago     #
+# Argonne, LLC OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,        #
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,    #
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;        #
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER        #
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT      #
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN       #
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE         #
+# POSSIBILITY OF SUCH DAMAGE.                                             #
+# #########################################################################
+
+
+import numpy, hashlib
+import scipy.ndimage.filters as filters
+import scipy.ndimage.fourier as fourier
+from scipy.fft import next_fast_len
+from orangecontrib.shadow_advanced_tools.util.lru_cache import LRUCache
+
+####################################################################################
+# FOURIER FILTERS
+####################################################################################
+
+class FourierFilter:
+    GAUSSIAN  = 0
+    ELLIPSOID = 1
+    UNIFORM   = 2
+
+def fourier_smooth(histogram, kind, size):
+    """
+    Fourier filter (scipy.ndimage.fourier) of the histogram, by real transforms on a zero padded grid of optimal
+    size: no wrap-around between opposite edges. The spectrum of the histogram is cached, so filtering again the
+    same map (e.g. with another sigma/size) costs only the multiplication and the inverse transform. Every call hashes
+    the full map to look the spectrum up, which is not free on large maps.
+
+    :param size: sigma (gaussian) or size (ellipsoid, uniform), in bins, per axis
+    """
+    histogram = numpy.asarray(histogram, dtype=float)
+
+    padding  = [int(numpy.ceil((4.0 if kind == FourierFilter.GAUSSIAN else 1.0)*value)) for value in size]
+    shape    = tuple(next_fast_len(n + pad, real=True) for n, pad in zip(histogram.shape, padding))
+    spectrum = __get_spectrum(histogram, shape)
+
+    if   kind == FourierFilter.GAUSSIAN:  filtered = fourier.fourier_gaussian(spectrum, sigma=size, n=shape[-1])
+    elif kind == FourierFilter.ELLIPSOID: filtered = fourier.fourier_ellipsoid(spectrum, size=size, n=shape[-1])
+    elif kind == FourierFilter.UNIFORM:   filtered = fourier.fourier_uniform(spectrum, size=size, n=shape[-1])
+    else: raise ValueError("Fourier filter not recognized: " + str(kind))
+
+    return numpy.fft.irfft2(filtered, s=shape)[:histogram.shape[0], :histogram.shape[1]]
+
+__spectra_cache = LRUCache(max_size=4)
+
+def __get_spectrum(histogram, shape):
+    """
+    The key is the data pointer, strides and shape of the map, the padded shape and a blake2b digest of the content:
+    views made by the post processing on the same data share it, maps updated in place (cumulated plots) are
+    recomputed. The digest is computed on every call, reading the full map.
+    """
+    key = (histogram.__array_interface__["data"][0], histogram.strides, histogram.shape, shape,
+           hashlib.blake2b(numpy.ascontiguousarray(histogram).data, digest_size=16).digest())
+
+    spectrum = __spectra_cache.get(key)
+
+    if spectrum is None:
+        spectrum = numpy.fft.rfft2(histogram, s=shape)
+        spectrum.setflags(write=False)
+
+        __spectra_cache[key] = spectrum
+
+    return spectrum
+
+####################################################################################
+# SEPARABLE GAUSSIAN FILTER
+####################################################################################
+
+DIRECT_CONVOLUTION_RADIUS = 32
+
+# scipy.ndimage boundary modes -> numpy.pad modes
+PAD_MODES = {"reflect" : "symmetric", "mirror" : "reflect", "nearest" : "edge", "wrap" : "wrap", "constant" : "constant"}
+
+def gaussian_smooth(histogram, sigma, mode="reflect", cval=0.0, truncate=4.0):
+    """
+    Same result of scipy.ndimage.gaussian_filter (one 1D pass per axis, same kernel and boundary modes). On axes
+    with large kernels the 1D passes are done by real FFT convolution of the padded lines, instead of direct sums.
+    """
+    result = numpy.asarray(histogram, dtype=float)
+
+    for axis, axis_sigma in enumerate(sigma):
+        radius = int(truncate*float(axis_sigma) + 0.5)
+
+        if radius <= DIRECT_CONVOLUTION_RADIUS:
+            result = filters.gaussian_filter1d(result, axis_sigma, axis=axis, mode=mode, cval=cval, truncate=truncate)
+        else:
+            result = __fft_convolve1d(result, axis_sigma, radius, axis, mode, cval)
+
+    return result
+
+def __fft_convolve1d(data, sigma, radius, axis, mode, cval):
+    n = data.shape[axis]
+
+    pad_width       = [(0, 0)]*data.ndim
+    pad_width[axis] = (radius, radius)
+
+    if mode == "constant": padded = numpy.pad(data, pad_width, mode="constant", constant_values=cval)
+    else:                  padded = numpy.pad(data, pad_width, mode=PAD_MODES[mode])
+
+    length = next_fast_len(n + 4*radius, real=True) # no circular overlap
+    kernel = __get_kernel_spectrum(sigma, radius, length)
+
+    shape       = [1]*data.ndim
+    shape[axis] = len(kernel)
+
+    convolution = numpy.fft.irfft(numpy.fft.rfft(padded, n=length, axis=axis)*kernel.reshape(shape), n=length, axis=axis)
+
+    return numpy.take(convolution, numpy.arange(2*radius, 2*radius + n), axis=axis)
+
+__kernel_spectra_cache = LRUCache(max_size=10)
+
+def __get_kernel_spectrum(sigma, radius, length):
+    key    = (float(sigma), radius, length)
+    kernel = __kernel_spectra_cache.get(key)
+
+    if kernel is None:
+        x      = numpy.arange(-radius, radius + 1)
+        kernel = numpy.exp(-0.5*(x/sigma)**2)
+        kernel = numpy.fft.rfft(kernel/kernel.sum(), n=length)
+        kernel.setflags(write=False)
+
+        __kernel_spectra_cache[key] = kernel
+
+    return kernel
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------- #
+# Copyright (c) 2026, UChicago Argonne, LLC. All rights reserved.         #
+#                                                                         #
+# Copyright 2026. UChicago Argonne, LLC. This software was produced       #
+# under U.S. Government contract DE-AC02-06CH11357 for Argonne National   #
+# Laboratory (ANL), which is operated by UChicago Argonne, LLC for the    #
+# U.S. Department of Energy. The U.S. Government has rights to use,       #
+# reproduce, and distribute this software.  NEITHER THE GOVERNMENT NOR    #
+# UChicago Argonne, LLC MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR        #
+# ASSUMES ANY LIABILITY FOR THE USE OF THIS SOFTWARE.  If software is     #
+# modified to produce derivative works, such modified software should     #
+# be clearly marked, so as not to confuse it with the version available   #
+# from ANL.                                                               #
+#                                                                         #
+# Additionally, redistribution and use in source and binary forms, with   #
+# or without modification, are permitted provided that the following      #
+# conditions are met:                                                     #
+#                                                                         #
+#     * Redistributions of source code must retain the above copyright    #
+#       notice, this list of conditions and the following disclaimer.     #
+#                                                                         #
+#     * Redistributions in binary form must reproduce the above copyright #
+#       notice, this list of conditions and the following disclaimer in   #
+#       the documentation and/or other materials provided with the        #
+#       distribution.                                                     #
+#                                                                         #
+#     * Neither the name of UChicago Argonne, LLC, Argonne National       #
+#       Laboratory, ANL, the U.S. Government, nor the names of its        #
+#       contributors may be used to endorse or promote products derived   #
+#       from this software without specific prior written permission.     #
+#                                                                         #
+# THIS SOFTWARE IS PROVIDED BY UChicago Argonne, LLC AND CONTRIBUTORS     #
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT       #
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS       #
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL UChicago     #
+# Argonne, LLC OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,        #
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,    #
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;        #
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER        #
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT      #
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN       #
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE         #
+# POSSIBILITY OF SUCH DAMAGE.                                             #
+# ----------------------------------------------------------------------- #
+import queue, threading, time
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+class PowerPlotWorker(QObject):
+    """
+    Runs the numeric part of the power plots (histogramming, accumulation, autosave) on a single background thread:
+    jobs are executed in submission order and their results are queued, to be consumed by the GUI thread when
+    results_available is received (queued connection).
+    Jobs must not make Qt calls.
+    """
+    results_available = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self.__jobs    = queue.Queue()
+        self.__results = queue.Queue()
+        self.__thread  = None
+        self.__pending = 0
+        self.__idle    = threading.Condition()
+
+    def submit(self, function, *args, **kwargs):
+        with self.__idle: self.__pending += 1
+
+        if self.__thread is None or not self.__thread.is_alive():
+            self.__thread = threading.Thread(target=self.__run, name="PowerPlotWorker", daemon=True)
+            self.__thread.start()
+
+        self.__jobs.put((function, args, kwargs))
+
+    def get_results(self):
+        """
+        :return: list of (result, exception), in submission order
+        """
+        results = []
+        while True:
+            try: results.append(self.__results.get_nowait())
+            except queue.Empty: return results
+
+    def is_busy(self):
+        with self.__idle: return self.__pending > 0
+
+    def wait(self):
+        with self.__idle:
+            while self.__pending > 0: self.__idle.wait()
+
+    def __run(self):
+        while True:
+            function, args, kwargs = self.__jobs.get()
+
+            try:
+                self.__results.put((function(*args, **kwargs), None))
+            except Exception as exception:
+                self.__results.put((None, exception))
+
+            with self.__idle:
+                self.__pending -= 1
+                self.__idle.notify_all()
+
+            self.results_available.emit()
+
+class RedrawScheduler(QObject):
+    """
+    Coalesces the redraws of a plot: at most one every interval (in seconds), with the last requested item.
+    Redraws are executed by the event loop through a timer, never inside the caller: a forced redraw (e.g. at the
+    end of a loop) is executed at the first occasion.
+    """
+    def __init__(self, redraw, interval=0.5, parent=None):
+        super().__init__(parent)
+
+        self.__redraw      = redraw
+        self.__interval    = interval
+        self.__item        = None
+        self.__last_redraw = None
+
+        self.__timer = QTimer(self)
+        self.__timer.setSingleShot(True)
+        self.__timer.timeout.connect(self.__execute)
+
+    def set_interval(self, interval):
+        self.__interval = max(0.0, interval)
+
+    def schedule(self, item, force=False):
+        self.__item = item
+
+        if force or self.__last_redraw is None:
+            self.__timer.start(0)
+        elif not self.__timer.isActive():
+            delay = self.__interval - (time.monotonic() - self.__last_redraw)
+
+            self.__timer.start(max(0, int(delay*1000)))
+
+    def flush(self):
+        if self.__timer.isActive():
+            self.__timer.stop()
+            self.__execute()
+
+    def cancel(self):
+        self.__timer.stop()
+        self.__item = None
+
+    def __execute(self):
+        item, self.__item = self.__item, None
+
+        if not item is None:
+            self.__last_redraw = time.monotonic()
+            self.__redraw(item)
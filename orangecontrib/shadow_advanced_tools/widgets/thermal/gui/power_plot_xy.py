@@ -44,14 +44,12 @@
 # ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE         #
 # POSSIBILITY OF SUCH DAMAGE.                                             #
 # ----------------------------------------------------------------------- #
-import os, sys, copy, re
-import time
+import os, sys, re
+from types import SimpleNamespace
 import numpy
 import scipy.ndimage.filters as filters
 import scipy.ndimage.interpolation as interpolation
-import scipy.ndimage.fourier as fourier
-from scipy.optimize import least_squares
-from numpy.polynomial.polynomial import polyval2d
+from numpy.polynomial.polynomial import polyval2d, polygrid2d
 
 from PyQt5.QtWidgets import QMessageBox, QInputDialog, QDialog, \
     QLabel, QVBoxLayout, QDialogButtonBox, QSizePolicy
@@ -72,6 +70,17 @@ from orangecontrib.shadow.util.shadow_objects import ShadowBeam
 from orangecontrib.shadow.util.shadow_util import ShadowCongruence, ShadowPlot
 from orangecontrib.shadow.widgets.gui.ow_automatic_element import AutomaticElement
 from orangecontrib.shadow_advanced_tools.util.gui import PowerPlotXYWidget
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_calculation_bl import PowerPlotAccumulation, copy_ticket
+from orangecontrib.shadow_advanced_tools.widgets.thermal.gui.power_plot_worker import PowerPlotWorker, RedrawScheduler
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_density_io_bl import PowerDensityHdf5File, is_power_density_file, read_power_density_file, \
+    write_power_density_columns, save_power_density_npy, is_power_density_npy_file, read_power_density_npy, get_autosave_step_data
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.fit_bl import FitModel, fit_separable, evaluate_separable, fit_polynomial_surface, \
+    fit_power_density_file
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.smoothing_bl import FourierFilter, fourier_smooth, gaussian_smooth
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.post_processing_bl import PostProcessingChain
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_density_bl import get_rebinned_edges, get_bin_centers, rebin_power_density
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_checkpoint_bl import CheckpointSchedule, write_checkpoint, read_checkpoint, \
+    restore_autosave_file, get_checkpoint_file_name, get_random_state, set_random_state
 
 import scipy.constants as codata
 
@@ -156,6 +165,8 @@ class AbstractPowerPlotXY(AutomaticElement):
     filter_spline_order = Setting(2)
     scaling_factor = Setting(1.0)
 
+    post_processing_replay = Setting(0)
+
     masking = Setting(0)
     masking_type = Setting(0)
     masking_level = Setting(1e-3)
@@ -190,8 +201,9 @@ class AbstractPowerPlotXY(AutomaticElement):
     poly_coefficients = []
     poly_chisquare = 0.0
 
+    fit_processes = Setting(0)
+
     cumulated_ticket=None
-    plotted_ticket   = None
     energy_min = None
     energy_max = None
     energy_step = None
@@ -199,18 +211,27 @@ class AbstractPowerPlotXY(AutomaticElement):
     current_step = None
     total_steps = None
     cumulated_total_power = None
-
-    plotted_ticket_original = None
+    current_seed = None
 
     view_type=Setting(1)
+    redraw_interval=Setting(0.5)
 
     cumulated_quantity = Setting(0)
 
-    autosave_file = None
+    background_calculation = 0
+    autosave_checkpoint = 0
+    checkpoint_steps = 10
+    checkpoint_interval = 300.0
+    __power_plot_worker = None
+    __redraw_scheduler = None
+    __post_processing = None
+    __incident_power_factor = 1.0 # rescalings applied to the incident power of the canvas
 
     def __init__(self):
         super().__init__(show_automatic_box=False)
 
+        self.__accumulation = PowerPlotAccumulation()
+
         button_box = oasysgui.widgetBox(self.controlArea, "", addSpace=False, orientation="horizontal")
 
         gui.button(button_box, self, "Plot Data", callback=self.plot_cumulated_data, height=45)
@@ -348,12 +369,15 @@ class AbstractPowerPlotXY(AutomaticElement):
         tab_post_smooth = oasysgui.createTabPage(tabs_post, "Smoothing")
         tab_post_fit    = oasysgui.createTabPage(tabs_post, "Fit")
 
-        post_box = oasysgui.widgetBox(tab_post_basic, "Basic Post Processing Setting", addSpace=False, orientation="vertical", height=460)
+        post_box = oasysgui.widgetBox(tab_post_basic, "Basic Post Processing Setting", addSpace=False, orientation="vertical", height=485)
 
         button_box = oasysgui.widgetBox(post_box, "", addSpace=False, orientation="vertical")
         button = gui.button(button_box, self, "Reset", callback=self.reload_plot, height=25, width=352)
         gui.separator(button_box, height=10)
 
+        gui.comboBox(post_box, self, "post_processing_replay", label="Apply Post Processing to New Plots", labelWidth=260,
+                     items=["No", "Yes"], sendSelectedValue=False, orientation="horizontal")
+
         font = QFont(button.font())
         font.setItalic(True)
         button.setFont(font)
@@ -458,7 +482,7 @@ class AbstractPowerPlotXY(AutomaticElement):
 
         self.set_Filter()
 
-        post_box = oasysgui.widgetBox(tab_post_fit, "Fit Setting", addSpace=False, orientation="vertical", height=460)
+        post_box = oasysgui.widgetBox(tab_post_fit, "Fit Setting", addSpace=False, orientation="vertical", height=520)
 
         gui.comboBox(post_box, self, "fit_algorithm", label="Fit Algorithm",
                      items=["Gaussian", "Pseudo-Voigt", "Polynomial"], labelWidth=200,
@@ -531,6 +555,10 @@ class AbstractPowerPlotXY(AutomaticElement):
         gui.button(button_box, self, "Do Fit", callback=self.do_fit, height=25)
         button = gui.button(button_box, self, "Show Fit Formulas", callback=self.show_fit_formulas, height=25)
 
+        batch_fit_box = oasysgui.widgetBox(post_box, "", addSpace=False, orientation="horizontal")
+        oasysgui.lineEdit(batch_fit_box, self, "fit_processes", "Processes (0=all CPUs)", labelWidth=150, valueType=int, orientation="horizontal")
+        gui.button(batch_fit_box, self, "Fit Autosave File", callback=self.do_batch_fit, height=25)
+
         font = QFont(button.font())
         font.setItalic(True)
         button.setFont(font)
@@ -548,10 +576,11 @@ class AbstractPowerPlotXY(AutomaticElement):
         out_tab = oasysgui.createTabPage(self.main_tabs, "Output")
 
         view_box = oasysgui.widgetBox(plot_tab, "Plotting", addSpace=False, orientation="vertical", width=self.IMAGE_WIDTH)
-        view_box_1 = oasysgui.widgetBox(view_box, "", addSpace=False, orientation="vertical", width=350)
+        view_box_1 = oasysgui.widgetBox(view_box, "", addSpace=False, orientation="horizontal", width=650)
 
-        gui.comboBox(view_box_1, self, "view_type", label="Plot Accumulated Results", labelWidth=320,
+        gui.comboBox(view_box_1, self, "view_type", label="Plot Accumulated Results", labelWidth=200,
                      items=["No", "Yes"],  sendSelectedValue=False, orientation="horizontal")
+        oasysgui.lineEdit(view_box_1, self, "redraw_interval", "Min. Redraw Interval [s]", labelWidth=170, valueType=float, orientation="horizontal")
 
         self.image_box = gui.widgetBox(plot_tab, "Plot Result", addSpace=True, orientation="vertical")
         self.image_box.setFixedHeight(self.IMAGE_HEIGHT)
@@ -664,97 +693,315 @@ class AbstractPowerPlotXY(AutomaticElement):
             self.plot_canvas = PowerPlotXYWidget()
             self.image_box.layout().addWidget(self.plot_canvas)
 
-        try:
-            if self.autosave == 1:
-                if self.autosave_file is None:
-                    self.autosave_file = ShadowPlot.PlotXYHdf5File(congruence.checkDir(self.autosave_file_name))
-                elif self.autosave_file.filename != congruence.checkFileName(self.autosave_file_name):
-                    self.autosave_file.close()
-                    self.autosave_file = ShadowPlot.PlotXYHdf5File(congruence.checkDir(self.autosave_file_name))
-
-                self.autosave_file.add_attribute("current_step", self.current_step, dataset_name="additional_data")
-                self.autosave_file.add_attribute("total_steps", self.total_steps, dataset_name="additional_data")
-                self.autosave_file.add_attribute("last_energy_value", self.energy_max, dataset_name="additional_data")
-                self.autosave_file.add_attribute("last_power_value", self.total_power, dataset_name="additional_data")
-
-            if self.keep_result == 1:
-                self.cumulated_ticket, last_ticket = self.plot_canvas.plot_power_density(shadow_beam, var_x, var_y,
-                                                                                         self.total_power, self.cumulated_total_power,
-                                                                                         self.energy_min, self.energy_max, self.energy_step,
-                                                                                         nbins_h=nbins_h, nbins_v=nbins_v, xrange=xrange, yrange=yrange, nolost=nolost,
-                                                                                         ticket_to_add=self.cumulated_ticket,
-                                                                                         to_mm=self.workspace_units_to_mm,
-                                                                                         show_image=self.view_type==1,
-                                                                                         kind_of_calculation=self.kind_of_calculation,
-                                                                                         replace_poor_statistic=self.replace_poor_statistic,
-                                                                                         good_rays_limit=self.good_rays_limit,
-                                                                                         center_x=self.center_x,
-                                                                                         center_y=self.center_y,
-                                                                                         sigma_x=self.sigma_x,
-                                                                                         sigma_y=self.sigma_y,
-                                                                                         gamma=self.gamma,
-                                                                                         cumulated_quantity=self.cumulated_quantity)
-
-                if self.autosave == 1:
-                    self.autosave_file.add_attribute("last_plotted_power",  self.cumulated_ticket['plotted_power'],  dataset_name="additional_data")
-                    self.autosave_file.add_attribute("last_incident_power", self.cumulated_ticket['incident_power'], dataset_name="additional_data")
-                    self.autosave_file.add_attribute("last_total_power",    self.cumulated_ticket['total_power'],    dataset_name="additional_data")
-                    self.autosave_file.add_attribute("last_energy_min",     self.cumulated_ticket['energy_min'],     dataset_name="additional_data")
-                    self.autosave_file.add_attribute("last_energy_max",     self.cumulated_ticket['energy_max'],     dataset_name="additional_data")
-                    self.autosave_file.add_attribute("last_energy_step",    self.cumulated_ticket['energy_step'],    dataset_name="additional_data")
-
-                self.plotted_ticket          = self.cumulated_ticket
-                self.plotted_ticket_original = self.plotted_ticket.copy()
-
-                if self.autosave == 1:
-                    self.autosave_file.write_coordinates(self.cumulated_ticket)
-                    dataset_name = "power_density"
-
-                    self.autosave_file.add_plot_xy(self.cumulated_ticket, dataset_name=dataset_name)
-
-                    if self.autosave_partial_results == 1:
-                        if last_ticket is None:
-                            self.autosave_file.add_plot_xy(self.cumulated_ticket,
-                                                           plot_name="Energy Range: " + str(round(self.energy_max-self.energy_step, 2)) + "-" + str(round(self.energy_max, 2)),
-                                                           dataset_name=dataset_name)
-                        else:
-                            self.autosave_file.add_plot_xy(last_ticket,
-                                                           plot_name="Energy Range: " + str(round(self.energy_max-self.energy_step, 2)) + "-" + str(round(self.energy_max, 2)),
-                                                           dataset_name=dataset_name)
-
-                    self.autosave_file.flush()
-            else:
-                ticket, _ = self.plot_canvas.plot_power_density(shadow_beam, var_x, var_y,
-                                                                self.total_power, self.cumulated_total_power,
-                                                                self.energy_min, self.energy_max, self.energy_step,
-                                                                nbins_h=nbins_h, nbins_v=nbins_v, xrange=xrange, yrange=yrange, nolost=nolost,
-                                                                to_mm=self.workspace_units_to_mm,
-                                                                show_image=self.view_type==1,
-                                                                kind_of_calculation=self.kind_of_calculation,
-                                                                replace_poor_statistic=self.replace_poor_statistic,
-                                                                good_rays_limit=self.good_rays_limit,
-                                                                center_x=self.center_x,
-                                                                center_y=self.center_y,
-                                                                sigma_x=self.sigma_x,
-                                                                sigma_y=self.sigma_y,
-                                                                gamma=self.gamma,
-                                                                cumulated_quantity=self.cumulated_quantity)
-
-                self.cumulated_ticket = None
-                self.plotted_ticket = ticket
-                self.plotted_ticket_original = self.plotted_ticket.copy()
+        parameters = self._get_calculation_parameters()
 
-                if self.autosave == 1:
-                    self.autosave_file.write_coordinates(ticket)
-                    self.autosave_file.add_plot_xy(ticket, dataset_name="power_density")
-                    self.autosave_file.flush()
+        if parameters.background_calculation:
+            # the next step can be traced while this one is histogrammed and accumulated
+            self.__get_power_plot_worker().submit(self._calculate_power_density, parameters, shadow_beam, var_x, var_y, xrange, yrange, nbins_h, nbins_v, nolost)
+        else:
+            self._set_power_density(self._calculate_power_density(parameters, shadow_beam, var_x, var_y, xrange, yrange, nbins_h, nbins_v, nolost))
+
+    def _get_calculation_parameters(self):
+        checkpoint = self.autosave == 1 and self.keep_result == 1 and self.autosave_checkpoint == 1
+
+        # snapshot of the widget status at the time of the step: the calculation can run while the next step is received
+        return SimpleNamespace(total_power=self.total_power,
+                               cumulated_total_power=self.cumulated_total_power,
+                               energy_min=self.energy_min,
+                               energy_max=self.energy_max,
+                               energy_step=self.energy_step,
+                               current_step=self.current_step,
+                               total_steps=self.total_steps,
+                               keep_result=self.keep_result,
+                               autosave=self.autosave,
+                               autosave_file_name=self.autosave_file_name,
+                               autosave_partial_results=self.autosave_partial_results,
+                               autosave_swmr=self.autosave_swmr,
+                               autosave_flush_interval=self.autosave_flush_interval,
+                               autosave_flush_steps=self.autosave_flush_steps,
+                               to_mm=self.workspace_units_to_mm,
+                               show_image=self.view_type==1,
+                               kind_of_calculation=self.kind_of_calculation,
+                               replace_poor_statistic=self.replace_poor_statistic,
+                               good_rays_limit=self.good_rays_limit,
+                               center_x=self.center_x,
+                               center_y=self.center_y,
+                               sigma_x=self.sigma_x,
+                               sigma_y=self.sigma_y,
+                               gamma=self.gamma,
+                               cumulated_quantity=self.cumulated_quantity,
+                               background_calculation=self.background_calculation==1,
+                               checkpoint=checkpoint,
+                               checkpoint_steps=self.checkpoint_steps,
+                               checkpoint_interval=self.checkpoint_interval,
+                               seed=self.current_seed,
+                               # taken before the next step is traced by the source
+                               random_state=get_random_state() if checkpoint else None)
+
+    def _calculate_power_density(self, parameters, shadow_beam, var_x, var_y, xrange, yrange, nbins_h, nbins_v, nolost):
+        # histogramming, accumulation and autosave: it can run on the worker thread, it uses only the accumulation
+        # and the parameters, and it returns copies to the GUI thread
+        accumulation = self.__accumulation
 
+        try:
+            if parameters.autosave == 1:
+                autosave_file_name = congruence.checkFileName(parameters.autosave_file_name)
+
+                if accumulation.autosave_file is None or accumulation.autosave_file.filename != autosave_file_name:
+                    congruence.checkDir(autosave_file_name)
+
+                    accumulation.set_autosave_file(PowerDensityHdf5File(autosave_file_name,
+                                                                        swmr=parameters.autosave_swmr==1,
+                                                                        flush_interval=parameters.autosave_flush_interval,
+                                                                        flush_steps=parameters.autosave_flush_steps))
+
+            if parameters.keep_result == 1:
+                accumulation.cumulated_ticket, last_ticket = accumulation.calculator.calculate_power_density(shadow_beam, var_x, var_y,
+                                                                                                            parameters.total_power, parameters.cumulated_total_power,
+                                                                                                            parameters.energy_min, parameters.energy_max, parameters.energy_step,
+                                                                                                            nbins_h=nbins_h, nbins_v=nbins_v, xrange=xrange, yrange=yrange, nolost=nolost,
+                                                                                                            ticket_to_add=accumulation.cumulated_ticket,
+                                                                                                            to_mm=parameters.to_mm,
+                                                                                                            kind_of_calculation=parameters.kind_of_calculation,
+                                                                                                            replace_poor_statistic=parameters.replace_poor_statistic,
+                                                                                                            good_rays_limit=parameters.good_rays_limit,
+                                                                                                            center_x=parameters.center_x,
+                                                                                                            center_y=parameters.center_y,
+                                                                                                            sigma_x=parameters.sigma_x,
+                                                                                                            sigma_y=parameters.sigma_y,
+                                                                                                            gamma=parameters.gamma)
+
+                if parameters.autosave == 1:
+                    accumulation.autosave_file.write_step(accumulation.cumulated_ticket,
+                                                          last_ticket=None if parameters.autosave_partial_results == 0 else (accumulation.cumulated_ticket if last_ticket is None else last_ticket),
+                                                          step_data=self.__get_autosave_step_data(parameters, accumulation.cumulated_ticket),
+                                                          force_flush=parameters.current_step == parameters.total_steps)
+
+                    if parameters.checkpoint and self.__get_checkpoint_schedule(accumulation, parameters).step(force=parameters.current_step == parameters.total_steps):
+                        self.__write_checkpoint(accumulation, parameters)
+
+                # read-only view of the running total: copied only by the redraws taken while the next steps are added
+                ticket = accumulation.cumulated_ticket
+            else:
+                ticket, _ = accumulation.calculator.calculate_power_density(shadow_beam, var_x, var_y,
+                                                                            parameters.total_power, parameters.cumulated_total_power,
+                                                                            parameters.energy_min, parameters.energy_max, parameters.energy_step,
+                                                                            nbins_h=nbins_h, nbins_v=nbins_v, xrange=xrange, yrange=yrange, nolost=nolost,
+                                                                            to_mm=parameters.to_mm,
+                                                                            kind_of_calculation=parameters.kind_of_calculation,
+                                                                            replace_poor_statistic=parameters.replace_poor_statistic,
+                                                                            good_rays_limit=parameters.good_rays_limit,
+                                                                            center_x=parameters.center_x,
+                                                                            center_y=parameters.center_y,
+                                                                            sigma_x=parameters.sigma_x,
+                                                                            sigma_y=parameters.sigma_y,
+                                                                            gamma=parameters.gamma)
+
+                accumulation.cumulated_ticket = None
+
+                if parameters.autosave == 1:
+                    accumulation.autosave_file.write_step(ticket,
+                                                          step_data=self.__get_autosave_step_data(parameters, ticket),
+                                                          force_flush=parameters.current_step == parameters.total_steps)
+
+            return SimpleNamespace(ticket=ticket, var_x=var_x, var_y=var_y, parameters=parameters,
+                                   cumulated_power_plot=accumulation.calculator.cumulated_power_plot,
+                                   cumulated_previous_power_plot=accumulation.calculator.cumulated_previous_power_plot)
         except Exception as e:
             if not self.IS_DEVELOP:
                 raise Exception("Data not plottable: " + str(e))
             else:
                 raise e
 
+    def _set_power_density(self, result):
+        parameters = result.parameters
+
+        # GUI thread: the status of the widget follows the results, in step order
+        self.cumulated_ticket = result.ticket if parameters.keep_result == 1 else None
+
+        self.plot_canvas.cumulated_power_plot          = result.cumulated_power_plot
+        self.plot_canvas.cumulated_previous_power_plot = result.cumulated_previous_power_plot
+
+        if self.__is_running_total_shared(parameters):
+            self.__incident_power_factor = 1.0 # the redraw takes the data
+        else:
+            # new data: the post processing operations are discarded, or replayed on it
+            self.__set_post_processing_source(result.ticket.copy(), keep_operations=self.post_processing_replay == 1)
+
+        # the plot is refreshed by the event loop, at most once per redraw interval and always at the end of the loop
+        self.__get_redraw_scheduler().schedule(result, force=parameters.current_step is None or parameters.current_step == parameters.total_steps)
+
+    @classmethod
+    def __get_checkpoint_schedule(cls, accumulation, parameters):
+        if accumulation.checkpoint_schedule is None or \
+                accumulation.checkpoint_schedule.checkpoint_steps != max(1, int(parameters.checkpoint_steps)) or \
+                accumulation.checkpoint_schedule.checkpoint_interval != parameters.checkpoint_interval:
+            accumulation.checkpoint_schedule = CheckpointSchedule(parameters.checkpoint_steps, parameters.checkpoint_interval)
+
+        return accumulation.checkpoint_schedule
+
+    @classmethod
+    def __write_checkpoint(cls, accumulation, parameters):
+        accumulation.autosave_file.flush() # the autosave file can have more steps than the checkpoint, never less
+
+        autosave_steps, autosave_partial_results = accumulation.autosave_file.get_number_of_steps()
+
+        write_checkpoint(get_checkpoint_file_name(accumulation.autosave_file.filename),
+                         accumulation.cumulated_ticket,
+                         {"current_step"                  : parameters.current_step,
+                          "total_steps"                   : parameters.total_steps,
+                          "last_energy_value"             : parameters.energy_max,
+                          "last_energy_step"              : parameters.energy_step,
+                          "seed"                          : parameters.seed,
+                          "energy_min"                    : parameters.energy_min,
+                          "energy_max"                    : parameters.energy_max,
+                          "cumulated_total_power"         : parameters.cumulated_total_power,
+                          "cumulated_power_plot"          : accumulation.calculator.cumulated_power_plot,
+                          "cumulated_previous_power_plot" : accumulation.calculator.cumulated_previous_power_plot,
+                          "autosave_steps"                : autosave_steps,
+                          "autosave_partial_results"      : autosave_partial_results},
+                         random_state=parameters.random_state)
+
+    def _get_autosave_file(self):
+        # the file is written by the calculations: it can be used only when they are completed
+        self._wait_for_calculations()
+
+        return self.__accumulation.autosave_file
+
+    def _set_accumulation(self, cumulated_ticket, cumulated_power_plot=0.0, cumulated_previous_power_plot=0.0):
+        """
+        The next steps are added to cumulated_ticket (None: the accumulation restarts)
+        """
+        self._wait_for_calculations()
+
+        self.__accumulation.set_cumulated_ticket(cumulated_ticket, cumulated_power_plot, cumulated_previous_power_plot)
+        self.cumulated_ticket = cumulated_ticket
+
+    def _clear_accumulation(self):
+        self._wait_for_calculations()
+
+        self.__accumulation.clear()
+        self.cumulated_ticket = None
+
+    def load_checkpoint(self):
+        try:
+            if self.autosave == 0 or self.keep_result == 0: raise ValueError("Checkpoints need \"Save automatically plot into file\" and \"Keep Result\"")
+
+            autosave_file_name = congruence.checkFileName(self.autosave_file_name)
+            checkpoint         = read_checkpoint(congruence.checkFile(get_checkpoint_file_name(autosave_file_name)))
+            data               = checkpoint.data
+
+            self._clear_accumulation()
+
+            accumulation = self.__accumulation
+            accumulation.set_autosave_file(restore_autosave_file(autosave_file_name, checkpoint,
+                                                                 swmr=self.autosave_swmr==1,
+                                                                 flush_interval=self.autosave_flush_interval,
+                                                                 flush_steps=self.autosave_flush_steps))
+
+            if self.plot_canvas is None:
+                self.plot_canvas = PowerPlotXYWidget()
+                self.image_box.layout().addWidget(self.plot_canvas)
+
+            self._set_accumulation(checkpoint.ticket,
+                                   cumulated_power_plot=data["cumulated_power_plot"] or 0.0,
+                                   cumulated_previous_power_plot=data["cumulated_previous_power_plot"] or 0.0)
+
+            self.energy_min            = data["energy_min"]
+            self.energy_max            = data["energy_max"]
+            self.energy_step           = data["last_energy_step"]
+            self.cumulated_total_power = data["cumulated_total_power"]
+            self.current_step          = data["current_step"]
+            self.total_steps           = data["total_steps"]
+            self.current_seed          = data["seed"]
+
+            # the next step traced by the source starts from the same random sequence
+            if not checkpoint.random_state is None: set_random_state(checkpoint.random_state)
+
+            if not checkpoint.ticket is None:
+                self._set_power_density(SimpleNamespace(ticket=copy_ticket(checkpoint.ticket),
+                                                        var_x=checkpoint.ticket["h_label"],
+                                                        var_y=checkpoint.ticket["v_label"],
+                                                        parameters=self._get_calculation_parameters(),
+                                                        cumulated_power_plot=accumulation.calculator.cumulated_power_plot,
+                                                        cumulated_previous_power_plot=accumulation.calculator.cumulated_previous_power_plot))
+
+            QMessageBox.information(self, "Checkpoint",
+                                    "Loop restored after step " + str(data["current_step"]) + " of " + str(data["total_steps"]) + ":\n" +
+                                    "restart it from the Power Density Loop Point (Crash Recovery)", QMessageBox.Ok)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", str(e), QMessageBox.Ok)
+
+            if self.IS_DEVELOP: raise e
+
+    @classmethod
+    def __get_autosave_step_data(cls, parameters, ticket):
+        return get_autosave_step_data(parameters.current_step, parameters.total_steps, parameters.energy_max, parameters.total_power, ticket)
+
+    def _show_power_density(self, result):
+        parameters = result.parameters
+
+        # the worker thread is adding the next steps to the running total: one copy per redraw
+        if self.__is_running_total_shared(parameters):
+            self.__set_post_processing_source(self.__accumulation.copy_cumulated_ticket(), keep_operations=self.post_processing_replay == 1)
+
+        # evaluated here, at most once per redraw
+        post_processing = self.__get_post_processing()
+        ticket          = post_processing.evaluate()
+
+        if post_processing.is_empty(): var_x, var_y = result.var_x, result.var_y
+        else:                          var_x, var_y = ticket["h_label"], ticket["v_label"]
+
+        self.__rescale_incident_power(ticket)
+
+        self.plot_canvas.plot_power_density_ticket(ticket, var_x, var_y,
+                                                   parameters.cumulated_total_power,
+                                                   parameters.energy_min, parameters.energy_max, parameters.energy_step,
+                                                   show_image=parameters.show_image,
+                                                   cumulated_quantity=parameters.cumulated_quantity)
+
+    @classmethod
+    def __is_running_total_shared(cls, parameters):
+        return parameters.background_calculation and parameters.keep_result == 1
+
+    def __get_power_plot_worker(self):
+        if self.__power_plot_worker is None:
+            self.__power_plot_worker = PowerPlotWorker(self)
+            self.__power_plot_worker.results_available.connect(self.__consume_calculation_results, Qt.QueuedConnection)
+
+        return self.__power_plot_worker
+
+    def __consume_calculation_results(self):
+        for result, exception in self.__power_plot_worker.get_results(): # in step order
+            if exception is None:
+                self._set_power_density(result)
+            else:
+                QMessageBox.critical(self, "Error", str(exception), QMessageBox.Ok)
+
+                if self.IS_DEVELOP: raise exception
+
+    def __get_redraw_scheduler(self):
+        if self.__redraw_scheduler is None: self.__redraw_scheduler = RedrawScheduler(self.__redraw, parent=self)
+
+        self.__redraw_scheduler.set_interval(self.redraw_interval)
+
+        return self.__redraw_scheduler
+
+    def __redraw(self, result):
+        try:
+            self._show_power_density(result)
+        except Exception as exception:
+            QMessageBox.critical(self, "Error", str(exception), QMessageBox.Ok)
+
+            if self.IS_DEVELOP: raise exception
+
+    def _wait_for_calculations(self):
+        if not self.__power_plot_worker is None:
+            self.__power_plot_worker.wait()
+            self.__consume_calculation_results()
+
+        if not self.__redraw_scheduler is None: self.__redraw_scheduler.flush()
+
     def plot_xy(self, var_x, var_y):
         beam_to_plot = self.input_beam
 
@@ -800,6 +1047,8 @@ class AbstractPowerPlotXY(AutomaticElement):
                          nolost=self.rays+1)
 
     def plot_cumulated_data(self):
+        self._wait_for_calculations()
+
         if not self.cumulated_ticket is None:
             self.plot_canvas.plot_power_density_ticket(ticket=self.cumulated_ticket,
                                                        var_x=self.x_column_index+1,
@@ -811,7 +1060,7 @@ class AbstractPowerPlotXY(AutomaticElement):
                                                        show_image=self.view_type==1,
                                                        cumulated_quantity=self.cumulated_quantity)
 
-            self.plotted_ticket_original = self.cumulated_ticket.copy()
+            self.plotted_ticket_original = copy_ticket(self.cumulated_ticket)
 
     def plot_results(self):
         try:
@@ -823,8 +1072,6 @@ class AbstractPowerPlotXY(AutomaticElement):
                 self._check_other_fields()
 
                 self.plot_xy(self.x_column_index+1, self.y_column_index+1)
-
-            time.sleep(0.1)  # prevents a misterious dead lock in the Orange cycle when refreshing the histogram
         except Exception as exception:
             QMessageBox.critical(self, "Error",
                                        str(exception),
@@ -856,16 +1103,19 @@ class AbstractPowerPlotXY(AutomaticElement):
     # SAVE
 
     def save_cumulated_data(self):
+        self._wait_for_calculations()
+
         file_name = oasysgui.selectSaveFileFromDialog(self, "Save Current Plot", default_file_name=("" if (not hasattr(self, "autosave") or self.autosave==0) else self.autosave_file_name),
-                                                      file_extension_filter="HDF5 Files (*.hdf5 *.h5 *.hdf);;Text Files (*.dat *.txt);;Ansys Files (*.csv)")
+                                                      file_extension_filter="HDF5 Files (*.hdf5 *.h5 *.hdf);;Text Files (*.dat *.txt);;Ansys Files (*.csv);;Numpy Files (*.npy)")
 
         if not file_name is None and not file_name.strip()=="":
-            format, ok = QInputDialog.getItem(self, "Select Output Format", "Formats: ", ("Hdf5", "Text", "Ansys", "Image", "Hdf5 & Image", "All"), 4, False)
+            format, ok = QInputDialog.getItem(self, "Select Output Format", "Formats: ", ("Hdf5", "Text", "Ansys", "Numpy", "Image", "Hdf5 & Image", "All"), 5, False)
 
             if ok and format:
                 if format == "Hdf5" or format == "All":  self.save_cumulated_data_hdf5(file_name)
                 if format == "Text" or format == "All":  self.save_cumulated_data_txt(file_name)
                 if format == "Ansys" or format == "All": self.save_cumulated_data_ansys(file_name)
+                if format == "Numpy" or format == "All": self.save_cumulated_data_npy(file_name)
                 if format == "Image" or format == "All": self.save_cumulated_data_image(file_name)
                 if format == "Hdf5 & Image":
                     self.save_cumulated_data_hdf5(file_name)
@@ -895,22 +1145,25 @@ class AbstractPowerPlotXY(AutomaticElement):
     def save_cumulated_data_txt(self, file_name):
         if not self.plotted_ticket is None:
             try:
-                save_file = open(os.path.splitext(file_name)[0] + ".dat", "w")
-
-                x_values = self.plotted_ticket["bin_h_center"]
-                y_values = self.plotted_ticket["bin_v_center"]
-                z_values = self.plotted_ticket["histogram"]
-
-                for i in range(len(x_values)):
-                    for j in range(len(y_values)):
-                        row = str(x_values[i]) + " " + str(y_values[j]) + " " + str(z_values[i, j])
-
-                        if i+j > 0: row = "\n" + row
+                write_power_density_columns(os.path.splitext(file_name)[0] + ".dat", self.plotted_ticket, separator=" ")
+            except Exception as exception:
+                QMessageBox.critical(self, "Error", str(exception), QMessageBox.Ok)
 
-                        save_file.write(row)
+                if self.IS_DEVELOP: raise exception
 
-                save_file.flush()
-                save_file.close()
+    def save_cumulated_data_npy(self, file_name):
+        if not self.plotted_ticket is None:
+            try:
+                def get_value(key, default): return self.plotted_ticket.get(key, 0.0 if default is None else default)
+
+                save_power_density_npy(file_name, self.plotted_ticket,
+                                       metadata={"units"          : {"coordinates" : "mm", "histogram" : "W/mm^2" if self.cumulated_quantity == 0 else "ph/s/mm^2"},
+                                                 "energy_min"     : get_value("energy_min", self.energy_min),
+                                                 "energy_max"     : get_value("energy_max", self.energy_max),
+                                                 "energy_step"    : get_value("energy_step", self.energy_step),
+                                                 "plotted_power"  : get_value("plotted_power", self.plot_canvas.cumulated_power_plot),
+                                                 "incident_power" : get_value("incident_power", self.plot_canvas.cumulated_previous_power_plot),
+                                                 "total_power"    : get_value("total_power", self.cumulated_total_power)})
             except Exception as exception:
                 QMessageBox.critical(self, "Error", str(exception), QMessageBox.Ok)
 
@@ -961,24 +1214,8 @@ class AbstractPowerPlotXY(AutomaticElement):
                 column, ok = QInputDialog.getItem(self, "Ansys File", "Empty column in Ansys axes system", ("x", "y", "z"), 2, False)
 
                 if ok and column:
-                    save_file = open(os.path.splitext(file_name)[0] + ".csv", "w")
-
-                    x_values = self.plotted_ticket["bin_h_center"]
-                    y_values = self.plotted_ticket["bin_v_center"]
-                    z_values = self.plotted_ticket["histogram"]
-
-                    for i in range(x_values.shape[0]):
-                        for j in range(y_values.shape[0]):
-                            if column == "x":   row = "0.0,"                              + str(x_values[i]) + ","  + str(y_values[j]) + "," + str(z_values[i, j])
-                            elif column == "y": row = str(x_values[i])                    + ",0.0,"                 + str(y_values[j]) + "," + str(z_values[i, j])
-                            elif column == "z": row = str(x_values[i]) + ","              + str(y_values[j])        + ",0.0,"                + str(z_values[i, j])
-
-                            if i+j > 0: row = "\n" + row
-
-                            save_file.write(row)
-
-                    save_file.flush()
-                    save_file.close()
+                    write_power_density_columns(os.path.splitext(file_name)[0] + ".csv", self.plotted_ticket, separator=",",
+                                                empty_column={"x" : 0, "y" : 1, "z" : 2}[column])
             except Exception as exception:
                 QMessageBox.critical(self, "Error", str(exception), QMessageBox.Ok)
 
@@ -987,12 +1224,19 @@ class AbstractPowerPlotXY(AutomaticElement):
     ##################################################
     # POST EDITING
 
-    def select_plot_file(self):
-        file_name = oasysgui.selectFileFromDialog(self, None, "Select File", file_extension_filter="HDF5 Files (*.hdf5 *.h5 *.hdf)")
-
-        if not file_name is None:
-            self.le_loaded_plot_file_name.setText(os.path.basename(os.path.normpath(file_name)))
-
+    def _read_plot_file(self, file_name):
+        """
+        :return: ticket, additional data of the last step (None if not available)
+        """
+        autosave_file = self._get_autosave_file()
+
+        if not autosave_file is None and autosave_file.filename == congruence.checkFileName(file_name):
+            return autosave_file.read() # file currently written by the widget
+        elif is_power_density_npy_file(file_name):
+            return read_power_density_npy(file_name)
+        elif is_power_density_file(file_name):
+            return read_power_density_file(file_name)
+        else: # previous format
             plot_file = ShadowPlot.PlotXYHdf5File(congruence.checkDir(file_name), mode="r")
 
             ticket = {}
@@ -1003,6 +1247,27 @@ class AbstractPowerPlotXY(AutomaticElement):
             ticket["nrays"] = attributes["total_rays"]
             ticket["good_rays"] = attributes["good_rays"]
 
+            try:
+                additional_data = {}
+                for name in ["last_plotted_power", "last_incident_power", "last_total_power", "last_energy_min", "last_energy_max", "last_energy_step"]:
+                    additional_data[name] = plot_file.get_attribute(name, dataset_name="additional_data")
+            except:
+                additional_data = None
+
+            plot_file.close()
+
+            return ticket, additional_data
+
+    def select_plot_file(self):
+        self._wait_for_calculations()
+
+        file_name = oasysgui.selectFileFromDialog(self, None, "Select File", file_extension_filter="HDF5 Files (*.hdf5 *.h5 *.hdf);;Numpy Files (*.json *.npy)")
+
+        if not file_name is None:
+            self.le_loaded_plot_file_name.setText(os.path.basename(os.path.normpath(file_name)))
+
+            ticket, additional_data = self._read_plot_file(file_name)
+
             is_merged = False
 
             if self.plot_canvas is None:
@@ -1026,14 +1291,14 @@ class AbstractPowerPlotXY(AutomaticElement):
                         else:
                             raise ValueError("The plots cannot be merged: the should have same dimensions and ranges")
 
-            try:
-                last_plotted_power = plot_file.get_attribute("last_plotted_power", dataset_name="additional_data")
-                last_incident_power = plot_file.get_attribute("last_incident_power", dataset_name="additional_data")
-                last_total_power = plot_file.get_attribute("last_total_power", dataset_name="additional_data")
-                energy_min = plot_file.get_attribute("last_energy_min", dataset_name="additional_data")
-                energy_max = plot_file.get_attribute("last_energy_max", dataset_name="additional_data")
-                energy_step = plot_file.get_attribute("last_energy_step", dataset_name="additional_data")
-            except:
+            if not additional_data is None:
+                last_plotted_power = additional_data["last_plotted_power"]
+                last_incident_power = additional_data["last_incident_power"]
+                last_total_power = additional_data["last_total_power"]
+                energy_min = additional_data["last_energy_min"]
+                energy_max = additional_data["last_energy_max"]
+                energy_step = additional_data["last_energy_step"]
+            else:
                 last_plotted_power = numpy.sum(ticket["histogram"]) * (ticket["bin_h_center"][1] - ticket["bin_h_center"][0]) * (ticket["bin_v_center"][1] - ticket["bin_v_center"][0])
                 last_incident_power = 0.0
                 last_total_power = 0.0
@@ -1043,12 +1308,12 @@ class AbstractPowerPlotXY(AutomaticElement):
 
             try:
                 if is_merged:
-                    self.plot_canvas.cumulated_power_plot += last_plotted_power
-                    self.plot_canvas.cumulated_previous_power_plot += last_incident_power
+                    last_plotted_power  += self.plot_canvas.cumulated_power_plot
+                    last_incident_power += self.plot_canvas.cumulated_previous_power_plot
                     last_total_power = 0.0
-                else:
-                    self.plot_canvas.cumulated_power_plot = last_plotted_power
-                    self.plot_canvas.cumulated_previous_power_plot = last_incident_power
+
+                self.plot_canvas.cumulated_power_plot = last_plotted_power
+                self.plot_canvas.cumulated_previous_power_plot = last_incident_power
 
                 self.plot_canvas.plot_power_density_ticket(ticket,
                                                            ticket["h_label"],
@@ -1059,7 +1324,7 @@ class AbstractPowerPlotXY(AutomaticElement):
                                                            energy_step=energy_step,
                                                            cumulated_quantity=self.cumulated_quantity)
 
-                self.cumulated_ticket = ticket
+                self._set_accumulation(ticket, last_plotted_power, last_incident_power)
                 self.plotted_ticket = ticket
                 self.plotted_ticket_original = ticket.copy()
             except Exception as e:
@@ -1067,452 +1332,218 @@ class AbstractPowerPlotXY(AutomaticElement):
 
                 if self.IS_DEVELOP: raise e
 
-    def reload_plot(self):
-        if not self.plotted_ticket_original is None:
-            ticket = self.plotted_ticket_original.copy()
-
-            if self.plot_canvas is None:
-                self.plot_canvas = PowerPlotXYWidget()
-                self.image_box.layout().addWidget(self.plot_canvas)
-
-            cumulated_power_plot = numpy.sum(ticket["histogram"]) * (ticket["bin_h_center"][1] - ticket["bin_h_center"][0]) * (ticket["bin_v_center"][1] - ticket["bin_v_center"][0])
-
-            try:
-                try:
-                    energy_min = ticket["energy_min"]
-                    energy_max = ticket["energy_max"]
-                    energy_step = ticket["energy_step"]
-                except:
-                    energy_min = 0.0
-                    energy_max = 0.0
-                    energy_step = 0.0
-
-                self.plot_canvas.cumulated_power_plot = cumulated_power_plot
-                self.plot_canvas.plot_power_density_ticket(ticket,
-                                                           ticket["h_label"],
-                                                           ticket["v_label"],
-                                                           cumulated_total_power=0.0,
-                                                           energy_min=energy_min,
-                                                           energy_max=energy_max,
-                                                           energy_step=energy_step,
-                                                           cumulated_quantity=self.cumulated_quantity)
+    def __get_post_processing(self):
+        if self.__post_processing is None: self.__post_processing = PostProcessingChain()
 
-                self.plotted_ticket = ticket
-            except Exception as e:
-                QMessageBox.critical(self, "Error", str(e), QMessageBox.Ok)
+        return self.__post_processing
 
-                if self.IS_DEVELOP: raise e
+    # the plotted ticket is the original one, with the post processing operations applied (lazily):
+    # both are stable data only when the calculations are completed
+    @property
+    def plotted_ticket(self):
+        self._wait_for_calculations()
 
-    def __flip(self, axis=0):
-        if not self.plotted_ticket is None:
-            try:
-                ticket = self.plotted_ticket.copy()
+        return self.__get_post_processing().evaluate()
 
-                histogram = ticket["histogram"]
-                h_coord = ticket["bin_h_center"]
-                v_coord = ticket["bin_v_center"]
+    @plotted_ticket.setter
+    def plotted_ticket(self, ticket):
+        self.__set_post_processing_source(ticket)
 
-                h_coord, v_coord, histogram = flip(h_coord, v_coord, histogram, axis=axis)
+    @property
+    def plotted_ticket_original(self):
+        self._wait_for_calculations()
 
-                ticket["histogram"] = histogram
-                ticket["bin_h_center"] = h_coord
-                ticket["bin_v_center"] = v_coord
+        return self.__get_post_processing().get_source()
 
-                pixel_area = (h_coord[1] - h_coord[0]) * (v_coord[1] - v_coord[0])
+    @plotted_ticket_original.setter
+    def plotted_ticket_original(self, ticket):
+        self.__set_post_processing_source(ticket)
 
-                if self.plot_canvas is None:
-                    self.plot_canvas = PowerPlotXYWidget()
-                    self.image_box.layout().addWidget(self.plot_canvas)
+    def __set_post_processing_source(self, ticket, keep_operations=False):
+        # the incident power of the canvas comes with the new data: not rescaled yet
+        self.__incident_power_factor = 1.0
+        self.__get_post_processing().set_source(ticket, keep_operations=keep_operations)
 
-                cumulated_power_plot = numpy.sum(histogram) * pixel_area
+    def __rescale_incident_power(self, ticket):
+        # tickets without incident power show the one of the canvas: it follows the rescalings too
+        if not "incident_power" in ticket:
+            total_factor = self.__get_post_processing().get_total_factor()
 
-                try:
-                    energy_min = ticket["energy_min"]
-                    energy_max = ticket["energy_max"]
-                    energy_step = ticket["energy_step"]
-                except:
-                    energy_min = 0.0
-                    energy_max = 0.0
-                    energy_step = 0.0
+            self.plot_canvas.cumulated_previous_power_plot *= total_factor/self.__incident_power_factor
+            self.__incident_power_factor = total_factor
 
-                self.plot_canvas.cumulated_power_plot = cumulated_power_plot
-                self.plot_canvas.plot_power_density_ticket(ticket,
-                                                           ticket["v_label"],
-                                                           ticket["h_label"],
-                                                           cumulated_total_power=0.0,
-                                                           energy_min=energy_min,
-                                                           energy_max=energy_max,
-                                                           energy_step=energy_step,
-                                                           cumulated_quantity=self.cumulated_quantity)
-
-                self.plotted_ticket = ticket
-            except Exception as e:
-                QMessageBox.critical(self, "Error", str(e), QMessageBox.Ok)
-
-                if self.IS_DEVELOP: raise e
-
-    def flip_H(self):
-        self.__flip(0)
-
-    def flip_V(self):
-        self.__flip(1)
-
-    def invert_plot(self):
+    def __post_process(self, append_operation):
         if not self.plotted_ticket is None:
-            try:
-                ticket = self.plotted_ticket.copy()
-
-                histogram = ticket["histogram"]
-                h_coord = ticket["bin_h_center"]
-                v_coord = ticket["bin_v_center"]
-
-                h_coord, v_coord, histogram = invert(h_coord, v_coord, histogram)
-
-                ticket["histogram"] = histogram
-                ticket["bin_h_center"] = h_coord
-                ticket["bin_v_center"] = v_coord
-
-                pixel_area = (h_coord[1] - h_coord[0]) * (v_coord[1] - v_coord[0])
-
-                if self.plot_canvas is None:
-                    self.plot_canvas = PowerPlotXYWidget()
-                    self.image_box.layout().addWidget(self.plot_canvas)
-
-                cumulated_power_plot = numpy.sum(histogram) * pixel_area
-
-                try:
-                    energy_min = ticket["energy_min"]
-                    energy_max = ticket["energy_max"]
-                    energy_step = ticket["energy_step"]
-                except:
-                    energy_min = 0.0
-                    energy_max = 0.0
-                    energy_step = 0.0
+            post_processing      = self.__get_post_processing()
+            number_of_operations = post_processing.get_number_of_operations()
 
-                self.plot_canvas.cumulated_power_plot = cumulated_power_plot
-                self.plot_canvas.plot_power_density_ticket(ticket,
-                                                           ticket["v_label"],
-                                                           ticket["h_label"],
-                                                           cumulated_total_power=0.0,
-                                                           energy_min=energy_min,
-                                                           energy_max=energy_max,
-                                                           energy_step=energy_step,
-                                                           cumulated_quantity=self.cumulated_quantity)
+            try:
+                append_operation(post_processing)
 
-                self.plotted_ticket = ticket
+                self.__plot_post_processed_ticket()
             except Exception as e:
+                # a failed validation appends nothing: the previous operations must survive
+                if post_processing.get_number_of_operations() > number_of_operations: post_processing.discard_last()
+
                 QMessageBox.critical(self, "Error", str(e), QMessageBox.Ok)
 
                 if self.IS_DEVELOP: raise e
 
-    def rescale_plot(self):
-        if not self.plotted_ticket is None:
-            try:
-                congruence.checkStrictlyPositiveNumber(self.scaling_factor, "Scaling Factor")
-
-                ticket = self.plotted_ticket.copy()
-
-                histogram = ticket["histogram"] * self.scaling_factor
-                h_coord = ticket["bin_h_center"]
-                v_coord = ticket["bin_v_center"]
-
-                pixel_area = (h_coord[1] - h_coord[0]) * (v_coord[1] - v_coord[0])
+    def __plot_post_processed_ticket(self):
+        ticket = self.plotted_ticket
 
-                ticket["histogram"] = histogram
-
-                if self.plot_canvas is None:
-                    self.plot_canvas = PowerPlotXYWidget()
-                    self.image_box.layout().addWidget(self.plot_canvas)
-
-                cumulated_power_plot = numpy.sum(histogram) * pixel_area
+        if self.plot_canvas is None:
+            self.plot_canvas = PowerPlotXYWidget()
+            self.image_box.layout().addWidget(self.plot_canvas)
 
-                try:
-                    energy_min = ticket["energy_min"]
-                    energy_max = ticket["energy_max"]
-                    energy_step = ticket["energy_step"]
-                except:
-                    energy_min = 0.0
-                    energy_max = 0.0
-                    energy_step = 0.0
+        self.plot_canvas.cumulated_power_plot = numpy.sum(ticket["histogram"]) * (ticket["bin_h_center"][1] - ticket["bin_h_center"][0]) * (ticket["bin_v_center"][1] - ticket["bin_v_center"][0])
+        self.__rescale_incident_power(ticket)
+        self.plot_canvas.plot_power_density_ticket(ticket,
+                                                   ticket["h_label"],
+                                                   ticket["v_label"],
+                                                   cumulated_total_power=0.0,
+                                                   energy_min=ticket.get("energy_min", 0.0),
+                                                   energy_max=ticket.get("energy_max", 0.0),
+                                                   energy_step=ticket.get("energy_step", 0.0),
+                                                   cumulated_quantity=self.cumulated_quantity)
 
-                if not self.plot_canvas.cumulated_previous_power_plot is None:
-                    self.plot_canvas.cumulated_previous_power_plot *= self.scaling_factor
-                self.plot_canvas.cumulated_power_plot = cumulated_power_plot
-                self.plot_canvas.plot_power_density_ticket(ticket,
-                                                           ticket["v_label"],
-                                                           ticket["h_label"],
-                                                           cumulated_total_power=0.0,
-                                                           energy_min=energy_min,
-                                                           energy_max=energy_max,
-                                                           energy_step=energy_step,
-                                                           cumulated_quantity=self.cumulated_quantity)
+    def reload_plot(self):
+        if not self.plotted_ticket_original is None:
+            self.__get_post_processing().clear()
 
-                self.plotted_ticket = ticket
+            try:
+                self.__plot_post_processed_ticket()
             except Exception as e:
                 QMessageBox.critical(self, "Error", str(e), QMessageBox.Ok)
 
                 if self.IS_DEVELOP: raise e
 
-    def rebin_plot(self):
-        if not self.plotted_ticket is None:
-            try:
-                congruence.checkStrictlyPositiveNumber(self.new_nbins_h, "Nr. Bins H")
-                congruence.checkStrictlyPositiveNumber(self.new_nbins_v, "Nr. Bins V")
-
-                ticket = self.plotted_ticket.copy()
-
-                histogram = ticket["histogram"]
-                h_coord = ticket["bin_h_center"]
-                v_coord = ticket["bin_v_center"]
-
-                pixel_area_original = (h_coord[1] - h_coord[0]) * (v_coord[1] - v_coord[0])
-                integral_original   = numpy.sum(histogram)
-
-                h_coord, v_coord, histogram = rebin(h_coord, v_coord, histogram, (int(self.new_nbins_h), int(self.new_nbins_v)))
-
-                pixel_area_rebin = (h_coord[1] - h_coord[0]) * (v_coord[1] - v_coord[0])
+    def flip_H(self):
+        self.__post_process(lambda post_processing: post_processing.flip(0))
 
-                if self.plot_canvas is None:
-                    self.plot_canvas = PowerPlotXYWidget()
-                    self.image_box.layout().addWidget(self.plot_canvas)
+    def flip_V(self):
+        self.__post_process(lambda post_processing: post_processing.flip(1))
 
-                integral_rebin = numpy.sum(histogram)
+    def invert_plot(self):
+        self.__post_process(lambda post_processing: post_processing.invert())
 
-                histogram *= (integral_original * pixel_area_original) / (integral_rebin * pixel_area_rebin) # rinormalization
+    def rescale_plot(self):
+        def append_operation(post_processing):
+            congruence.checkStrictlyPositiveNumber(self.scaling_factor, "Scaling Factor")
 
-                cumulated_power_plot = numpy.sum(histogram) * pixel_area_rebin
+            post_processing.rescale(self.scaling_factor)
 
-                ticket["histogram"] = histogram
-                ticket["bin_h_center"] = h_coord
-                ticket["bin_v_center"] = v_coord
+        self.__post_process(append_operation)
 
-                try:
-                    energy_min = ticket["energy_min"]
-                    energy_max = ticket["energy_max"]
-                    energy_step = ticket["energy_step"]
-                except:
-                    energy_min = 0.0
-                    energy_max = 0.0
-                    energy_step = 0.0
+    def rebin_plot(self):
+        def append_operation(post_processing):
+            congruence.checkStrictlyPositiveNumber(self.new_nbins_h, "Nr. Bins H")
+            congruence.checkStrictlyPositiveNumber(self.new_nbins_v, "Nr. Bins V")
 
-                self.plot_canvas.cumulated_power_plot = cumulated_power_plot
-                self.plot_canvas.plot_power_density_ticket(ticket,
-                                                           ticket["h_label"],
-                                                           ticket["v_label"],
-                                                           cumulated_total_power=0.0,
-                                                           energy_min=energy_min,
-                                                           energy_max=energy_max,
-                                                           energy_step=energy_step,
-                                                           cumulated_quantity=self.cumulated_quantity)
+            new_shape = (int(self.new_nbins_h), int(self.new_nbins_v))
 
-                self.plotted_ticket = ticket
-            except Exception as e:
-                QMessageBox.critical(self, "Error", str(e), QMessageBox.Ok)
+            post_processing.apply(lambda h_coord, v_coord, histogram: rebin(h_coord, v_coord, histogram, new_shape))
 
-                if self.IS_DEVELOP: raise e
+        self.__post_process(append_operation)
 
     def cut_plot(self):
-        if not self.plotted_ticket is None:
-            try:
-                congruence.checkLessThan(self.new_range_h_from, self.new_range_h_to, "New Range H from", "New Range H to")
-                congruence.checkLessThan(self.new_range_v_from, self.new_range_v_to, "New Range V from", "New Range V to")
-
-                ticket = self.plotted_ticket.copy()
-
-                histogram = ticket["histogram"]
-                h_coord = ticket["bin_h_center"]
-                v_coord = ticket["bin_v_center"]
+        def append_operation(post_processing):
+            congruence.checkLessThan(self.new_range_h_from, self.new_range_h_to, "New Range H from", "New Range H to")
+            congruence.checkLessThan(self.new_range_v_from, self.new_range_v_to, "New Range V from", "New Range V to")
 
-                congruence.checkGreaterOrEqualThan(self.new_range_h_from, h_coord[0], "New Range H from", "Original Min(H)")
-                congruence.checkLessOrEqualThan(self.new_range_h_to, h_coord[-1], "New Range H to", "Original Max(H)")
-                congruence.checkGreaterOrEqualThan(self.new_range_v_from, v_coord[0], "New Range V from", "Original Min(V)")
-                congruence.checkLessOrEqualThan(self.new_range_v_to, v_coord[-1], "New Range V to", "Original Max(V)")
+            h_coord = self.plotted_ticket["bin_h_center"]
+            v_coord = self.plotted_ticket["bin_v_center"]
 
-                h_coord, v_coord, histogram = cut(h_coord, v_coord, histogram,
-                                                  range_x=[self.new_range_h_from, self.new_range_h_to],
-                                                  range_y=[self.new_range_v_from, self.new_range_v_to])
+            congruence.checkGreaterOrEqualThan(self.new_range_h_from, h_coord[0], "New Range H from", "Original Min(H)")
+            congruence.checkLessOrEqualThan(self.new_range_h_to, h_coord[-1], "New Range H to", "Original Max(H)")
+            congruence.checkGreaterOrEqualThan(self.new_range_v_from, v_coord[0], "New Range V from", "Original Min(V)")
+            congruence.checkLessOrEqualThan(self.new_range_v_to, v_coord[-1], "New Range V to", "Original Max(V)")
 
-                ticket["histogram"] = histogram
-                ticket["bin_h_center"] = h_coord
-                ticket["bin_v_center"] = v_coord
+            post_processing.cut(range_h=[self.new_range_h_from, self.new_range_h_to],
+                                range_v=[self.new_range_v_from, self.new_range_v_to])
 
-                pixel_area = (h_coord[1] - h_coord[0]) * (v_coord[1] - v_coord[0])
-
-                if self.plot_canvas is None:
-                    self.plot_canvas = PowerPlotXYWidget()
-                    self.image_box.layout().addWidget(self.plot_canvas)
-
-                cumulated_power_plot = numpy.sum(histogram) * pixel_area
-
-                try:
-                    energy_min = ticket["energy_min"]
-                    energy_max = ticket["energy_max"]
-                    energy_step = ticket["energy_step"]
-                except:
-                    energy_min = 0.0
-                    energy_max = 0.0
-                    energy_step = 0.0
-
-                self.plot_canvas.cumulated_power_plot = cumulated_power_plot
-                self.plot_canvas.plot_power_density_ticket(ticket,
-                                                           ticket["h_label"],
-                                                           ticket["v_label"],
-                                                           cumulated_total_power=0.0,
-                                                           energy_min=energy_min,
-                                                           energy_max=energy_max,
-                                                           energy_step=energy_step,
-                                                           cumulated_quantity=self.cumulated_quantity)
-
-                self.plotted_ticket = ticket
-            except Exception as e:
-                QMessageBox.critical(self, "Error", str(e), QMessageBox.Ok)
-
-                if self.IS_DEVELOP: raise e
+        self.__post_process(append_operation)
 
     def mask_plot(self):
-        if not self.plotted_ticket is None:
-            try:
-                if self.masking == 0:
-                    congruence.checkPositiveNumber(self.masking_level, "Masking Level")
-                if self.masking == 1:
-                    congruence.checkPositiveNumber(self.masking_width, "Masking Width")
-                    congruence.checkPositiveNumber(self.masking_height, "Masking height")
-                if self.masking == 2:
-                    congruence.checkPositiveNumber(self.masking_diameter, "Masking Radius")
-
-                ticket = copy.deepcopy(self.plotted_ticket)
-
-                histogram = ticket["histogram"]
-                h_coord = ticket["bin_h_center"]
-                v_coord = ticket["bin_v_center"]
-
-                if self.masking == 0:
-                    if self.masking_type == 0:
-                        mask = numpy.where(histogram <= self.masking_level)
-                    else:
-                        mask = numpy.where(histogram >= self.masking_level)
-                    histogram[mask] = 0.0
-                elif self.masking == 1:
-                    if self.masking_type == 0:
-                        mask_h = numpy.where(numpy.logical_or(h_coord < -self.masking_width / 2, h_coord > self.masking_width / 2))
-                        mask_v = numpy.where(numpy.logical_or(v_coord < -self.masking_height / 2, v_coord > self.masking_height / 2))
-
-                        histogram[mask_h, :] = 0.0
-                        histogram[:, mask_v] = 0.0
+        def append_operation(post_processing):
+            if self.masking == 0:
+                congruence.checkPositiveNumber(self.masking_level, "Masking Level")
+            if self.masking == 1:
+                congruence.checkPositiveNumber(self.masking_width, "Masking Width")
+                congruence.checkPositiveNumber(self.masking_height, "Masking height")
+            if self.masking == 2:
+                congruence.checkPositiveNumber(self.masking_diameter, "Masking Radius")
+
+            masking, masking_type = self.masking, self.masking_type
+            masking_level         = self.masking_level
+            masking_width         = self.masking_width
+            masking_height        = self.masking_height
+            masking_diameter      = self.masking_diameter
+
+            def mask_function(h_coord, v_coord, histogram):
+                if masking == 0:
+                    if masking_type == 0: histogram[histogram <= masking_level] = 0.0
+                    else:                 histogram[histogram >= masking_level] = 0.0
+                elif masking == 1:
+                    inside_h = numpy.logical_and(h_coord >= -masking_width / 2, h_coord <= masking_width / 2)
+                    inside_v = numpy.logical_and(v_coord >= -masking_height / 2, v_coord <= masking_height / 2)
+
+                    if masking_type == 0:
+                        histogram[~inside_h, :] = 0.0
+                        histogram[:, ~inside_v] = 0.0
                     else:
-                        mask_h = numpy.where(numpy.logical_and(h_coord >= -self.masking_width / 2, h_coord <= self.masking_width / 2))
-                        mask_v = numpy.where(numpy.logical_and(v_coord >= -self.masking_height / 2, v_coord <= self.masking_height / 2))
-
-                        histogram[numpy.meshgrid(mask_h, mask_v)] = 0.0
-                elif self.masking == 2:
-                    h, v = numpy.meshgrid(v_coord, h_coord)
-                    r = numpy.sqrt(h ** 2 + v ** 2)
-
-                    if self.masking_type == 0: mask = numpy.where(r > self.masking_diameter * 0.5)
-                    else:                      mask = numpy.where(r <= self.masking_diameter * 0.5)
-
-                    histogram[mask] = 0.0
-
-                pixel_area = (h_coord[1] - h_coord[0]) * (v_coord[1] - v_coord[0])
-
-                ticket["histogram"] = histogram
+                        histogram[numpy.ix_(inside_h, inside_v)] = 0.0
+                elif masking == 2:
+                    r = numpy.sqrt(h_coord[:, numpy.newaxis] ** 2 + v_coord[numpy.newaxis, :] ** 2)
 
-                if self.plot_canvas is None:
-                    self.plot_canvas = PowerPlotXYWidget()
-                    self.image_box.layout().addWidget(self.plot_canvas)
+                    if masking_type == 0: histogram[r > masking_diameter * 0.5] = 0.0
+                    else:                 histogram[r <= masking_diameter * 0.5] = 0.0
 
-                cumulated_power_plot = numpy.sum(ticket["histogram"]) * pixel_area
+                return h_coord, v_coord, histogram
 
-                try:
-                    energy_min = ticket["energy_min"]
-                    energy_max = ticket["energy_max"]
-                    energy_step = ticket["energy_step"]
-                except:
-                    energy_min = 0.0
-                    energy_max = 0.0
-                    energy_step = 0.0
-
-                self.plot_canvas.cumulated_power_plot = cumulated_power_plot
-                self.plot_canvas.plot_power_density_ticket(ticket,
-                                                           ticket["h_label"],
-                                                           ticket["v_label"],
-                                                           cumulated_total_power=0.0,
-                                                           energy_min=energy_min,
-                                                           energy_max=energy_max,
-                                                           energy_step=energy_step,
-                                                           cumulated_quantity=self.cumulated_quantity)
-
-                self.plotted_ticket = ticket
-            except Exception as e:
-                QMessageBox.critical(self, "Error", str(e), QMessageBox.Ok)
+            post_processing.apply(mask_function, in_place=True)
 
-                if self.IS_DEVELOP: raise e
+        self.__post_process(append_operation)
 
     def smooth_plot(self):
-        if not self.plotted_ticket is None:
-            try:
-                if self.filter == 0 or 2 <= self.filter <= 5:
-                    congruence.checkStrictlyPositiveNumber(self.filter_sigma_h, "Sigma/Size H")
-                    congruence.checkStrictlyPositiveNumber(self.filter_sigma_v, "Sigma/Size V")
+        def append_operation(post_processing):
+            if self.filter == 0 or 2 <= self.filter <= 5:
+                congruence.checkStrictlyPositiveNumber(self.filter_sigma_h, "Sigma/Size H")
+                congruence.checkStrictlyPositiveNumber(self.filter_sigma_v, "Sigma/Size V")
 
-                if self.filter == 1: congruence.checkStrictlyPositiveNumber(self.filter_spline_order, "Spline Order")
+            if self.filter == 1: congruence.checkStrictlyPositiveNumber(self.filter_spline_order, "Spline Order")
 
-                ticket = self.plotted_ticket.copy()
-
-                histogram = ticket["histogram"]
-                h_coord = ticket["bin_h_center"]
-                v_coord = ticket["bin_v_center"]
+            kind_of_filter = self.filter
+            filter_sigma   = (self.filter_sigma_h, self.filter_sigma_v)
+            filter_mode    = self.cb_filter_mode.currentText()
+            filter_cval    = self.filter_cval
+            spline_order   = int(self.filter_spline_order)
 
+            def smooth_function(h_coord, v_coord, histogram):
                 norm = histogram.sum()
 
-                pixel_area = (h_coord[1] - h_coord[0]) * (v_coord[1] - v_coord[0])
-
-                filter_mode = self.cb_filter_mode.currentText()
-
-                if self.filter == 0:
-                    histogram = filters.gaussian_filter(histogram, sigma=(self.filter_sigma_h, self.filter_sigma_v), mode=filter_mode, cval=self.filter_cval)
-                elif self.filter == 1:
-                    histogram = interpolation.spline_filter(histogram, order=int(self.filter_spline_order))
-                elif self.filter == 2:
-                    histogram = filters.uniform_filter(histogram, size=(int(self.filter_sigma_h), int(self.filter_sigma_v)), mode=filter_mode, cval=self.filter_cval)
-                elif self.filter == 3:
-                    histogram = numpy.real(numpy.fft.ifft2(fourier.fourier_gaussian(numpy.fft.fft2(histogram), sigma=(self.filter_sigma_h, self.filter_sigma_v))))
-                elif self.filter == 4:
-                    histogram = numpy.real(numpy.fft.ifft2(fourier.fourier_ellipsoid(numpy.fft.fft2(histogram), size=(self.filter_sigma_h, self.filter_sigma_v))))
-                elif self.filter == 5:
-                    histogram = numpy.real(numpy.fft.ifft2(fourier.fourier_uniform(numpy.fft.fft2(histogram), size=(self.filter_sigma_h, self.filter_sigma_v))))
-                elif self.filter == 6:
+                if kind_of_filter == 0:
+                    histogram = gaussian_smooth(histogram, sigma=filter_sigma, mode=filter_mode, cval=filter_cval)
+                elif kind_of_filter == 1:
+                    histogram = interpolation.spline_filter(histogram, order=spline_order)
+                elif kind_of_filter == 2:
+                    histogram = filters.uniform_filter(histogram, size=(int(filter_sigma[0]), int(filter_sigma[1])), mode=filter_mode, cval=filter_cval)
+                elif kind_of_filter == 3:
+                    histogram = fourier_smooth(histogram, FourierFilter.GAUSSIAN, filter_sigma)
+                elif kind_of_filter == 4:
+                    histogram = fourier_smooth(histogram, FourierFilter.ELLIPSOID, filter_sigma)
+                elif kind_of_filter == 5:
+                    histogram = fourier_smooth(histogram, FourierFilter.UNIFORM, filter_sigma)
+                elif kind_of_filter == 6:
                     histogram = apply_fill_holes(histogram)
 
                 norm /= histogram.sum()
 
-                ticket["histogram"] = histogram * norm
-
-                if self.plot_canvas is None:
-                    self.plot_canvas = PowerPlotXYWidget()
-                    self.image_box.layout().addWidget(self.plot_canvas)
+                return h_coord, v_coord, histogram * norm
 
-                cumulated_power_plot = numpy.sum(ticket["histogram"]) * pixel_area
+            post_processing.apply(smooth_function)
 
-                energy_min = 0.0
-                energy_max = 0.0
-                energy_step = 0.0
-
-                self.plot_canvas.cumulated_power_plot = cumulated_power_plot
-                self.plot_canvas.plot_power_density_ticket(ticket,
-                                                           ticket["h_label"],
-                                                           ticket["v_label"],
-                                                           cumulated_total_power=0.0,
-                                                           energy_min=energy_min,
-                                                           energy_max=energy_max,
-                                                           energy_step=energy_step,
-                                                           cumulated_quantity=self.cumulated_quantity)
-
-                self.plotted_ticket = ticket
-            except Exception as e:
-                QMessageBox.critical(self, "Error", str(e), QMessageBox.Ok)
-
-                if self.IS_DEVELOP: raise e
+        self.__post_process(append_operation)
 
     def show_fit_formulas(self):
         dialog = ShowFitFormulasDialog(parent=self)
@@ -1620,6 +1651,46 @@ class AbstractPowerPlotXY(AutomaticElement):
 
                 if self.IS_DEVELOP: raise e
 
+    def do_batch_fit(self):
+        try:
+            if self.autosave == 0: raise ValueError("Batch fit needs the autosave file: activate \"Save automatically plot into file\"")
+
+            congruence.checkPositiveNumber(self.fit_processes, "Processes")
+            if self.fit_algorithm == 2: congruence.checkStrictlyPositiveNumber(self.poly_degree, "Degree")
+
+            self._wait_for_calculations()
+
+            file_name = congruence.checkFileName(self.autosave_file_name)
+
+            if self.fit_algorithm == 0:   bounds = bounds_gaussian(c=[-1e-12, 1e-12]) if self.gauss_c_fixed == 1 else None
+            elif self.fit_algorithm == 1: bounds = bounds_pv(c=[-1e-12, 1e-12]) if self.pv_c_fixed == 1 else None
+            else:                         bounds = None
+
+            # the workers read the file: the autosave handle is released and the file reopened in append mode
+            autosave_file = self._get_autosave_file()
+            if not autosave_file is None and autosave_file.filename != file_name: autosave_file = None
+
+            if not autosave_file is None: autosave_file.close()
+
+            try:
+                tables = fit_power_density_file(file_name, self.fit_algorithm, degree=self.poly_degree, bounds=bounds, n_processes=self.fit_processes)
+            finally:
+                if not autosave_file is None:
+                    self.__accumulation.autosave_file = PowerDensityHdf5File(file_name,
+                                                                             swmr=autosave_file.swmr,
+                                                                             flush_interval=autosave_file.flush_interval,
+                                                                             flush_steps=autosave_file.flush_steps,
+                                                                             compression_level=autosave_file.compression_level,
+                                                                             append=True)
+
+            QMessageBox.information(self, "Fit Autosave File",
+                                    "Cumulated plot and " + str(len(tables["chisquare"])) + " partial plots fitted, results saved in:\n" +
+                                    file_name + " (/fits/" + FitModel.get_name(self.fit_algorithm) + ")", QMessageBox.Ok)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", str(e), QMessageBox.Ok)
+
+            if self.IS_DEVELOP: raise e
+
     def plot_fit(self, xx, yy, pd, pd_fit, algorithm, suffix, chisquare, params, fontsize=14,
                  formula_img_file=None, zoom=0.5, xybox=(85, -20)):
         dialog = ShowFitResultDialog(xx, yy, pd, pd_fit, algorithm, chisquare, params,
@@ -1633,31 +1704,25 @@ class AbstractPowerPlotXY(AutomaticElement):
         dialog.show()
 
     def load_partial_results(self):
+        self._wait_for_calculations()
+
         file_name = None if self.autosave==0 else self.autosave_file_name
 
         if not file_name is None:
-            plot_file = ShadowPlot.PlotXYHdf5File(congruence.checkDir(file_name), mode="r")
-
-            ticket = {}
-
-            ticket["histogram"], ticket["histogram_h"], ticket["histogram_v"], attributes = plot_file.get_last_plot(dataset_name="power_density")
-            ticket["bin_h_center"], ticket["bin_v_center"], ticket["h_label"], ticket["v_label"] = plot_file.get_coordinates()
-            ticket["intensity"] = attributes["intensity"]
-            ticket["nrays"] = attributes["total_rays"]
-            ticket["good_rays"] = attributes["good_rays"]
+            ticket, additional_data = self._read_plot_file(file_name)
 
             if self.plot_canvas is None:
                 self.plot_canvas = PowerPlotXYWidget()
                 self.image_box.layout().addWidget(self.plot_canvas)
 
-            try:
-                last_plotted_power = plot_file.get_attribute("last_plotted_power", dataset_name="additional_data")
-                last_incident_power = plot_file.get_attribute("last_incident_power", dataset_name="additional_data")
-                last_total_power = plot_file.get_attribute("last_total_power", dataset_name="additional_data")
-                energy_min = plot_file.get_attribute("last_energy_min", dataset_name="additional_data")
-                energy_max = plot_file.get_attribute("last_energy_max", dataset_name="additional_data")
-                energy_step = plot_file.get_attribute("last_energy_step", dataset_name="additional_data")
-            except:
+            if not additional_data is None:
+                last_plotted_power = additional_data["last_plotted_power"]
+                last_incident_power = additional_data["last_incident_power"]
+                last_total_power = additional_data["last_total_power"]
+                energy_min = additional_data["last_energy_min"]
+                energy_max = additional_data["last_energy_max"]
+                energy_step = additional_data["last_energy_step"]
+            else:
                 last_plotted_power = numpy.sum(ticket["histogram"]) * (ticket["bin_h_center"][1] - ticket["bin_h_center"][0]) * (ticket["bin_v_center"][1] - ticket["bin_v_center"][0])
                 last_incident_power = 0.0
                 last_total_power = 0.0
@@ -1677,7 +1742,7 @@ class AbstractPowerPlotXY(AutomaticElement):
                                                            energy_step=energy_step,
                                                            cumulated_quantity=self.cumulated_quantity)
 
-                self.cumulated_ticket = ticket
+                self._set_accumulation(ticket, last_plotted_power, last_incident_power)
                 self.plotted_ticket = ticket
                 self.plotted_ticket_original = ticket.copy()
             except Exception as e:
@@ -1689,12 +1754,12 @@ class AbstractPowerPlotXY(AutomaticElement):
 #################################################
 # UTILITIES
 
+# conservative: any new shape, same range (bin edges) and same integrated power
 def rebin(x, y, z, new_shape):
-    shape = (new_shape[0], z.shape[0] // new_shape[0], new_shape[1], z.shape[1] // new_shape[1])
+    new_x_edges = get_rebinned_edges(x, new_shape[0])
+    new_y_edges = get_rebinned_edges(y, new_shape[1])
 
-    return numpy.linspace(x[0], x[-1], new_shape[0]), \
-           numpy.linspace(y[0], y[-1], new_shape[1]), \
-           z.reshape(shape).mean(-1).mean(1)
+    return get_bin_centers(new_x_edges), get_bin_centers(new_y_edges), rebin_power_density(x, y, z, new_x_edges, new_y_edges)
 
 
 def invert(x, y, data):
@@ -1847,61 +1912,41 @@ def guess_params_poly(degree):
     return numpy.ones(int(degree + 1) ** 2).tolist()
 
 
+# separable models with analytic Jacobian: without guess parameters, the fit is seeded by 1D fits of the projections
 def fit_gaussian(xx, yy, pd, guess_params=None, bounds=None):
-    error_function = lambda p: numpy.ravel(gaussian(*p)(*numpy.meshgrid(xx, yy)) - pd)
-
-    if guess_params is None: guess_params = guess_params_gaussian(xx, yy, pd)
-    if bounds is None:       bounds = bounds_gaussian()
+    if bounds is None: bounds = bounds_gaussian()
 
-    optimized_result = least_squares(fun=error_function, x0=guess_params, bounds=bounds)
-
-    return optimized_result.x
+    return fit_separable(FitModel.GAUSSIAN, xx, yy, pd, guess_params, bounds)
 
 
 def fit_pseudovoigt(xx, yy, pd, guess_params=None, bounds=None):
-    error_function = lambda p: numpy.ravel(pseudovoigt(*p)(*numpy.meshgrid(xx, yy)) - pd)
-
-    if guess_params is None: guess_params = guess_params_pv(xx, yy, pd)
-    if bounds is None:       bounds = bounds_pv()
-
-    optimized_result = least_squares(fun=error_function, x0=guess_params, bounds=bounds)
-
-    return optimized_result.x
-
-
-def fit_polynomial(xx, yy, pd, degree=4, guess_params=None):
-    error_function = lambda p: numpy.ravel(polynomial(p)(*numpy.meshgrid(xx, yy)) - pd)
+    if bounds is None: bounds = bounds_pv()
 
-    bounds = [numpy.full(int(degree + 1) ** 2, -numpy.inf).tolist(),
-              numpy.full(int(degree + 1) ** 2, numpy.inf).tolist()]
-    bounds[0][0] = 0.0
+    return fit_separable(FitModel.PSEUDO_VOIGT, xx, yy, pd, guess_params, bounds)
 
-    optimized_result = least_squares(fun=error_function,
-                                     x0=guess_params_poly(degree) if guess_params is None else guess_params,
-                                     bounds=bounds)
 
-    return optimized_result.x
+# linear problem: solved directly, guess_params is kept for compatibility and ignored
+def fit_polynomial(xx, yy, pd, degree=4, guess_params=None, weights=None):
+    return fit_polynomial_surface(xx, yy, pd, degree, weights)
 
 
 def get_fitted_data_gaussian(xx, yy, pd, guess_params=None, bounds=None):
     params = fit_gaussian(xx, yy, pd, guess_params, bounds)
-    fit = gaussian(*params)
 
-    return fit(*numpy.meshgrid(xx, yy)), params
+    return evaluate_separable(FitModel.GAUSSIAN, xx, yy, params), params
 
 
 def get_fitted_data_pv(xx, yy, pd, guess_params=None, bounds=None):
     params = fit_pseudovoigt(xx, yy, pd, guess_params, bounds)
-    fit = pseudovoigt(*params)
 
-    return fit(*numpy.meshgrid(xx, yy)), params
+    return evaluate_separable(FitModel.PSEUDO_VOIGT, xx, yy, params), params
 
 
 def get_fitted_data_poly(xx, yy, pd, degree=4, guess_params=None):
     params = fit_polynomial(xx, yy, pd, degree, guess_params)
-    fit = polynomial(params)
+    size   = int(degree + 1)
 
-    return fit(*numpy.meshgrid(xx, yy)), params
+    return polygrid2d(xx, yy, numpy.reshape(params, (size, size))).T, params
 
 
 formulas_path = os.path.join(resources.package_dirname("orangecontrib.shadow_advanced_tools.widgets.thermal"), "misc", "fit_formulas.png")
@@ -45,7 +45,7 @@
 # POSSIBILITY OF SUCH DAMAGE.                                             #
 # #########################################################################
 
-import os, numpy
+import os
 
 from PyQt5 import QtGui, QtWidgets
 from orangewidget import gui
@@ -56,6 +56,9 @@ from oasys.widgets import widget as oasyswidget
 from orangecontrib.shadow.util.shadow_util import ShadowCongruence
 from orangecontrib.shadow.util.shadow_objects import ShadowBeam, ShadowOpticalElement, ShadowOEHistoryItem
 
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_density_bl import get_incident_power
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_attribution_bl import PowerAttribution, get_ray_power, set_ray_intensity, copy_electric_field
+
 
 class FootprintFileReader(oasyswidget.OWWidget):
     name = "Footprint Reader"
@@ -151,51 +154,17 @@ class FootprintFileReader(oasyswidget.OWWidget):
                 if is_scanning:
                     n_rays = len(beam_out._beam.rays[:, 0]) # lost and good!
 
-                    ticket = incident_beam._beam.histo2(1, 3, nbins=100, xrange=None, yrange=None, nolost=1, ref=23)
-                    ticket['histogram'] *= (total_power/n_rays) # power
-
-                    additional_parameters["incident_power"] = ticket['histogram'].sum()
+                    additional_parameters["incident_power"] = get_incident_power(incident_beam._beam.rays, total_power, n_rays)
 
                 if self.kind_of_power == 0: # incident
-                    beam_out._beam.rays[:, 6]  = incident_beam._beam.rays[:, 6]
-                    beam_out._beam.rays[:, 7]  = incident_beam._beam.rays[:, 7]
-                    beam_out._beam.rays[:, 8]  = incident_beam._beam.rays[:, 8]
-                    beam_out._beam.rays[:, 15] = incident_beam._beam.rays[:, 15]
-                    beam_out._beam.rays[:, 16] = incident_beam._beam.rays[:, 16]
-                    beam_out._beam.rays[:, 17] = incident_beam._beam.rays[:, 17]
+                    copy_electric_field(beam_out._beam.rays, incident_beam._beam.rays)
                 elif self.kind_of_power == 1: # absorbed
                     # need a trick: put the whole intensity of one single component
+                    _, absorbed_intensity = get_ray_power(incident_beam._beam.rays, transmitted_beam._beam.rays, PowerAttribution.ABSORBED)
 
-                    incident_intensity = incident_beam._beam.rays[:, 6]**2 + \
-                                         incident_beam._beam.rays[:, 7]**2 + \
-                                         incident_beam._beam.rays[:, 8]**2 +\
-                                         incident_beam._beam.rays[:, 15]**2 + \
-                                         incident_beam._beam.rays[:, 16]**2 + \
-                                         incident_beam._beam.rays[:, 17]**2
-                    transmitted_intensity = transmitted_beam._beam.rays[:, 6]**2 + \
-                                            transmitted_beam._beam.rays[:, 7]**2 + \
-                                            transmitted_beam._beam.rays[:, 8]**2 +\
-                                            transmitted_beam._beam.rays[:, 15]**2 + \
-                                            transmitted_beam._beam.rays[:, 16]**2 + \
-                                            transmitted_beam._beam.rays[:, 17]**2
-
-                    electric_field = numpy.sqrt(incident_intensity - transmitted_intensity)
-                    electric_field[numpy.where(numpy.isnan(electric_field))] = 0.0
-
-                    beam_out._beam.rays[:, 6]  = electric_field
-                    beam_out._beam.rays[:, 7]  = 0.0
-                    beam_out._beam.rays[:, 8]  = 0.0
-                    beam_out._beam.rays[:, 15] = 0.0
-                    beam_out._beam.rays[:, 16] = 0.0
-                    beam_out._beam.rays[:, 17] = 0.0
+                    set_ray_intensity(beam_out._beam.rays, absorbed_intensity)
                 elif self.kind_of_power == 2: # transmitted
-                    beam_out._beam.rays[:, 6]  = transmitted_beam._beam.rays[:, 6]
-                    beam_out._beam.rays[:, 7]  = transmitted_beam._beam.rays[:, 7]
-                    beam_out._beam.rays[:, 8]  = transmitted_beam._beam.rays[:, 8]
-                    beam_out._beam.rays[:, 15] = transmitted_beam._beam.rays[:, 15]
-                    beam_out._beam.rays[:, 16] = transmitted_beam._beam.rays[:, 16]
-                    beam_out._beam.rays[:, 17] = transmitted_beam._beam.rays[:, 17]
-
+                    copy_electric_field(beam_out._beam.rays, transmitted_beam._beam.rays)
 
                 if is_scanning:
                     beam_out.setScanningData(ShadowBeam.ScanningData(self.input_beam.scanned_variable_data.get_scanned_variable_name(),
@@ -67,8 +67,10 @@ from oasys.widgets.exchange import DataExchangeObject
 
 from orangecontrib.shadow.util.shadow_util import ShadowPlot
 
-AUTOBINNING_FILE = "autobinning.dat"
-FILTERS_FILE     = "filters.dat"
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_loop_bl import get_auto_energy_binnings, get_energy_steps, get_binning_position, AUTOBINNING_FILE, FILTERS_FILE
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_checkpoint_bl import is_checkpoint_file, read_checkpoint
+from orangecontrib.shadow_advanced_tools.widgets.thermal.bl.power_density_io_bl import is_power_density_file, read_power_density_file
+
 
 class EnergyBinning(object):
     def __init__(self,
@@ -381,17 +383,26 @@ class PowerLoopPoint(widget.OWWidget):
         self.le_autobinning_file_name.setText(oasysgui.selectFileFromDialog(self, self.autobinning_file_name, "Select File", file_extension_filter="Text Files (*.txt *.dat)"))
 
     def selectRecoveryFile(self):
-        self.le_recovery_file_name.setText(oasysgui.selectFileFromDialog(self, self.recovery_file_name, "Select File", file_extension_filter="HDF5 Files (*.hdf5)"))
+        self.le_recovery_file_name.setText(oasysgui.selectFileFromDialog(self, self.recovery_file_name, "Select File", file_extension_filter="HDF5 Files (*.hdf5 *.h5)"))
 
         try:
-            plot_file = ShadowPlot.PlotXYHdf5File(congruence.checkDir(self.recovery_file_name), mode="r")
+            if is_checkpoint_file(congruence.checkDir(self.recovery_file_name)):
+                self.recovery_last_energy_step = read_checkpoint(self.recovery_file_name).data["current_step"]
+            elif is_power_density_file(self.recovery_file_name):
+                _, additional_data = read_power_density_file(self.recovery_file_name)
 
-            try:
-                self.recovery_last_energy_step = plot_file.get_attribute(attribute_name="current_step", dataset_name="additional_data")
-            except:
-                raise ValueError("Last step non available in this file")
+                if additional_data is None: raise ValueError("Last step non available in this file")
+
+                self.recovery_last_energy_step = int(additional_data["last_current_step"])
+            else: # autosave files written before the power density format
+                plot_file = ShadowPlot.PlotXYHdf5File(congruence.checkDir(self.recovery_file_name), mode="r")
+
+                try:
+                    self.recovery_last_energy_step = plot_file.get_attribute(attribute_name="current_step", dataset_name="additional_data")
+                except:
+                    raise ValueError("Last step non available in this file")
 
-            plot_file.close()
+                plot_file.close()
         except Exception as e:
             QMessageBox.critical(self, "Error", str(e), QMessageBox.Ok)
 
@@ -567,15 +578,10 @@ class PowerLoopPoint(widget.OWWidget):
 
                 self.spectrum_data = data.copy()
 
-                energies                              = data[:, 0]
-                flux_through_finite_aperture          = data[:, 1]
-                flux_through_finite_aperture_filtered = flux_through_finite_aperture.copy()
+                energies                     = data[:, 0]
+                flux_through_finite_aperture = data[:, 1]
 
-                if not self.filters is None:
-                    flux_through_finite_aperture_filtered *= numpy.interp(energies, self.filters[:, 0], self.filters[:, 1])
-                    use_filters = True
-                else:
-                    use_filters = False
+                use_filters = not self.filters is None
 
                 if write_file:
                     file = open(AUTOBINNING_FILE, "w")
@@ -595,112 +601,49 @@ class PowerLoopPoint(widget.OWWidget):
                 else:
                     if write_file: QMessageBox.information(self, "Info", "File autobinning.dat written on working directory", QMessageBox.Ok)
 
-                    congruence.checkStrictlyPositiveNumber(self.auto_n_step, "(Auto) % Number of Steps")
-                    congruence.checkStrictlyPositiveNumber(self.auto_perc_total_power, "(Auto) % Total Power")
-
-                    energy_step = energies[1] - energies[0]
-
-                    # last energy do not contribute to the total (the approximated integral of the power is out of the range)
-
-                    power           = flux_through_finite_aperture * (1e3 * energy_step * codata.e)
-                    cumulated_power = numpy.cumsum(power)
-                    total_power     = cumulated_power[-1]
-
-                    if use_filters:
-                        power_filtered           = flux_through_finite_aperture_filtered * (1e3 * energy_step * codata.e)
-                        cumulated_power_filtered = numpy.cumsum(power_filtered)
-                        total_power_filtered     = cumulated_power_filtered[-1]
+                    binning = get_auto_energy_binnings(data,
+                                                       autobinning=self.autobinning,
+                                                       auto_n_step=self.auto_n_step,
+                                                       auto_perc_total_power=self.auto_perc_total_power,
+                                                       filters=self.filters)
 
                     self.text_area.clear()
 
                     self.cumulated_power_plot.clear()
                     self.spectral_flux_plot.clear()
 
-                    if use_filters:
-                        total_power_binning                  = total_power_filtered
-                        cumulated_power_binning              = cumulated_power_filtered
-                        flux_through_finite_aperture_binning = flux_through_finite_aperture_filtered
-                    else:
-                        total_power_binning                  = total_power
-                        cumulated_power_binning              = cumulated_power
-                        flux_through_finite_aperture_binning = flux_through_finite_aperture
-
-                    good = numpy.where(cumulated_power_binning <= self.auto_perc_total_power*0.01*total_power_binning)
-
-                    energies                             = energies[good]
-                    cumulated_power                      = cumulated_power[good]
-                    cumulated_power_binning              = cumulated_power_binning[good]
-                    flux_through_finite_aperture         = flux_through_finite_aperture[good]
-                    flux_through_finite_aperture_binning = flux_through_finite_aperture_binning[good]
-
-                    if use_filters:
-                        cumulated_power_filtered = cumulated_power_filtered[good]
-                        flux_through_finite_aperture_filtered = flux_through_finite_aperture_filtered[good]
-
-                    if self.autobinning==1: # constant power
-                        interpolated_cumulated_power = numpy.linspace(start=numpy.min(cumulated_power_binning), stop=numpy.max(cumulated_power_binning), num=self.auto_n_step+1)
-                        interpolated_energies        = numpy.interp(interpolated_cumulated_power, cumulated_power_binning, energies)
-                        energy_steps = numpy.ediff1d(interpolated_energies)
-
-                        interpolated_energies        = interpolated_energies[:-1]
-                        interpolated_cumulated_power = interpolated_cumulated_power[:-1]
-
-                        power_steps  = numpy.ones(self.auto_n_step)*cumulated_power_binning[-1]/self.auto_n_step
-
-                    elif self.autobinning==2: # constant energy
-                        minimum_energy = energies[0]
-                        maximum_energy = energies[-1]
-                        energy_step = (maximum_energy-minimum_energy)/self.auto_n_step
-
-                        interpolated_energies        = numpy.arange(minimum_energy, maximum_energy, energy_step)
-                        interpolated_cumulated_power = numpy.interp(interpolated_energies, energies, cumulated_power_binning)
-
-                        energy_steps = numpy.ones(self.auto_n_step)*energy_step
-                        power_steps  = numpy.ediff1d(numpy.append(numpy.zeros(1), interpolated_cumulated_power))
-
-                    flux_steps = numpy.interp(interpolated_energies, energies, flux_through_finite_aperture_binning)
-
-                    self.energy_binnings = []
-                    self.total_new_objects = 0
-
                     if not use_filters:
-                        self.cumulated_power_plot.addCurve(energies, cumulated_power, replace=True, legend="Cumulated Power")
+                        self.cumulated_power_plot.addCurve(binning.energies, binning.cumulated_power, replace=True, legend="Cumulated Power")
                     else:
-                        self.cumulated_power_plot.addCurve(energies, cumulated_power, replace=True, linestyle="--", legend="Cumulated Power")
-                        self.cumulated_power_plot.addCurve(energies, cumulated_power_filtered, replace=False, legend="Cumulated Power (Filtered)", color="#006400")
+                        self.cumulated_power_plot.addCurve(binning.energies, binning.cumulated_power, replace=True, linestyle="--", legend="Cumulated Power")
+                        self.cumulated_power_plot.addCurve(binning.energies, binning.cumulated_power_filtered, replace=False, legend="Cumulated Power (Filtered)", color="#006400")
                     self.cumulated_power_plot.setGraphXLabel("Energy [eV]")
                     self.cumulated_power_plot.setGraphYLabel("Cumulated " + ("" if self.filters is None else " (Filtered)") + " Power" )
-                    self.cumulated_power_plot.setGraphTitle("Total Power: " + str(round(power_steps.sum(), 2)) + " W")
+                    self.cumulated_power_plot.setGraphTitle("Total Power: " + str(round(binning.power_steps.sum(), 2)) + " W")
 
                     if not use_filters:
-                        self.spectral_flux_plot.addCurve(energies, flux_through_finite_aperture, replace=True, legend="Spectral Flux")
+                        self.spectral_flux_plot.addCurve(binning.energies, binning.flux_through_finite_aperture, replace=True, legend="Spectral Flux")
                     else:
-                        self.spectral_flux_plot.addCurve(energies, flux_through_finite_aperture, replace=True, linestyle="--", legend="Spectral Flux")
-                        self.spectral_flux_plot.addCurve(energies, flux_through_finite_aperture_filtered, replace=False, legend="Spectral Flux (Filtered)", color="#006400")
+                        self.spectral_flux_plot.addCurve(binning.energies, binning.flux_through_finite_aperture, replace=True, linestyle="--", legend="Spectral Flux")
+                        self.spectral_flux_plot.addCurve(binning.energies, binning.flux_through_finite_aperture_filtered, replace=False, legend="Spectral Flux (Filtered)", color="#006400")
                     self.spectral_flux_plot.setGraphXLabel("Energy [eV]")
                     self.spectral_flux_plot.setGraphYLabel("Flux [ph/s/.1%bw]")
                     self.spectral_flux_plot.setGraphTitle("Spectral Flux" + ("" if use_filters else " (Filtered)"))
 
-                    self.cumulated_power_plot.addCurve(interpolated_energies, interpolated_cumulated_power, replace=False, legend="Energy Binning", color="red", linestyle=" ", symbol="+")
-                    self.spectral_flux_plot.addCurve(interpolated_energies, flux_steps, replace=False, legend="Energy Binning", color="red", linestyle=" ", symbol="+")
+                    self.cumulated_power_plot.addCurve(binning.interpolated_energies, binning.interpolated_cumulated_power, replace=False, legend="Energy Binning", color="red", linestyle=" ", symbol="+")
+                    self.spectral_flux_plot.addCurve(binning.interpolated_energies, binning.flux_steps, replace=False, legend="Energy Binning", color="red", linestyle=" ", symbol="+")
 
                     self.cumulated_power_plot.getLegendsDockWidget().setVisible(True)
                     self.spectral_flux_plot.getLegendsDockWidget().setVisible(True)
 
-                    text = ""
-                    for energy_value, energy_step, power_step in zip(interpolated_energies, energy_steps, power_steps):
-                        energy_binning = EnergyBinning(energy_value=round(energy_value, 3),
-                                                       energy_step=round(energy_step, 3),
-                                                       power_step=round(power_step, 4))
+                    self.energy_binnings = [EnergyBinning(energy_value=energy_binning.energy_value,
+                                                          energy_step=energy_binning.energy_step,
+                                                          power_step=energy_binning.power_step) for energy_binning in binning.energy_binnings]
+                    self.total_new_objects = len(self.energy_binnings)
 
-                        text += str(round(energy_value, 3)) + ", " + \
-                                str(round(energy_step, 3))  + ", " + \
-                                str(round(power_step, 4)) + "\n"
-
-                        self.energy_binnings.append(energy_binning)
-                        self.total_new_objects += 1
-
-                    self.text_area.setText(text)
+                    self.text_area.setText("".join([str(energy_binning.energy_value) + ", " + \
+                                                    str(energy_binning.energy_step)  + ", " + \
+                                                    str(energy_binning.power_step) + "\n" for energy_binning in self.energy_binnings]))
 
                     self.external_binning = True
             except Exception as e:
@@ -805,6 +748,10 @@ class PowerLoopPoint(widget.OWWidget):
             else: pass
 
     def restartLoopFromCrash(self):
+        if is_checkpoint_file(self.recovery_file_name):
+            self.resumeLoopFromCheckpoint()
+            return
+
         try:
             if self.energy_binnings is None: raise Exception("Reload Spectrum (and Filters, if present) before restarting the loop")
 
@@ -835,6 +782,50 @@ class PowerLoopPoint(widget.OWWidget):
 
             if self.IS_DEVELOP: raise e
 
+    def resumeLoopFromCheckpoint(self):
+        try:
+            if not self.external_binning: self.energy_binnings = None
+            self.calculate_energy_binnings()
+
+            if self.energy_binnings is None: raise Exception("Reload Spectrum (and Filters, if present) before restarting the loop")
+
+            checkpoint = read_checkpoint(self.recovery_file_name).data
+            steps      = get_energy_steps(self.energy_binnings, self.external_binning, self.send_power_step==1)
+            last_step  = checkpoint["current_step"]
+
+            if checkpoint["total_steps"] != len(steps): raise ValueError("Checkpoint of a loop of " + str(checkpoint["total_steps"]) + " steps, " +
+                                                                         "while the current one has " + str(len(steps)) + " steps: reload the same energy binnings")
+            if last_step >= len(steps): raise ValueError("Loop already completed: nothing to resume")
+
+            step = steps[last_step] # the next one, current_step is 1-based
+
+            self.total_current_new_object = last_step + 1
+            self.current_energy_binning, self.current_new_object = get_binning_position(self.energy_binnings, self.total_current_new_object, self.external_binning)
+            self.calculate_number_of_new_objects()
+            self.current_energy_value = step.energy_value
+            self.current_energy_step  = step.energy_step
+            self.current_power_step   = step.power_step
+
+            additional_parameters = {"energy_value"   : self.current_energy_value,
+                                     "energy_step"    : self.current_energy_step,
+                                     "power_step"     : -1 if self.current_power_step is None else self.current_power_step,
+                                     "current_step"   : self.total_current_new_object,
+                                     "total_steps"    : self.total_new_objects,
+                                     "seed_increment" : self.seed_increment,
+                                     "start_event"    : False}
+
+            # the source continues the sequence of seeds of the interrupted loop
+            if not checkpoint["seed"] is None: additional_parameters["seed"] = int(checkpoint["seed"]) + self.seed_increment
+
+            self.setStatusMessage("Running " + self.get_object_name() + " " + str(self.total_current_new_object) + " of " + str(self.total_new_objects))
+            self.start_button.setEnabled(False)
+            self.text_area.setEnabled(False)
+            self.send("Trigger", TriggerOut(new_object=True, additional_parameters=additional_parameters))
+        except Exception as e:
+            QMessageBox.critical(self, "Error", str(e), QMessageBox.Ok)
+
+            if self.IS_DEVELOP: raise e
+
     def restartLoop(self):
         try:
             self.run_loop = True
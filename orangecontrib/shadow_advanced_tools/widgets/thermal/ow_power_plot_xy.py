@@ -58,8 +58,7 @@ from oasys.widgets.gui import ConfirmDialog
 
 from oasys.util.oasys_util import EmittingStream
 
-from orangecontrib.shadow.util.shadow_util import ShadowCongruence, ShadowPlot
-from orangecontrib.shadow_advanced_tools.util.gui import PowerPlotXYWidget
+from orangecontrib.shadow.util.shadow_util import ShadowCongruence
 
 import scipy.constants as codata
 
@@ -76,27 +75,51 @@ class PowerPlotXY(AbstractPowerPlotXY):
 
     autosave = Setting(0)
     autosave_file_name = Setting("autosave_power_density.hdf5")
+    autosave_swmr = Setting(0)
+    autosave_flush_interval = Setting(5.0)
+    autosave_flush_steps = Setting(10)
+    autosave_checkpoint = Setting(0)
+    checkpoint_steps = Setting(10)
+    checkpoint_interval = Setting(300.0)
 
-    autosave_file = None
+    background_calculation = Setting(0)
 
     def __init__(self):
         super().__init__()
 
     def _set_additional_boxes(self, tab_gen):
-        autosave_box = oasysgui.widgetBox(tab_gen, "Autosave", addSpace=True, orientation="vertical", height=85)
+        autosave_box = oasysgui.widgetBox(tab_gen, "Autosave", addSpace=True, orientation="vertical", height=265)
 
         gui.comboBox(autosave_box, self, "autosave", label="Save automatically plot into file", labelWidth=250,
                                          items=["No", "Yes"],
                                          sendSelectedValue=False, orientation="horizontal", callback=self.set_autosave)
 
-        self.autosave_box_1 = oasysgui.widgetBox(autosave_box, "", addSpace=False, orientation="horizontal", height=25)
-        self.autosave_box_2 = oasysgui.widgetBox(autosave_box, "", addSpace=False, orientation="horizontal", height=25)
+        self.autosave_box_1 = oasysgui.widgetBox(autosave_box, "", addSpace=False, orientation="vertical", height=205)
+        self.autosave_box_2 = oasysgui.widgetBox(autosave_box, "", addSpace=False, orientation="vertical", height=205)
 
-        self.le_autosave_file_name = oasysgui.lineEdit(self.autosave_box_1, self, "autosave_file_name", "File Name", labelWidth=100,  valueType=str, orientation="horizontal")
+        file_box = oasysgui.widgetBox(self.autosave_box_1, "", addSpace=False, orientation="horizontal", height=25)
 
-        gui.button(self.autosave_box_1, self, "...", callback=self.select_autosave_file)
+        self.le_autosave_file_name = oasysgui.lineEdit(file_box, self, "autosave_file_name", "File Name", labelWidth=100,  valueType=str, orientation="horizontal")
 
-        incremental_box = oasysgui.widgetBox(tab_gen, "Incremental Result", addSpace=True, orientation="vertical", height=120)
+        gui.button(file_box, self, "...", callback=self.select_autosave_file)
+
+        oasysgui.lineEdit(self.autosave_box_1, self, "autosave_flush_interval", "Flush file every [s]", labelWidth=250, valueType=float, orientation="horizontal")
+        oasysgui.lineEdit(self.autosave_box_1, self, "autosave_flush_steps", "or every [steps]", labelWidth=250, valueType=int, orientation="horizontal")
+
+        gui.comboBox(self.autosave_box_1, self, "autosave_swmr", label="Live reading by other processes (SWMR)", labelWidth=250,
+                     items=["No", "Yes"], sendSelectedValue=False, orientation="horizontal")
+
+        gui.comboBox(self.autosave_box_1, self, "autosave_checkpoint", label="Save checkpoints for crash recovery", labelWidth=250,
+                     items=["No", "Yes"], sendSelectedValue=False, orientation="horizontal", callback=self.set_autosave)
+
+        self.checkpoint_box = oasysgui.widgetBox(self.autosave_box_1, "", addSpace=False, orientation="vertical", height=75)
+
+        oasysgui.lineEdit(self.checkpoint_box, self, "checkpoint_steps", "Checkpoint every [steps]", labelWidth=250, valueType=int, orientation="horizontal")
+        oasysgui.lineEdit(self.checkpoint_box, self, "checkpoint_interval", "or every [s]", labelWidth=250, valueType=float, orientation="horizontal")
+
+        gui.button(self.checkpoint_box, self, "Resume from Checkpoint", callback=self.load_checkpoint)
+
+        incremental_box = oasysgui.widgetBox(tab_gen, "Incremental Result", addSpace=True, orientation="vertical", height=145)
 
         gui.comboBox(incremental_box, self, "keep_result", label="Keep Result", labelWidth=250,
                      items=["No", "Yes"], sendSelectedValue=False, orientation="horizontal", callback=self.set_autosave)
@@ -104,6 +127,9 @@ class PowerPlotXY(AbstractPowerPlotXY):
         self.cb_autosave_partial_results = gui.comboBox(incremental_box, self, "autosave_partial_results", label="Save partial plots into file", labelWidth=250,
                                                         items=["No", "Yes"], sendSelectedValue=False, orientation="horizontal")
 
+        gui.comboBox(incremental_box, self, "background_calculation", label="Calculate in background", labelWidth=250,
+                     items=["No", "Yes"], sendSelectedValue=False, orientation="horizontal")
+
         gui.button(incremental_box, self, "Clear", callback=self.clear_results)
 
         self.set_autosave()
@@ -113,18 +139,16 @@ class PowerPlotXY(AbstractPowerPlotXY):
         else: proceed = ConfirmDialog.confirmed(parent=self)
 
         if proceed:
+            self._clear_accumulation()
+
             self.input_beam = None
-            self.cumulated_ticket = None
             self.plotted_ticket = None
             self.energy_min = None
             self.energy_max = None
             self.energy_step = None
             self.total_power = None
             self.cumulated_total_power = None
-
-            if not self.autosave_file is None:
-                self.autosave_file.close()
-                self.autosave_file = None
+            self.current_seed = None
 
             if not self.plot_canvas is None:
                 self.plot_canvas.clear()
@@ -134,11 +158,22 @@ class PowerPlotXY(AbstractPowerPlotXY):
         self.autosave_box_2.setVisible(self.autosave==0)
 
         self.cb_autosave_partial_results.setEnabled(self.autosave==1 and self.keep_result==1)
+        self.checkpoint_box.setVisible(self.autosave_checkpoint==1)
+        self.checkpoint_box.setEnabled(self.keep_result==1)
 
     def select_autosave_file(self):
         file_name = oasysgui.selectSaveFileFromDialog(self, "Select File", default_file_name="", file_extension_filter="HDF5 Files (*.hdf5 *.h5 *.hdf)")
         self.le_autosave_file_name.setText("" if file_name is None else file_name)
 
+    def _check_other_fields(self):
+        if self.autosave == 1:
+            congruence.checkPositiveNumber(self.autosave_flush_interval, "Flush file every [s]")
+            congruence.checkStrictlyPositiveNumber(self.autosave_flush_steps, "Flush file every [steps]")
+
+            if self.autosave_checkpoint == 1:
+                congruence.checkStrictlyPositiveNumber(self.checkpoint_steps, "Checkpoint every [steps]")
+                congruence.checkPositiveNumber(self.checkpoint_interval, "Checkpoint every [s]")
+
     #########################################################
     # I/O
 
@@ -152,6 +187,9 @@ class PowerPlotXY(AbstractPowerPlotXY):
 
             self.total_power = self.input_beam.scanned_variable_data.get_additional_parameter("total_power")
 
+            if self.input_beam.scanned_variable_data.has_additional_parameter("seed"):
+                self.current_seed = self.input_beam.scanned_variable_data.get_additional_parameter("seed")
+
             if self.cumulated_quantity == 1:  # Intensity
                 self.total_power /= (1e3 * self.energy_step * codata.e)  # to ph/s
 
@@ -173,102 +211,3 @@ class PowerPlotXY(AbstractPowerPlotXY):
             return True
         else:
             return False
-
-    #########################################################
-    # PLOTTING
-
-    def replace_fig(self, shadow_beam, var_x, var_y, xrange, yrange, nbins_h, nbins_v, nolost):
-        if self.plot_canvas is None:
-            self.plot_canvas = PowerPlotXYWidget()
-            self.image_box.layout().addWidget(self.plot_canvas)
-
-        try:
-            if self.autosave == 1:
-                if self.autosave_file is None:
-                    self.autosave_file = ShadowPlot.PlotXYHdf5File(congruence.checkDir(self.autosave_file_name))
-                elif self.autosave_file.filename != congruence.checkFileName(self.autosave_file_name):
-                    self.autosave_file.close()
-                    self.autosave_file = ShadowPlot.PlotXYHdf5File(congruence.checkDir(self.autosave_file_name))
-
-                self.autosave_file.add_attribute("current_step", self.current_step, dataset_name="additional_data")
-                self.autosave_file.add_attribute("total_steps", self.total_steps, dataset_name="additional_data")
-                self.autosave_file.add_attribute("last_energy_value", self.energy_max, dataset_name="additional_data")
-                self.autosave_file.add_attribute("last_power_value", self.total_power, dataset_name="additional_data")
-
-            if self.keep_result == 1:
-                self.cumulated_ticket, last_ticket = self.plot_canvas.plot_power_density(shadow_beam, var_x, var_y,
-                                                                                         self.total_power, self.cumulated_total_power,
-                                                                                         self.energy_min, self.energy_max, self.energy_step,
-                                                                                         nbins_h=nbins_h, nbins_v=nbins_v, xrange=xrange, yrange=yrange, nolost=nolost,
-                                                                                         ticket_to_add=self.cumulated_ticket,
-                                                                                         to_mm=self.workspace_units_to_mm,
-                                                                                         show_image=self.view_type==1,
-                                                                                         kind_of_calculation=self.kind_of_calculation,
-                                                                                         replace_poor_statistic=self.replace_poor_statistic,
-                                                                                         good_rays_limit=self.good_rays_limit,
-                                                                                         center_x=self.center_x,
-                                                                                         center_y=self.center_y,
-                                                                                         sigma_x=self.sigma_x,
-                                                                                         sigma_y=self.sigma_y,
-                                                                                         gamma=self.gamma,
-                                                                                         cumulated_quantity=self.cumulated_quantity)
-
-                if self.autosave == 1:
-                    self.autosave_file.add_attribute("last_plotted_power",  self.cumulated_ticket['plotted_power'],  dataset_name="additional_data")
-                    self.autosave_file.add_attribute("last_incident_power", self.cumulated_ticket['incident_power'], dataset_name="additional_data")
-                    self.autosave_file.add_attribute("last_total_power",    self.cumulated_ticket['total_power'],    dataset_name="additional_data")
-                    self.autosave_file.add_attribute("last_energy_min",     self.cumulated_ticket['energy_min'],     dataset_name="additional_data")
-                    self.autosave_file.add_attribute("last_energy_max",     self.cumulated_ticket['energy_max'],     dataset_name="additional_data")
-                    self.autosave_file.add_attribute("last_energy_step",    self.cumulated_ticket['energy_step'],    dataset_name="additional_data")
-
-                self.plotted_ticket          = self.cumulated_ticket
-                self.plotted_ticket_original = self.plotted_ticket.copy()
-
-                if self.autosave == 1:
-                    self.autosave_file.write_coordinates(self.cumulated_ticket)
-                    dataset_name = "power_density"
-
-                    self.autosave_file.add_plot_xy(self.cumulated_ticket, dataset_name=dataset_name)
-
-                    if self.autosave_partial_results == 1:
-                        if last_ticket is None:
-                            self.autosave_file.add_plot_xy(self.cumulated_ticket,
-                                                           plot_name="Energy Range: " + str(round(self.energy_max-self.energy_step, 2)) + "-" + str(round(self.energy_max, 2)),
-                                                           dataset_name=dataset_name)
-                        else:
-                            self.autosave_file.add_plot_xy(last_ticket,
-                                                           plot_name="Energy Range: " + str(round(self.energy_max-self.energy_step, 2)) + "-" + str(round(self.energy_max, 2)),
-                                                           dataset_name=dataset_name)
-
-                    self.autosave_file.flush()
-            else:
-                ticket, _ = self.plot_canvas.plot_power_density(shadow_beam, var_x, var_y,
-                                                                self.total_power, self.cumulated_total_power,
-                                                                self.energy_min, self.energy_max, self.energy_step,
-                                                                nbins_h=nbins_h, nbins_v=nbins_v, xrange=xrange, yrange=yrange, nolost=nolost,
-                                                                to_mm=self.workspace_units_to_mm,
-                                                                show_image=self.view_type==1,
-                                                                kind_of_calculation=self.kind_of_calculation,
-                                                                replace_poor_statistic=self.replace_poor_statistic,
-                                                                good_rays_limit=self.good_rays_limit,
-                                                                center_x=self.center_x,
-                                                                center_y=self.center_y,
-                                                                sigma_x=self.sigma_x,
-                                                                sigma_y=self.sigma_y,
-                                                                gamma=self.gamma,
-                                                                cumulated_quantity=self.cumulated_quantity)
-
-                self.cumulated_ticket = None
-                self.plotted_ticket = ticket
-                self.plotted_ticket_original = self.plotted_ticket.copy()
-
-                if self.autosave == 1:
-                    self.autosave_file.write_coordinates(ticket)
-                    self.autosave_file.add_plot_xy(ticket, dataset_name="power_density")
-                    self.autosave_file.flush()
-
-        except Exception as e:
-            if not self.IS_DEVELOP:
-                raise Exception("Data not plottable: " + str(e))
-            else:
-                raise e
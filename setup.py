@@ -116,7 +116,8 @@ ENTRY_POINTS = {
         "Shadow Advanced Optical Elements = orangecontrib.shadow_advanced_tools.widgets.optical_elements",
         "Shadow Thermal Load = orangecontrib.shadow_advanced_tools.widgets.thermal",
     ),
-    'oasys.menus': ("shadowadvancedtoolsmenu = orangecontrib.shadow_advanced_tools.menu",)
+    'oasys.menus': ("shadowadvancedtoolsmenu = orangecontrib.shadow_advanced_tools.menu",),
+    'console_scripts': ("shadow-power-loop = orangecontrib.shadow_advanced_tools.util.power_loop_runner:main",),
 }
 
 if __name__ == '__main__':